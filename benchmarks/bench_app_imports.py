@@ -0,0 +1,56 @@
+"""
+앱 시작 비용 벤치마크: 새 파이썬 프로세스에서 chatbot_app이 불러오는 백엔드 모듈의 import 시간과
+그 시점에 sklearn/numpy가 이미 올라와 있는지, 그리고 첫 군집화(여기서 sklearn을 처음 불러옴)에 걸린 시간을 봅니다.
+(Streamlit/Gemini SDK처럼 설치되지 않은 모듈은 건너뜀. 다른 벤치마크처럼 school_library.db가 있는 폴더에서 실행)
+
+    python benchmarks/bench_app_imports.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = ["tracing", "rate_limiter", "gemini_client", "kakao_client", "recommendation_engine", "library_db", "catalog_watcher"]
+
+CHILD_SCRIPT = """
+import importlib, json, sys, time
+sys.path.insert(0, {repo_dir!r})
+skipped = []
+started = time.perf_counter()
+for name in {modules!r}:
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        skipped.append(name)
+import_ms = (time.perf_counter() - started) * 1000
+heavy_loaded = sorted(name for name in ("sklearn", "numpy", "scipy") if name in sys.modules)
+from recommendation_engine import cluster_books_for_diversity
+docs = [{{"title": f"책 {{i}} 우주 과학", "contents": "별과 행성 이야기 " * (i % 5 + 1)}} for i in range(40)]
+started = time.perf_counter()
+cluster_books_for_diversity(docs, n_clusters=10)
+first_cluster_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{"import_ms": import_ms, "heavy_loaded": heavy_loaded, "first_cluster_ms": first_cluster_ms, "skipped": skipped}}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    script = CHILD_SCRIPT.format(repo_dir=REPO_DIR, modules=APP_MODULES)
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"백엔드 모듈 import: p50 {statistics.median(r['import_ms'] for r in results):,.1f} ms ({args.runs}회, 새 프로세스)")
+    print(f"import 직후 올라온 무거운 모듈: {', '.join(results[0]['heavy_loaded']) or '없음'}")
+    print(f"첫 군집화 (sklearn import + TF-IDF 준비 포함): p50 {statistics.median(r['first_cluster_ms'] for r in results):,.1f} ms")
+    if results[0]["skipped"]:
+        print(f"설치되지 않아 건너뛴 모듈: {', '.join(results[0]['skipped'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+다양성 선택 벤치마크: 기존 cluster_books_for_diversity의 이중 반복문(쌍마다 cosine_similarity)과
+diversity.select_diverse_indices(유사도 행렬 1회 + 누적 유사도 벡터)를 후보 100~1,000권에서 비교합니다.
+average 모드의 선택 결과가 기존과 같은지도 확인합니다.
+
+    python benchmarks/bench_diversity.py [--sizes 100,250,500,1000] [--k 10] [--repeat 3]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diversity import select_diverse_indices # noqa: E402
+
+WORDS = ["우주", "별", "행성", "블랙홀", "기후", "환경", "바다", "생태계", "역사", "조선", "전쟁", "평화", "수학", "확률",
+         "통계", "철학", "윤리", "인공지능", "로봇", "코딩", "경제", "돈", "시장", "미술", "음악", "소설", "시", "친구",
+         "학교", "성장", "과학", "실험", "의학", "몸", "뇌", "마음", "심리", "여행", "도시", "동물"]
+
+def synthetic_texts(count, seed=1):
+    """카카오 도서 후보의 '제목 + 소개'처럼 주제 단어가 섞인 짧은 문서들"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        topic = rng.sample(WORDS, 3)
+        words = [rng.choice(topic) if rng.random() < 0.6 else rng.choice(WORDS) for _ in range(rng.randint(15, 40))]
+        texts.append(" ".join(rng.sample(topic, 2)) + " " + " ".join(words))
+    return texts
+
+def legacy_select(tfidf_matrix, k):
+    """이전 cluster_books_for_diversity의 선택 반복문 (비교 기준)"""
+    selected_indices = [0]
+    for _ in range(1, min(k, tfidf_matrix.shape[0])):
+        best_avg_sim_score = float('inf')
+        current_best_idx = -1
+        for i in range(tfidf_matrix.shape[0]):
+            if i in selected_indices:
+                continue
+            avg_similarity_to_selected = sum(
+                cosine_similarity(tfidf_matrix[i], tfidf_matrix[j])[0][0] for j in selected_indices
+            ) / len(selected_indices)
+            if avg_similarity_to_selected < best_avg_sim_score:
+                best_avg_sim_score = avg_similarity_to_selected
+                current_best_idx = i
+        if current_best_idx == -1:
+            break
+        selected_indices.append(current_best_idx)
+    return selected_indices
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100,250,500,1000")
+    parser.add_argument("--k", type=int, default=10, help="고를 대표 수 (앱의 N_CLUSTERS_FOR_GEMINI)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(",") if size.strip()]:
+        texts = synthetic_texts(size)
+        tfidf_matrix = TfidfVectorizer(min_df=1).fit_transform(texts)
+        relevance = [random.Random(i).random() for i in range(size)]
+
+        legacy_picks = legacy_select(tfidf_matrix, args.k)
+        new_picks = select_diverse_indices(cosine_similarity(tfidf_matrix), args.k)
+        legacy_seconds = min(timeit.repeat(lambda: legacy_select(tfidf_matrix, args.k), number=1, repeat=args.repeat))
+        new_seconds = min(timeit.repeat(lambda: select_diverse_indices(cosine_similarity(tfidf_matrix), args.k), number=1, repeat=args.repeat))
+        mmr_seconds = min(timeit.repeat(lambda: select_diverse_indices(cosine_similarity(tfidf_matrix), args.k, mode="mmr", relevance_scores=relevance), number=1, repeat=args.repeat))
+        print(f"후보 {size:>5}권, 대표 {args.k}권 | 기존 {legacy_seconds * 1000:9.1f} ms | 새 방식(average) {new_seconds * 1000:7.2f} ms"
+              f" (x{legacy_seconds / new_seconds:,.0f}) | mmr {mmr_seconds * 1000:7.2f} ms | 선택 결과 동일: {legacy_picks == new_picks}")
+
+if __name__ == "__main__":
+    main()
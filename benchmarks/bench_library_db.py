@@ -0,0 +1,258 @@
+"""
+library_db 규모별 벤치마크: library_books.csv와 같은 모양의 합성 카탈로그(기본 2만/10만/100만 건)로
+CSV 적재 처리량, ISBN/제목·저자 조회 지연(p50/p95), 최대 메모리(peak RSS)를 재고 JSON으로 저장합니다.
+
+    python benchmarks/bench_library_db.py [--sizes 20000,100000,1000000] [--lookups 2000]
+                                          [--output bench_library_db.json] [--compare 이전결과.json]
+
+규모마다 별도 프로세스에서 실행하므로 peak RSS는 해당 규모만의 값입니다.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_SIZES = (20_000, 100_000, 1_000_000)
+CSV_FIELDS = ("title", "author", "publisher", "publication_year", "call_number", "isbn")
+
+# --- 합성 카탈로그 (실제 CSV 비율 참고: ISBN-13 약 78%, ISBN-10 약 18%, 빈 ISBN 약 3%, 복본 약 15%) ---
+TITLE_WORDS = ["바람", "별", "마음", "여행", "도시", "소년", "소녀", "시간", "꿈", "과학", "역사", "이야기", "세계",
+               "비밀", "숲", "바다", "우주", "친구", "학교", "수학", "철학", "미술관", "고양이", "편지", "여름", "겨울",
+               "기억", "사랑", "전쟁", "평화", "미래", "로봇", "기후", "경제", "음악", "섬", "정원", "빛", "그림자", "길"]
+TITLE_PARTICLES = ["의", "와", "과", "에서", "을 위한", "", "", ""]
+SYLLABLES = "가나다라마바사아자차카타파하고노도로모보소오조초코토포호구누두루무부수우주추쿠투푸후기니디리미비시이지치키티피히한민서윤준현지수연"
+SURNAMES = "김이박최정강조윤장임한오서신권황안송류홍"
+AUTHOR_ROLES = ["옮김", "그림", "엮음", "감수"]
+PUBLISHERS = ["창비", "문학동네", "민음사", "시공사", "위즈덤하우스", "김영사", "비룡소", "사계절", "다산북스",
+              "웅진씽크빅", "문학과지성사", "열린책들", "한빛미디어", "길벗", "휴머니스트", "돌베개"]
+KDC_CLASSES = [(813, 6), (813, 7), (843, 0), (833, 6), (911, 0), (400, 0), (500, 0), (330, 0), (181, 0), (700, 0), (4, 0)]
+
+def _isbn13_check_digit(first12):
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+def _isbn10_check_digit(first9):
+    total = sum(int(d) * (10 - i) for i, d in enumerate(first9))
+    check = (11 - total % 11) % 11
+    return "X" if check == 10 else str(check)
+
+def random_isbn(rng):
+    """ISBN-13/ISBN-10/빈 값을 실제 CSV와 비슷한 비율로 생성"""
+    roll = rng.random()
+    if roll < 0.03:
+        return ""
+    if roll < 0.21: # ISBN-10 (국내 89 접두)
+        first9 = "89" + "".join(rng.choice("0123456789") for _ in range(7))
+        return first9 + _isbn10_check_digit(first9)
+    first12 = rng.choice(("978", "979")) + "".join(rng.choice("0123456789") for _ in range(9))
+    return first12 + _isbn13_check_digit(first12)
+
+def random_person(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choice(SYLLABLES) for _ in range(2))
+
+def random_title(rng):
+    words = []
+    for _ in range(rng.randint(1, 3)):
+        word = rng.choice(TITLE_WORDS) if rng.random() < 0.7 else "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+        words.append(word + rng.choice(TITLE_PARTICLES))
+    title = " ".join(words)
+    if rng.random() < 0.15:
+        title += ": " + rng.choice(TITLE_WORDS) + " " + rng.choice(TITLE_WORDS)
+    return title
+
+def generate_catalog_rows(row_count, seed=42):
+    """library_books.csv와 같은 열 구성의 합성 행(dict)을 row_count개 생성 (복본은 같은 ISBN, c.2 청구기호)"""
+    rng = random.Random(seed)
+    rows = []
+    while len(rows) < row_count:
+        author = f"{random_person(rng)} 지음"
+        if rng.random() < 0.35:
+            author += f";{random_person(rng)} {rng.choice(AUTHOR_ROLES)}"
+        title = random_title(rng)
+        kdc, decimal = rng.choice(KDC_CLASSES)
+        call_number = f"{kdc:03d}" + (f".{decimal}" if decimal else "") + f" {author[0]}{rng.randint(1, 999)}{title[0]}"
+        volumes = [None] if rng.random() < 0.9 else [1, 2, 3][:rng.randint(2, 3)]
+        for volume in volumes:
+            book = {
+                "title": title + (f". {volume}" if volume else ""),
+                "author": author,
+                "publisher": rng.choice(PUBLISHERS),
+                "publication_year": str(rng.randint(1985, 2025)),
+                "call_number": call_number + (f" v.{volume}" if volume else ""),
+                "isbn": random_isbn(rng),
+            }
+            rows.append(book)
+            if rng.random() < 0.15: # 복본
+                rows.append(dict(book, call_number=book["call_number"] + " c.2"))
+    return rows[:row_count]
+
+def write_catalog_csv(rows, csv_path):
+    with open(csv_path, mode="w", encoding="utf-8-sig", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+# --- 측정 ---
+def peak_rss_mb():
+    """지금까지의 최대 RSS (Linux는 KB, macOS는 바이트 단위로 보고됨)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def time_calls(function, arguments):
+    """각 호출의 지연(ms)을 재서 count/p50/p95/p99/mean 반환"""
+    durations = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return {
+        "count": len(durations),
+        "p50_ms": round(percentile(durations, 0.50), 4),
+        "p95_ms": round(percentile(durations, 0.95), 4),
+        "p99_ms": round(percentile(durations, 0.99), 4),
+        "mean_ms": round(sum(durations) / len(durations), 4),
+    }
+
+def build_queries(rows, lookup_count, seed=7):
+    """소장 ISBN(절반은 10/13 다른 버전으로), 없는 ISBN, 소장 제목/저자(검색어처럼 일부만), 없는 제목 질의"""
+    import library_db
+    rng = random.Random(seed)
+    with_isbn = [row for row in rows if row["isbn"]]
+    isbn_hits = []
+    for row in rng.sample(with_isbn, min(lookup_count, len(with_isbn))):
+        versions = sorted(library_db.all_isbn_versions(row["isbn"]))
+        isbn_hits.append((rng.choice(versions),))
+    isbn_misses = [(random_isbn(rng) or "9790000000000",) for _ in range(lookup_count)]
+    title_hits = []
+    for row in rng.sample(rows, min(lookup_count, len(rows))):
+        title = row["title"].split(":")[0].strip() # 카카오 검색 결과처럼 부제 없이
+        title_hits.append((title, row["author"].split(";")[0].replace(" 지음", "")))
+    title_misses = [(f"없는책 {random_title(rng)} {i}", random_person(rng)) for i in range(lookup_count)]
+    return {"isbn_hit": isbn_hits, "isbn_miss": isbn_misses, "title_author_hit": title_hits, "title_author_miss": title_misses}
+
+def run_one(row_count, lookup_count, work_dir, seed):
+    """한 규모에 대한 측정 (벤치마크 하위 프로세스에서 실행)"""
+    import library_db
+    result = {"rows": row_count}
+    csv_path = os.path.join(work_dir, f"catalog_{row_count}.csv")
+    library_db.DB_PATH = os.path.join(work_dir, f"catalog_{row_count}.db")
+
+    start = time.perf_counter()
+    rows = generate_catalog_rows(row_count, seed)
+    write_catalog_csv(rows, csv_path)
+    result["generate_seconds"] = round(time.perf_counter() - start, 3)
+    result["csv_bytes"] = os.path.getsize(csv_path)
+
+    library_db.create_library_table()
+    start = time.perf_counter()
+    library_db.load_csv_to_library_db(csv_path) # 적재 + 카탈로그 색인 교체까지
+    seconds = time.perf_counter() - start
+    result["ingest_seconds"] = round(seconds, 3)
+    result["ingest_rows_per_second"] = round(row_count / seconds)
+    result["db_bytes"] = os.path.getsize(library_db.DB_PATH)
+
+    start = time.perf_counter()
+    library_db.sync_csv_to_library_db(csv_path, force=True) # 변경 없는 전체 비교
+    seconds = time.perf_counter() - start
+    result["sync_unchanged_seconds"] = round(seconds, 3)
+    result["sync_rows_per_second"] = round(row_count / seconds)
+
+    start = time.perf_counter()
+    library_db.refresh_catalog() # ISBN 조회용 mmap 스냅샷도 여기서 버전에 맞게 다시 씀
+    result["catalog_build_seconds"] = round(time.perf_counter() - start, 3)
+
+    queries = build_queries(rows, lookup_count)
+    library_db.find_book_in_library_by_isbn(queries["isbn_hit"][0][0]) # 연결/색인 준비는 측정에서 제외
+    result["lookups"] = {
+        "isbn_hit": time_calls(library_db.find_book_in_library_by_isbn, queries["isbn_hit"]),
+        "isbn_miss": time_calls(library_db.find_book_in_library_by_isbn, queries["isbn_miss"]),
+        "title_author_hit": time_calls(library_db.find_book_in_library_by_title_author, queries["title_author_hit"]),
+        "title_author_miss": time_calls(library_db.find_book_in_library_by_title_author, queries["title_author_miss"]),
+    }
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_result(result, previous=None):
+    line = (f"{result['rows']:>9,}건 | 적재 {result['ingest_rows_per_second']:>8,}행/s"
+            f" | 동기화 {result['sync_rows_per_second']:>8,}행/s | peak RSS {result['peak_rss_mb']:>7.1f} MB")
+    print(line)
+    for name, stats in result["lookups"].items():
+        text = f"    {name:<18} p50 {stats['p50_ms']:8.3f} ms  p95 {stats['p95_ms']:8.3f} ms"
+        old_stats = (previous or {}).get("lookups", {}).get(name)
+        if old_stats:
+            text += f"  (이전 대비 p50 x{stats['p50_ms'] / max(old_stats['p50_ms'], 1e-9):.2f}, p95 x{stats['p95_ms'] / max(old_stats['p95_ms'], 1e-9):.2f})"
+        print(text)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="쉼표로 구분한 행 수 목록")
+    parser.add_argument("--lookups", type=int, default=2000, help="질의 종류별 조회 횟수")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", help="합성 CSV/DB를 둘 폴더 (기본: 임시 폴더, 끝나면 삭제)")
+    parser.add_argument("--output", default="bench_library_db.json", help="결과 JSON 경로")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS) # 내부용: 한 규모만 측정해 JSON 출력
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.lookups, args.work_dir, args.seed)))
+        return
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            previous = {result["rows"]: result for result in json.load(file)["results"]}
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = {
+        "benchmark": "library_db",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "settings": {"lookups": args.lookups, "seed": args.seed},
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_library_db_") as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        for size in sizes:
+            command = [sys.executable, os.path.abspath(__file__), "--run-one", str(size), "--lookups", str(args.lookups),
+                       "--seed", str(args.seed), "--work-dir", work_dir]
+            completed = subprocess.run(command, capture_output=True, text=True, check=True)
+            result = json.loads(completed.stdout.strip().splitlines()[-1]) # 앞줄은 library_db의 진행 메시지
+            report["results"].append(result)
+            print_result(result, previous.get(size))
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"결과 저장: {args.output}")
+
+if __name__ == "__main__":
+    main()
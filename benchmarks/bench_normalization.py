@@ -0,0 +1,71 @@
+"""
+텍스트 정규화 마이크로 벤치마크: 기존 str.replace 연쇄 방식과 text_normalizer(translate 표 + LRU 캐시)를 비교합니다.
+
+    python benchmarks/bench_normalization.py [--csv library_books.csv] [--repeat 5]
+"""
+import argparse
+import csv
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import text_normalizer # noqa: E402
+
+def legacy_normalize_text_for_matching(text_str):
+    """이전 library_db.normalize_text_for_matching (비교 기준)"""
+    if not isinstance(text_str, str):
+        return ""
+    processed_text = text_str.lower()
+    for char_to_remove in [" ", "-", ":", ",", ".", "'", '"', "[", "]", "(", ")", "/", "\\", "&", "#", "+", "_", "~", "!", "?", "*"]:
+        processed_text = processed_text.replace(char_to_remove, "")
+    return processed_text
+
+def legacy_normalize_publisher_name(name):
+    """이전 chatbot_app.normalize_publisher_name (비교 기준)"""
+    if not isinstance(name, str): name = ""
+    name_lower = name.lower()
+    name_processed = name_lower.replace("(주)", "").replace("주식회사", "").replace("㈜", "")
+    name_processed = name_processed.replace(" ", "").replace("-", "").replace("(", "").replace(")", "").replace(",", "")
+    if "알에이치코리아" in name_processed or "랜덤하우스코리아" in name_processed: return "알에이치코리아"
+    if "문학과지성" in name_processed : return "문학과지성사"
+    if "창작과비평" in name_processed : return "창작과비평사"
+    if "김영사" in name_processed : return "김영사"
+    if "위즈덤하우스" in name_processed : return "위즈덤하우스"
+    return name_processed
+
+def load_samples(csv_path):
+    with open(csv_path, mode='r', encoding='utf-8-sig') as file:
+        rows = list(csv.DictReader(file))
+    texts = [row.get('title', '') for row in rows] + [row.get('author', '') for row in rows]
+    publishers = [row.get('publisher', '') for row in rows]
+    return texts, publishers
+
+def best_of(statement, repeat):
+    return min(timeit.repeat(statement, number=1, repeat=repeat))
+
+def main():
+    default_csv = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "library_books.csv")
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=default_csv)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    texts, publishers = load_samples(args.csv)
+    same_text = sum(legacy_normalize_text_for_matching(t) == text_normalizer.normalize_text_for_matching(t) for t in texts)
+    same_publisher = sum(legacy_normalize_publisher_name(p) == text_normalizer.normalize_publisher_name(p) for p in publishers)
+    print(f"샘플: 제목/저자 {len(texts)}개, 출판사 {len(publishers)}개 (고유 출판사 {len(set(publishers))}개)")
+    print(f"기존 결과와 동일: 제목/저자 {same_text}/{len(texts)}, 출판사 {same_publisher}/{len(publishers)} (차이는 NFKC 정규화 때문)")
+
+    results = [
+        ("제목/저자 (기존 replace 연쇄)", best_of(lambda: [legacy_normalize_text_for_matching(t) for t in texts], args.repeat), len(texts)),
+        ("제목/저자 (translate, 한 건씩)", best_of(lambda: [text_normalizer.normalize_text_for_matching(t) for t in texts], args.repeat), len(texts)),
+        ("제목/저자 (translate, 일괄 API)", best_of(lambda: text_normalizer.normalize_texts_for_matching(texts), args.repeat), len(texts)),
+        ("출판사 (기존 replace 연쇄)", best_of(lambda: [legacy_normalize_publisher_name(p) for p in publishers], args.repeat), len(publishers)),
+        ("출판사 (translate + LRU 캐시)", best_of(lambda: text_normalizer.normalize_publisher_names(publishers), args.repeat), len(publishers)),
+    ]
+    for label, seconds, count in results:
+        print(f"{label:<32} {seconds * 1000:8.2f} ms  ({seconds / count * 1e6:.2f} us/건)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+추천 파이프라인 벤치마크: recommendation_engine.RecommendationEngine을 가짜 Gemini/카카오 클라이언트(고정 응답, 지연 설정 가능)와
+실제 학교 도서관 DB로 여러 번 실행해 단계별 걸린 시간(p50/p95)과 항목 수, 클라이언트 호출 수를 보여줍니다.
+외부 API를 부르지 않으므로 로컬 단계(필터, BM25, TF-IDF 다양성, 소장 확인)의 비용을 따로 볼 수 있습니다.
+
+    python benchmarks/bench_recommendation_engine.py [--runs 20] [--gemini-latency 0] [--kakao-latency 0]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from book_vectorizer import prepare_book_vectorizer # noqa: E402
+from recommendation_engine import RecommendationEngine, make_student_data # noqa: E402
+
+TOPIC_WORDS = ["우주", "별", "기후", "환경", "역사", "조선", "수학", "철학", "인공지능", "로봇", "경제", "미술", "음악", "과학", "마음"]
+PUBLISHERS = ["창비", "문학동네", "민음사", "김영사", "비룡소", "사계절", "다산북스", "휴머니스트"]
+
+class FakeGemini:
+    """검색어 생성/최종 선정/조언에 고정된 모양의 응답 (latency초 뒤)"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def reserve(self, count):
+        return contextlib.nullcontext(SimpleNamespace(estimated_wait_seconds=0))
+
+    def generate(self, prompt, temperature, stream=False):
+        time.sleep(self.latency)
+        if "BOOKS_JSON_START" in prompt: # 최종 선정
+            books = [{"title": f"추천 도서 {i}", "author": "작가", "publisher": "창비", "year": "2023년", "isbn": "", "reason": "좋아요"} for i in range(3)]
+            text = "도도의 추천이에요!\nBOOKS_JSON_START\n" + json.dumps(books, ensure_ascii=False, indent=2) + "\nBOOKS_JSON_END\n즐거운 독서!"
+            return iter([text[i:i + 40] for i in range(0, len(text), 40)]) if stream else text
+        if "검색 키워드" in prompt:
+            return "\n".join(random.Random(prompt).sample(TOPIC_WORDS, 4))
+        return "다른 검색어로 찾아보세요."
+
+class FakeKakao:
+    """검색어·페이지마다 size권의 합성 문서 (요청마다 latency초)"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def iter_pages(self, queries, size, max_pages, on_query_done=None, errors=None):
+        for page in range(1, max_pages + 1):
+            for done, query in enumerate(queries, start=1):
+                time.sleep(self.latency)
+                if on_query_done:
+                    on_query_done(page, done, len(queries))
+            for query_index, query in enumerate(queries):
+                rng = random.Random(f"{query}-{page}")
+                for i in range(size):
+                    words = rng.sample(TOPIC_WORDS, 3)
+                    yield {
+                        "title": f"{query} {words[0]} 이야기 {page}-{i}",
+                        "contents": " ".join(rng.choice(words + ["청소년", "탐구"]) for _ in range(60)),
+                        "publisher": rng.choice(PUBLISHERS), "authors": ["작가"],
+                        "datetime": f"{rng.randint(2010, 2025)}-01-01T00:00:00.000+09:00",
+                        "cleaned_isbn": f"979{query_index:02d}{page:02d}{i:03d}{rng.randint(0, 999):03d}",
+                    }
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="가짜 Gemini 응답 지연(초)")
+    parser.add_argument("--kakao-latency", type=float, default=0.0, help="가짜 카카오 요청당 지연(초)")
+    args = parser.parse_args()
+
+    prepare_book_vectorizer() # 앱에서는 첫 군집화가 백그라운드로 시작하는 TF-IDF 학습을 미리 끝내 둠 (측정에서 학습 제외)
+    engine = RecommendationEngine(FakeGemini(args.gemini_latency), FakeKakao(args.kakao_latency))
+    stage_seconds, stage_items, stage_calls, totals = {}, {}, {}, []
+    for run in range(args.runs + 1):
+        topic = TOPIC_WORDS[run % len(TOPIC_WORDS)]
+        result = engine.recommend(make_student_data("보통", topic, "중학생 (14-16세)", genres=["과학"]))
+        if run == 0: # 첫 실행은 색인/벡터라이저 준비 비용이 섞이므로 따로 표시
+            print(f"첫 실행 {result.total_seconds * 1000:,.1f} ms (카탈로그 색인 준비 포함), 상태: {result.status}")
+            continue
+        totals.append(result.total_seconds)
+        for stage in result.stages:
+            stage_seconds.setdefault(stage.name, []).append(stage.seconds)
+            stage_items[stage.name] = (stage.items_in, stage.items_out)
+            stage_calls[stage.name] = stage.api_calls
+
+    print(f"{'단계':<16}{'p50(ms)':>10}{'p95(ms)':>10}   항목(in→out)   호출")
+    for name, seconds in stage_seconds.items():
+        items_in, items_out = stage_items[name]
+        print(f"{name:<16}{percentile(seconds, 0.5) * 1000:>10.2f}{percentile(seconds, 0.95) * 1000:>10.2f}"
+              f"   {items_in:>4} → {items_out:<4}     {stage_calls[name] or '-'}")
+    if totals:
+        print(f"{'전체':<16}{statistics.median(totals) * 1000:>10.2f}{percentile(totals, 0.95) * 1000:>10.2f}   ({len(totals)}회)")
+
+if __name__ == "__main__":
+    main()
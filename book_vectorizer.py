@@ -0,0 +1,140 @@
+import os
+import pickle
+import tempfile
+import threading
+
+# 추천 후보의 "제목 + 소개" 문장을 TF-IDF 벡터로 바꾸는 프로세스 공용 벡터라이저.
+# 매 추천마다 후보 수십 권으로 새로 fit하지 않고, 학교 소장 도서 전체와 캐시된 카카오 소개글로 한 번만 학습해
+# transform만 합니다. (매번 같은 어휘/IDF를 쓰므로 같은 책 쌍의 유사도가 실행마다 달라지지 않음)
+# 한국어는 띄어쓰기와 조사가 제각각이라 단어 대신 단어 경계 안의 글자 2~3-gram(char_wb)을 씁니다.
+# 학습한 벡터라이저는 카탈로그 버전과 함께 DB 옆 파일(school_library.tfidf)에 저장해 두고, 버전이 바뀌거나 파일을 지우면 다시 학습합니다.
+# 학습(수 초)은 추천 도중이 아니라 백그라운드 스레드(prepare_book_vectorizer_in_background)에서 하고,
+# 준비되기 전이거나 카탈로그가 바뀌어 다시 학습하는 동안의 추천은 이전 벡터라이저 또는 후보들로 바로 fit하는 방식을 씁니다.
+# sklearn은 처음 학습/변환할 때 불러옵니다 (이 모듈을 import하는 것만으로는 불러오지 않음).
+
+VECTORIZER_SETTINGS = {"analyzer": "char_wb", "ngram_range": (2, 3), "min_df": 2, "sublinear_tf": True, "max_features": 200_000}
+KAKAO_DOCUMENTS_FOR_FIT = 5000 # 학습에 더할 최근 카카오 검색 결과 문서 수
+
+_vectorizer = None
+_vectorizer_version = None # _vectorizer를 학습한 카탈로그 버전
+_vectorizer_lock = threading.Lock() # 학습/읽기는 한 번에 하나만
+_preparing = False # 백그라운드 준비 스레드가 도는 중인지
+_preparing_lock = threading.Lock()
+
+def vectorizer_path():
+    import library_db
+    return os.path.splitext(library_db.DB_PATH)[0] + ".tfidf"
+
+def book_text(doc):
+    """후보 문서(카카오/소장 도서)에서 벡터화할 텍스트"""
+    return (doc.get('title', '') or '') + ' ' + (doc.get('contents', '') or doc.get('description', '') or '')
+
+def _training_texts():
+    """소장 도서의 제목/저자/설명 + 캐시된 카카오 검색 결과의 제목/소개"""
+    texts = []
+    try:
+        import library_db
+        rows = library_db.get_read_connection().execute("SELECT title, author, description FROM books").fetchall()
+        texts.extend(" ".join(value for value in row if value) for row in rows)
+    except Exception as e: # 도서관 DB가 없어도 카카오 캐시만으로 학습
+        print(f"🚨 TF-IDF 학습용 소장 도서 읽기 오류: {e}")
+    try:
+        from kakao_client import iter_cached_kakao_documents
+        texts.extend(book_text(doc) for doc in iter_cached_kakao_documents(KAKAO_DOCUMENTS_FOR_FIT))
+    except Exception as e:
+        print(f"🚨 TF-IDF 학습용 카카오 캐시 읽기 오류: {e}")
+    return [text for text in texts if text.strip()]
+
+def _catalog_version():
+    """현재(고정된) 카탈로그 버전. 도서관 DB를 쓸 수 없으면 None"""
+    try:
+        import library_db
+        return library_db.get_catalog().version
+    except Exception:
+        return None
+
+def fit_book_vectorizer(save=True, catalog_version=None):
+    """학습 데이터로 새로 fit해 (카탈로그 버전과 함께) 저장합니다. 학습할 텍스트가 부족하면 None"""
+    texts = _training_texts()
+    if len(texts) < VECTORIZER_SETTINGS["min_df"]:
+        return None
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    vectorizer = TfidfVectorizer(**VECTORIZER_SETTINGS).fit(texts)
+    if save:
+        path = vectorizer_path()
+        temp_path = None
+        try: # 프로세스마다 고유한 임시 파일에 써서 동시에 저장해도 서로 덮어쓰지 않도록
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump({"settings": VECTORIZER_SETTINGS, "catalog_version": catalog_version, "vectorizer": vectorizer},
+                            file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"🚨 TF-IDF 벡터라이저 저장 실패: {e}")
+            if temp_path:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+    return vectorizer
+
+def _load_saved_vectorizer(catalog_version):
+    try:
+        with open(vectorizer_path(), "rb") as file:
+            saved = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(saved, dict) or saved.get("settings") != VECTORIZER_SETTINGS: # 설정이 바뀌었으면 다시 학습
+        return None
+    if saved.get("catalog_version") != catalog_version: # 카탈로그가 다시 적재/동기화됐으면 다시 학습
+        return None
+    return saved.get("vectorizer")
+
+def prepare_book_vectorizer():
+    """현재 카탈로그 버전의 공용 벡터라이저를 준비 (저장 파일 -> 없으면 학습). 수 초 걸릴 수 있으므로 백그라운드에서 호출"""
+    global _vectorizer, _vectorizer_version
+    catalog_version = _catalog_version()
+    with _vectorizer_lock:
+        if _vectorizer is None or _vectorizer_version != catalog_version:
+            vectorizer = _load_saved_vectorizer(catalog_version) or fit_book_vectorizer(catalog_version=catalog_version)
+            if vectorizer is not None:
+                _vectorizer, _vectorizer_version = vectorizer, catalog_version
+        return _vectorizer
+
+def prepare_book_vectorizer_in_background():
+    """prepare_book_vectorizer를 데몬 스레드에서 실행 (이미 준비 중이면 아무것도 하지 않음)"""
+    global _preparing
+    with _preparing_lock:
+        if _preparing:
+            return
+        _preparing = True
+
+    def prepare():
+        global _preparing
+        try:
+            prepare_book_vectorizer()
+        except Exception as e: # 실패해도 다음 요청에서 다시 시도
+            print(f"🚨 TF-IDF 벡터라이저 준비 오류: {e}")
+        finally:
+            with _preparing_lock:
+                _preparing = False
+
+    threading.Thread(target=prepare, name="book-vectorizer", daemon=True).start()
+
+def get_book_vectorizer():
+    """
+    준비된 프로세스 공용 벡터라이저 (추천 중에는 학습을 기다리지 않음).
+    아직 없거나 카탈로그 버전이 바뀌었으면 백그라운드 준비를 시작하고, 그동안은 이전 벡터라이저(없으면 None)를 반환
+    """
+    if _vectorizer is None or _vectorizer_version != _catalog_version():
+        prepare_book_vectorizer_in_background()
+    return _vectorizer
+
+def transform_book_docs(book_docs):
+    """후보 문서들의 TF-IDF 행렬 (행마다 L2 정규화). 공용 벡터라이저가 없으면 후보들로 바로 fit (기존 방식)"""
+    texts = [book_text(doc) for doc in book_docs]
+    vectorizer = get_book_vectorizer()
+    if vectorizer is None:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        return TfidfVectorizer(**dict(VECTORIZER_SETTINGS, min_df=1)).fit_transform(texts)
+    return vectorizer.transform(texts)
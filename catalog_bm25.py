@@ -0,0 +1,110 @@
+import math
+import os
+import pickle
+import re
+import tempfile
+from array import array
+from collections import defaultdict
+
+from text_normalizer import normalize_text_for_matching
+
+# 학교 소장 도서(books 테이블)에 대한 BM25 검색 색인.
+# 카카오 결과에 우연히 같은 책이 나올 때만 소장 도서가 후보에 들어가던 것을 보완해,
+# Gemini가 만든 검색어로 소장 도서를 바로(수 ms) 찾습니다. 카카오가 느리거나 한도가 바닥나도 동작합니다.
+# 토큰: 띄어쓰기 단위 단어 + 두 글자 이상 한글 단어의 음절 bigram (한국어는 띄어쓰기가 제각각이라 bigram이 잘 맞음)
+# 두 글자 단어("기후", "해리")도 bigram으로 내야 "기후변화", "해리포터" 같은 붙여 쓴 제목 안에서 맞습니다.
+# 필드별 가중치를 단어 빈도에 곱해 하나의 문서로 점수를 매깁니다 (제목 > 저자 > 설명 > 출판사).
+# 색인은 카탈로그 버전별로 DB 옆 파일(school_library.bm25)에 저장해 두고, 다음 실행에서는 읽기만 합니다.
+
+FORMAT_VERSION = 2 # 토큰 규칙이 바뀌면 올려서 저장된 색인을 다시 만듦
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"title": 3.0, "author": 1.5, "description": 1.0, "publisher": 0.5}
+WORD_PATTERN = re.compile(r"\w+")
+HANGUL_PATTERN = re.compile(r"[가-힣]")
+
+def tokenize(text):
+    """검색/색인 공용 토큰: 정규화한 단어 + 한글 단어의 음절 bigram"""
+    tokens = []
+    for word in WORD_PATTERN.findall(text.lower() if isinstance(text, str) else ""):
+        word = normalize_text_for_matching(word)
+        if not word:
+            continue
+        if len(word) < 2 or not HANGUL_PATTERN.search(word):
+            tokens.append(word)
+            continue
+        if len(word) > 2: # 두 글자 단어는 bigram 하나가 곧 단어이므로 단어 토큰을 따로 더하지 않음 (붙여 쓴 제목과 같은 점수)
+            tokens.append(word)
+        tokens.extend("#" + word[i:i + 2] for i in range(len(word) - 1)) # 단어 토큰과 겹치지 않도록 접두어
+    return tokens
+
+class CatalogBM25Index:
+    """(payload, {필드: 텍스트}) 목록으로 만든 BM25 역색인. search()는 점수 상위 top_k를 반환"""
+
+    def __init__(self, entries=(), catalog_version=0):
+        self.catalog_version = catalog_version
+        self.payloads = []
+        self.doc_lengths = array("f")
+        postings = defaultdict(dict)
+        for doc_id, (payload, fields) in enumerate(entries):
+            self.payloads.append(payload)
+            weights = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(fields.get(field) or ""):
+                    weights[token] += weight
+            self.doc_lengths.append(sum(weights.values()))
+            for token, weight in weights.items():
+                postings[token][doc_id] = weight
+        self.average_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        self.postings = {token: (array("I", doc_weights.keys()), array("f", doc_weights.values()))
+                         for token, doc_weights in postings.items()}
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def search(self, query_text, top_k=20):
+        """BM25 점수 내림차순 [(점수, payload), ...] (같은 점수면 먼저 색인된 항목 우선)"""
+        doc_count = len(self.payloads)
+        if not doc_count:
+            return []
+        scores = defaultdict(float)
+        for token in set(tokenize(query_text)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            doc_ids, weights = posting
+            idf = math.log(1 + (doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            for doc_id, weight in zip(doc_ids, weights):
+                length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.average_length)
+                scores[doc_id] += idf * weight * (BM25_K1 + 1) / (weight + length_norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(score, self.payloads[doc_id]) for doc_id, score in best]
+
+    def save(self, path):
+        """고유한 임시 파일에 쓴 뒤 교체 (다른 프로세스가 읽거나 동시에 저장하는 중이어도 안전)"""
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump({"format_version": FORMAT_VERSION, "index": self}, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path, catalog_version):
+        """저장된 색인이 있고 형식/카탈로그 버전이 같으면 반환, 아니면 None"""
+        try:
+            with open(path, "rb") as file:
+                saved = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if not isinstance(saved, dict) or saved.get("format_version") != FORMAT_VERSION:
+            return None
+        index = saved.get("index")
+        if not isinstance(index, cls) or index.catalog_version != catalog_version:
+            return None
+        return index
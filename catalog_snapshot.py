@@ -0,0 +1,138 @@
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+
+# 도서관 books 테이블을 mmap으로 바로 읽을 수 있는 압축 스냅샷 파일로 저장/조회합니다.
+# 여러 Streamlit 워커 프로세스가 같은 파일을 mmap하면 OS가 같은 페이지를 공유하므로,
+# 프로세스마다 행별 dict를 들고 있지 않아도 ISBN 조회를 할 수 있습니다.
+#
+# 파일 구조 (리틀 엔디언, 각 구역은 8바이트 정렬)
+#   헤더    : MAGIC(8) + HEADER_FORMAT (형식 버전, 행 수, 키 수, 필드 수, 카탈로그 버전, 각 구역 시작 위치)
+#   keys    : int64[키 수]   - 정렬된 ISBN 키 (행 ISBN의 10/13자리 모든 버전, _isbn_key 참고)
+#   key_rows: uint32[키 수]  - 각 키가 가리키는 행 번호 (같은 키면 테이블 순서대로)
+#   offsets : uint64[행 수 x 필드 수 + 1] - blob 안에서 각 필드 문자열의 시작 위치
+#   blob    : 모든 필드 문자열을 이어 붙인 UTF-8 바이트 (NULL은 UTF-8에 나올 수 없는 NULL_MARKER 한 바이트)
+
+MAGIC = b"DODOCAT\0"
+FORMAT_VERSION = 4 # 3: NULL을 빈 문자열 대신 NULL_MARKER로 저장, 4: ISBN-13 하나 대신 10/13자리 모든 버전을 키로 저장
+HEADER_FORMAT = "<IIIIQQQQQ"
+HEADER_SIZE = len(MAGIC) + struct.calcsize(HEADER_FORMAT)
+NULL_MARKER = b"\xff" # DB의 NULL (SQL 조회처럼 None으로 돌려주기 위해 빈 문자열과 구분)
+
+def _align8(position):
+    return (position + 7) & ~7
+
+ISBN10_KEY_OFFSET = 10 ** 13 # ISBN-10 키는 13자리 숫자 키(< 10^13)와 겹치지 않도록 이 값 위에 둠
+
+def _isbn_key(version):
+    """
+    정리된 ISBN 버전 하나 -> 정수 키 (형식이 맞지 않으면 None)
+    13자리는 숫자 그대로, 10자리는 앞 9자리 x 11 + 검사 자리(X는 10)에 ISBN10_KEY_OFFSET을 더함
+    """
+    if len(version) == 13 and version.isdigit():
+        return int(version)
+    if len(version) == 10 and version[:9].isdigit() and (version[9].isdigit() or version[9] == "X"):
+        return ISBN10_KEY_OFFSET + int(version[:9]) * 11 + (10 if version[9] == "X" else int(version[9]))
+    return None
+
+def _isbn_keys(isbn, all_isbn_versions):
+    """ISBN 문자열의 10/13자리 모든 버전(정리한 원래 값 포함)의 키 집합. 검사 자리가 틀린 ISBN도 원래 값으로 찾을 수 있음"""
+    return {key for key in map(_isbn_key, all_isbn_versions(isbn)) if key is not None}
+
+def write_snapshot(rows, fields, snapshot_path, all_isbn_versions, catalog_version=0):
+    """
+    (테이블 순서대로 정렬된) 행 튜플 목록을 스냅샷 파일로 저장합니다.
+    fields의 첫 번째 필드는 isbn이어야 하고, catalog_version은 이 행들을 읽은 DB의 카탈로그 버전입니다.
+    쓰는 쪽마다 고유한 임시 파일(tempfile.mkstemp)에 쓴 뒤 os.replace로 교체하므로,
+    여러 프로세스가 동시에 써도 서로의 임시 파일을 덮어쓰지 않고, 이미 mmap 중인 프로세스는 이전 파일을 계속 안전하게 읽습니다.
+    """
+    keys = []
+    offsets = array("Q", [0])
+    blob = bytearray()
+    row_count = 0
+    for row_number, row in enumerate(rows):
+        row_count += 1
+        for value in row:
+            blob += NULL_MARKER if value is None else value.encode("utf-8")
+            offsets.append(len(blob))
+        keys.extend((key, row_number) for key in _isbn_keys(row[0], all_isbn_versions))
+    keys.sort()
+
+    key_array = array("q", [key for key, _ in keys])
+    key_row_array = array("I", [row_number for _, row_number in keys])
+    keys_start = _align8(HEADER_SIZE)
+    key_rows_start = _align8(keys_start + len(key_array) * 8)
+    offsets_start = _align8(key_rows_start + len(key_row_array) * 4)
+    blob_start = _align8(offsets_start + len(offsets) * 8)
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(snapshot_path) or ".", prefix=os.path.basename(snapshot_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(MAGIC)
+            file.write(struct.pack(HEADER_FORMAT, FORMAT_VERSION, row_count, len(key_array), len(fields), catalog_version,
+                                   keys_start, key_rows_start, offsets_start, blob_start))
+            for start, data in ((keys_start, key_array), (key_rows_start, key_row_array), (offsets_start, offsets), (blob_start, blob)):
+                file.write(b"\0" * (start - file.tell()))
+                file.write(data.tobytes() if isinstance(data, array) else data)
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return row_count
+
+class CatalogSnapshot:
+    """mmap으로 연 스냅샷. 파일 전체를 역직렬화하지 않고 필요한 행만 바로 읽습니다."""
+
+    def __init__(self, snapshot_path, fields):
+        self.path = snapshot_path
+        self.fields = tuple(fields)
+        with open(snapshot_path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"도서 스냅샷 파일 형식이 아니에요: {snapshot_path}")
+        (version, self.row_count, key_count, field_count, self.catalog_version,
+         keys_start, key_rows_start, offsets_start, blob_start) = struct.unpack_from(HEADER_FORMAT, self._mmap, len(MAGIC))
+        if version != FORMAT_VERSION or field_count != len(self.fields):
+            self._mmap.close()
+            raise ValueError(f"도서 스냅샷 버전/필드 구성이 맞지 않아요: {snapshot_path}")
+        self._view = view = memoryview(self._mmap)
+        self._keys = view[keys_start:keys_start + key_count * 8].cast("q")
+        self._key_rows = view[key_rows_start:key_rows_start + key_count * 4].cast("I")
+        self._offsets = view[offsets_start:offsets_start + (self.row_count * field_count + 1) * 8].cast("Q")
+        self._blob_start = blob_start
+
+    def row(self, row_number):
+        """행 번호의 필드들을 dict로 디코딩 (해당 행의 바이트만 읽음, NULL은 None)"""
+        base = row_number * len(self.fields)
+        book = {}
+        for i, field in enumerate(self.fields):
+            start = self._blob_start + self._offsets[base + i]
+            end = self._blob_start + self._offsets[base + i + 1]
+            data = self._mmap[start:end]
+            book[field] = None if data == NULL_MARKER else data.decode("utf-8")
+        return book
+
+    def lookup(self, isbn_query, all_isbn_versions):
+        """ISBN(10/13) -> 테이블 순서상 첫 도서 dict, 없으면 None. 정렬된 키 배열에서 이진 탐색"""
+        row_numbers = []
+        for key in _isbn_keys(isbn_query, all_isbn_versions):
+            position = bisect_left(self._keys, key) # 같은 키가 여러 개면 테이블 순서상 첫 행
+            if position < len(self._keys) and self._keys[position] == key:
+                row_numbers.append(self._key_rows[position])
+        if not row_numbers:
+            return None
+        return self.row(min(row_numbers)) # 여러 버전이 걸리면 테이블 순서상 앞선 행 (CatalogIndex와 같음)
+
+    def close(self):
+        for view in (self._keys, self._key_rows, self._offsets, self._view):
+            view.release()
+        self._mmap.close()
@@ -0,0 +1,57 @@
+import os
+import threading
+
+import library_db
+
+# 도서관 CSV/DB가 바뀌면 앱을 다시 시작하지 않고 카탈로그를 새로 불러오는 백그라운드 감시자.
+# CSV 파일의 (수정 시각, 크기)가 바뀌면 sync_csv_to_library_db로 증분 동기화하고(체크섬이 같으면 건너뜀),
+# 다른 프로세스가 DB를 갱신한 경우도 잡도록 매 주기마다 카탈로그 버전을 확인합니다.
+# 새 인덱스는 옆에서 다 만든 뒤 교체되므로 실행 중인 추천은 끝까지 이전 카탈로그를 봅니다.
+
+DEFAULT_CHECK_INTERVAL_SECONDS = 30
+
+class CatalogWatcher:
+    """csv_path와 DB의 카탈로그 버전을 주기적으로 확인하는 데몬 스레드"""
+
+    def __init__(self, csv_path, interval_seconds=DEFAULT_CHECK_INTERVAL_SECONDS):
+        self.csv_path = csv_path
+        self.interval_seconds = interval_seconds
+        self.last_error = None
+        self._csv_stat = None # 시작하자마자 한 번 동기화 (앱이 꺼져 있는 동안 바뀐 CSV도 반영, 체크섬이 같으면 건너뜀)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+
+    def _read_csv_stat(self):
+        try:
+            stat = os.stat(self.csv_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def check_now(self):
+        """한 번 확인: CSV가 바뀌었으면 동기화, DB 버전이 바뀌었으면 카탈로그 교체. 반환: 현재 CatalogState"""
+        csv_stat = self._read_csv_stat()
+        if csv_stat is not None and csv_stat != self._csv_stat:
+            report = library_db.sync_csv_to_library_db(self.csv_path) # 변경이 있으면 내부에서 refresh_catalog 호출
+            if report is not None: # 실패(파일 없음, DB 잠김, 복사 중인 CSV 등)하면 다음 주기에 다시 시도
+                self._csv_stat = csv_stat
+        return library_db.refresh_catalog_if_changed()
+
+    def _run(self):
+        while True: # 시작 직후 한 번, 이후 interval_seconds마다
+            try:
+                self.check_now()
+                self.last_error = None
+            except Exception as e: # 감시 스레드는 죽지 않고 다음 주기에 다시 시도
+                self.last_error = e
+                print(f"🚨 도서관 카탈로그 자동 갱신 중 오류: {e}")
+            if self._stop_event.wait(self.interval_seconds):
+                return
@@ -0,0 +1,59 @@
+import numpy as np
+
+# 후보 책들 중 서로 다른 주제의 대표를 고르는 선택 엔진.
+# 유사도 행렬은 한 번만 계산해 넘겨받고, 고를 때마다 "이미 고른 책들과의 유사도 합/최댓값" 벡터를
+# 방금 고른 책의 행 하나로 갱신하므로 한 번 고를 때 비용은 O(후보 수)입니다.
+#   average : 고른 책들과의 평균 유사도가 가장 낮은 책 (기존 cluster_books_for_diversity 방식, 같은 점수면 앞 순서)
+#   max     : 고른 책들과의 최대 유사도가 가장 낮은 책 (가장 가까운 대표와도 멀리)
+#   mmr     : Maximal Marginal Relevance. diversity_weight만큼 다양성, 나머지는 적합성 점수(relevance_scores)를 반영
+
+DIVERSITY_MODES = ("average", "max", "mmr")
+
+def _normalize_scores(scores):
+    """적합성 점수를 0~1로 (모두 같으면 0)"""
+    scores = np.asarray(scores, dtype=float)
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.zeros_like(scores)
+
+def select_diverse_indices(similarity, k, mode="average", relevance_scores=None, diversity_weight=0.5):
+    """
+    similarity: (n, n) 유사도 행렬. k개의 인덱스를 고른 순서대로 반환합니다.
+    average/max 모드는 0번 후보부터, mmr 모드는 적합성 점수가 가장 높은 후보부터 시작합니다.
+    """
+    if mode not in DIVERSITY_MODES:
+        raise ValueError(f"알 수 없는 다양성 선택 방식이에요: {mode} ({', '.join(DIVERSITY_MODES)} 중 하나)")
+    similarity = np.asarray(similarity, dtype=float)
+    n = similarity.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return []
+    if mode == "mmr":
+        if relevance_scores is None:
+            raise ValueError("mmr 방식에는 relevance_scores가 필요해요.")
+        relevance = _normalize_scores(relevance_scores)
+        first = int(np.argmax(relevance))
+    else:
+        first = 0
+
+    selected = [first]
+    is_selected = np.zeros(n, dtype=bool)
+    is_selected[first] = True
+    similarity_sum = np.zeros(n) + similarity[first] # 고른 책들과의 유사도 합 (고른 순서대로 누적)
+    similarity_max = similarity[first].copy()
+
+    while len(selected) < k:
+        if mode == "average":
+            objective = similarity_sum / len(selected) # 작을수록 좋음
+        elif mode == "max":
+            objective = similarity_max.copy()
+        else:
+            objective = -(1 - diversity_weight) * relevance + diversity_weight * similarity_max
+        objective[is_selected] = np.inf
+        next_index = int(np.argmin(objective)) # 같은 값이면 앞 순서 (기존 반복문과 동일)
+        if not np.isfinite(objective[next_index]):
+            break
+        selected.append(next_index)
+        is_selected[next_index] = True
+        similarity_sum += similarity[next_index]
+        np.maximum(similarity_max, similarity[next_index], out=similarity_max)
+    return selected
@@ -0,0 +1,262 @@
+import dataclasses
+import os
+import threading
+
+import google.generativeai as genai
+
+from rate_limiter import RateLimiter, RateLimitExceeded
+from response_cache import CACHE_FRESH, ResponseCache, make_cache_key
+from tracing import NOOP_SPAN, current_span, span, start_span, use_span
+
+# Gemini 호출과 응답 캐시.
+# 검색어 생성(temperature 0.1)이나 같은 student_data의 조언 프롬프트처럼 같은 입력이 자주 반복되므로,
+# (모델 이름, 프롬프트, GenerationConfig)가 같으면 gemini_cache.db에 저장된 응답을 다시 씁니다.
+# 오류 안내 문구(요청 한도 초과, 콘텐츠 차단 등)는 정상 응답이 아니므로 절대 캐시하지 않습니다.
+# 실제로 Gemini에 보내는 호출은 모델별 RPM/RPD 한도를 아는 프로세스 공용 RateLimiter를 거칩니다.
+# 호출마다 "gemini.generate" span(프롬프트/응답 글자 수, 캐시 적중, 오류 종류)을 traces.jsonl에 남깁니다.
+
+GEMINI_CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", "gemini_cache.db") # DB_PATH처럼 실행 폴더 기준
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", 6 * 3600)) # 0이면 캐시 사용 안 함
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", 2000))
+GEMINI_CACHE_MAX_MB = int(os.getenv("GEMINI_CACHE_MAX_MB", 20))
+DEFAULT_TEMPERATURE = 0.3
+
+# 모델별 무료 등급 한도 (분당 요청 수, 일일 요청 수). 사이드바 안내와 같은 값이며 GEMINI_RPM/GEMINI_RPD로 덮어쓸 수 있음
+GEMINI_RATE_LIMITS = {
+    "gemini-2.0-flash-lite": (30, 1500),
+    "gemini-1.5-flash-latest": (15, 500),
+}
+DEFAULT_GEMINI_RATE_LIMIT = (15, 500)
+GEMINI_MAX_QUEUE_WAIT_SECONDS = int(os.getenv("GEMINI_MAX_QUEUE_WAIT_SECONDS", 90)) # 이보다 오래 기다려야 하면 시작 전에 안내
+GEMINI_CALL_TIMEOUT_SECONDS = 120 # 예약 없이 부른 호출이 토큰을 기다리는 최대 시간
+GEMINI_FINISH_REASON_STOP = 1 # FinishReason.STOP (enum 대신 정수로 오는 경우)
+
+_gemini_cache = None
+_gemini_cache_lock = threading.Lock()
+
+def get_gemini_cache():
+    """프로세스 공용 Gemini 응답 캐시 (GEMINI_CACHE_TTL_SECONDS가 0이면 None)"""
+    global _gemini_cache
+    if _gemini_cache is None and GEMINI_CACHE_TTL_SECONDS > 0:
+        with _gemini_cache_lock:
+            if _gemini_cache is None:
+                _gemini_cache = ResponseCache(GEMINI_CACHE_PATH, GEMINI_CACHE_TTL_SECONDS, 0,
+                                              GEMINI_CACHE_MAX_ENTRIES, GEMINI_CACHE_MAX_MB * 1024 * 1024)
+    return _gemini_cache
+
+_rate_limiters = {} # 모델 이름 -> RateLimiter
+_rate_limiters_lock = threading.Lock()
+
+def get_gemini_rate_limiter(model_name):
+    """모델별 프로세스 공용 RateLimiter"""
+    model_name = model_name.split("/")[-1] # GenerativeModel.model_name은 "models/..." 형식
+    limiter = _rate_limiters.get(model_name)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(model_name)
+            if limiter is None:
+                rpm, rpd = GEMINI_RATE_LIMITS.get(model_name, DEFAULT_GEMINI_RATE_LIMIT)
+                rpm, rpd = int(os.getenv("GEMINI_RPM", rpm)), int(os.getenv("GEMINI_RPD", rpd))
+                limiter = RateLimiter(rpm, rpd, max_wait_seconds=GEMINI_MAX_QUEUE_WAIT_SECONDS)
+                _rate_limiters[model_name] = limiter
+    return limiter
+
+def reserve_gemini_calls(model_name, count):
+    """
+    추천 한 번에 필요한 Gemini 호출 수를 시작 전에 예약합니다. with 블록 안의 get_ai_recommendation은 이 예약분을 씁니다.
+    예산이 없거나 대기열이 너무 길면 RateLimitExceeded (사용자에게 보여줄 메시지와 retry_after 포함).
+    """
+    return get_gemini_rate_limiter(model_name).reserve(count)
+
+def get_gemini_rate_status(model_name):
+    """사이드바 표시용 남은 일일 예산/대기열 상태"""
+    return get_gemini_rate_limiter(model_name).status()
+
+def get_gemini_cache_stats():
+    """캐시 적중/미적중 카운터 (캐시를 안 쓰면 None)"""
+    cache = get_gemini_cache()
+    return cache.stats() if cache else None
+
+def _generation_config_key(generation_config):
+    """GenerationConfig(데이터클래스/dict)를 캐시 키에 넣을 수 있는 값으로 (값이 없는 항목은 제외)"""
+    try:
+        if dataclasses.is_dataclass(generation_config):
+            generation_config = dataclasses.asdict(generation_config)
+        if isinstance(generation_config, dict):
+            return {key: value for key, value in generation_config.items() if value is not None}
+    except TypeError:
+        pass
+    return repr(generation_config)
+
+def gemini_cache_key(model_to_use, prompt_text, generation_config):
+    model_name = getattr(model_to_use, "model_name", type(model_to_use).__name__)
+    return make_cache_key("gemini_generate_content", model_name, prompt_text, _generation_config_key(generation_config))
+
+def _gemini_error_message(e):
+    """Gemini 호출 예외를 사용자에게 보여줄 안내 문구로"""
+    if isinstance(e, genai.types.generation_types.BlockedPromptException):
+        # print(f"Gemini API BlockedPromptException: {e}") # 로깅
+        return "🚨 이런! 도도 요정이 이 요청에 대한 답변을 생성하는 데 어려움을 느끼고 있어요. 입력 내용을 조금 바꿔서 다시 시도해볼까요? (콘텐츠 안전 문제일 수 있어요!)"
+    error_message_detail = str(e).lower()
+    if "rate limit" in error_message_detail or "quota" in error_message_detail or "resource_exhausted" in error_message_detail or "resource has been exhausted" in error_message_detail or "429" in error_message_detail:
+        return "🚀 지금 도도를 찾는 친구들이 너무 많아서 조금 바빠요! 잠시 후에 다시 시도해주면 요정의 가루를 뿌려줄게요! ✨ (요청 한도 초과 또는 일시적 과부하)"
+    # print(f"Gemini API Error: {e}") # 로깅
+    return f"🧚 AI 요정님 호출 중 예상치 못한 오류 발생!: {str(e)[:200]}...\n잠시 후 다시 시도해주세요."
+
+def _generate(model_to_use, prompt_text, generation_config):
+    """Gemini 호출. 반환: (응답 텍스트, None) 또는 (None, 사용자에게 보여줄 오류 메시지) (오류 종류는 현재 span에 기록)"""
+    try:
+        response = model_to_use.generate_content(
+            prompt_text,
+            generation_config=generation_config,
+            # safety_settings=[ # 필요시 안전 설정 강화 또는 완화
+            #     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+            #     {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+            # ]
+        )
+        return response.text, None
+    except Exception as e:
+        current_span().record_error(e)
+        return None, _gemini_error_message(e)
+
+def _finish_reason_name(chunk):
+    """응답 조각의 첫 후보 종료 이유 이름 ("STOP", "SAFETY", "MAX_TOKENS" ...). 알 수 없으면 None"""
+    try:
+        finish_reason = chunk.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return None
+    if hasattr(finish_reason, "name"): # FinishReason enum
+        return finish_reason.name
+    return "STOP" if finish_reason == GEMINI_FINISH_REASON_STOP else None
+
+def _generate_stream(model_to_use, prompt_text, generation_config, trace_span=NOOP_SPAN, stream_state=None):
+    """
+    스트리밍 Gemini 호출. (텍스트 조각, None)을 도착하는 대로 내보내고, 실패하면 마지막에 (None, 오류 메시지) (오류 종류는 trace_span에).
+    stream_state(dict)를 주면 끝난 뒤 "complete"에 응답이 온전한지 기록합니다:
+    텍스트 없는 조각을 건너뛰지 않았고(안전 필터 등) 마지막 조각의 종료 이유가 STOP일 때만 True (캐시 저장 여부 판단용)
+    """
+    stream_state = stream_state if stream_state is not None else {}
+    stream_state["complete"] = False
+    try:
+        response = model_to_use.generate_content(prompt_text, generation_config=generation_config, stream=True)
+        dropped_chunk, last_chunk = False, None
+        for chunk in response:
+            last_chunk = chunk
+            try:
+                chunk_text = chunk.text
+            except ValueError: # 텍스트가 없는 조각 (종료 정보만 있거나 안전 필터로 잘린 경우) -> 응답이 잘렸을 수 있음
+                dropped_chunk = True
+                continue
+            if chunk_text:
+                yield chunk_text, None
+        finish_reason = _finish_reason_name(last_chunk) if last_chunk is not None else None
+        stream_state["complete"] = not dropped_chunk and finish_reason == "STOP"
+        trace_span.set(finish_reason=finish_reason, dropped_chunk=dropped_chunk)
+    except Exception as e:
+        trace_span.record_error(e)
+        yield None, _gemini_error_message(e)
+
+def get_ai_recommendation(model_to_use, prompt_text, generation_config=None, use_cache=True, stream=False):
+    """
+    Gemini 응답 텍스트 또는 오류 안내 문구를 반환 (같은 모델/프롬프트/설정이면 캐시된 정상 응답 재사용).
+    stream=True면 텍스트 조각을 도착하는 대로 내보내는 제너레이터를 반환합니다 (조각을 이으면 stream=False의 반환값과 같음).
+    """
+    if stream:
+        return _stream_ai_recommendation(model_to_use, prompt_text, generation_config, use_cache)
+    if not model_to_use:
+        return "🚫 AI 모델이 준비되지 않았어요. API 키 설정을 확인해주세요!"
+    with span("gemini.generate", model=_model_name(model_to_use), prompt_chars=len(prompt_text), stream=False) as trace_span:
+        final_generation_config, cache, cache_key, cached_text = _prepare_call(model_to_use, prompt_text, generation_config, use_cache)
+        trace_span.set(cache=_cache_state(cache, cached_text))
+        if cached_text is not None:
+            trace_span.set(response_chars=len(cached_text))
+            return cached_text
+
+        rate_limit_message = _acquire_call(model_to_use)
+        if rate_limit_message:
+            return rate_limit_message
+        response_text, error_message = _generate(model_to_use, prompt_text, final_generation_config)
+        if error_message:
+            return error_message # 오류 문구는 캐시하지 않음
+        trace_span.set(response_chars=len(response_text or ""))
+        _store_response(cache, cache_key, response_text)
+        return response_text
+
+def _stream_ai_recommendation(model_to_use, prompt_text, generation_config, use_cache):
+    if not model_to_use:
+        yield "🚫 AI 모델이 준비되지 않았어요. API 키 설정을 확인해주세요!"
+        return
+    # 조각을 내보내는 동안 호출한 쪽의 작업이 이 span 아래로 들어가지 않도록 현재 span으로 바꾸지 않고 직접 넘김
+    trace_span = start_span("gemini.generate", model=_model_name(model_to_use), prompt_chars=len(prompt_text), stream=True)
+    try:
+        with use_span(trace_span):
+            final_generation_config, cache, cache_key, cached_text = _prepare_call(model_to_use, prompt_text, generation_config, use_cache)
+        trace_span.set(cache=_cache_state(cache, cached_text))
+        if cached_text is not None:
+            trace_span.set(response_chars=len(cached_text))
+            yield cached_text
+            return
+
+        with use_span(trace_span):
+            rate_limit_message = _acquire_call(model_to_use) # 첫 조각을 요청할 때 (reserve 예약 블록 안에서 소비)
+        if rate_limit_message:
+            yield rate_limit_message
+            return
+        response_chunks, response_chars, stream_state = [], 0, {}
+        for chunk_text, error_message in _generate_stream(model_to_use, prompt_text, final_generation_config, trace_span, stream_state):
+            if error_message:
+                yield ("\n\n" if response_chunks else "") + error_message # 도중에 끊긴 응답과 오류 문구는 캐시하지 않음
+                return
+            if not response_chunks:
+                trace_span.set(first_chunk_ms=trace_span.elapsed_ms())
+            response_chunks.append(chunk_text)
+            response_chars += len(chunk_text)
+            trace_span.set(response_chars=response_chars, chunks=len(response_chunks))
+            yield chunk_text
+        if stream_state.get("complete"): # 조각이 빠졌거나 STOP 외의 이유로 끝난 응답은 캐시하지 않음 (잘린 추천이 재사용되지 않도록)
+            _store_response(cache, cache_key, "".join(response_chunks))
+    except GeneratorExit: # 호출한 쪽이 끝까지 읽지 않고 닫음
+        trace_span.set(closed_early=True)
+        raise
+    finally:
+        trace_span.finish()
+
+def _model_name(model_to_use):
+    return getattr(model_to_use, "model_name", type(model_to_use).__name__).split("/")[-1]
+
+def _cache_state(cache, cached_text):
+    """span에 남길 캐시 상태: hit / miss / off"""
+    if cache is None:
+        return "off"
+    return "hit" if cached_text is not None else "miss"
+
+def _prepare_call(model_to_use, prompt_text, generation_config, use_cache):
+    """(최종 GenerationConfig, 캐시, 캐시 키, 캐시된 정상 응답 또는 None)"""
+    # 기본 temperature를 약간 낮춰서 일관성 있는 답변 유도 (필요시 프롬프트별 조정)
+    final_generation_config = generation_config if generation_config else genai.GenerationConfig(temperature=DEFAULT_TEMPERATURE)
+    cache = get_gemini_cache() if use_cache else None
+    cache_key = gemini_cache_key(model_to_use, prompt_text, final_generation_config) if cache else None
+    if cache:
+        try:
+            cached_text, cache_state = cache.get(cache_key)
+            if cache_state == CACHE_FRESH:
+                return final_generation_config, cache, cache_key, cached_text
+        except Exception as e: # 캐시 파일 문제로 추천이 막히지 않도록
+            print(f"Gemini 응답 캐시 읽기 오류: {e}")
+    return final_generation_config, cache, cache_key, None
+
+def _acquire_call(model_to_use):
+    """캐시에 없을 때만 분당/일일 한도를 씀. 한도 때문에 보낼 수 없으면 안내 문구, 보내도 되면 None"""
+    try:
+        get_gemini_rate_limiter(getattr(model_to_use, "model_name", "")).acquire(timeout=GEMINI_CALL_TIMEOUT_SECONDS)
+    except RateLimitExceeded as e:
+        current_span().record_error(e)
+        return f"🚀 지금 도도를 찾는 친구들이 너무 많아서 조금 바빠요! ({e}) 잠시 후에 다시 시도해주세요. ✨ (요청 한도 초과 또는 일시적 과부하)"
+    return None
+
+def _store_response(cache, cache_key, response_text):
+    if cache and response_text:
+        try:
+            cache.set(cache_key, response_text)
+        except Exception as e:
+            print(f"Gemini 응답 캐시 저장 오류: {e}")
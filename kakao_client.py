@@ -0,0 +1,244 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from response_cache import CACHE_FRESH, CACHE_STALE, ResponseCache, make_cache_key
+from tracing import current_span, span
+
+# 카카오 도서 검색 API 클라이언트.
+# 프로세스 전체가 API 키별로 requests.Session 하나를 공유해 dapi.kakao.com과의 연결(TCP+TLS)을 재사용합니다.
+# 세션은 만든 뒤 헤더/쿠키 등을 바꾸지 않고 GET만 하므로 여러 Streamlit 세션 스레드에서 같이 써도 안전하며,
+# 연결 풀(urllib3)이 스레드별 요청을 나눠 맡습니다.
+# 같은 반 학생들이 같은 주제를 검색하므로, 성공한 검색 결과(cleaned_isbn까지 처리된 문서)는
+# school_library.db 옆의 kakao_cache.db에 저장해 두고 다시 씁니다. (TTL이 지난 결과는 일단 돌려주고 뒤에서 갱신)
+
+KAKAO_BOOK_SEARCH_URL = "https://dapi.kakao.com/v3/search/book"
+KAKAO_POOL_SIZE = 12 # 동시 요청 수(검색어 최대 6개 x 동시 사용자 몇 명)에 맞춘 keep-alive 연결 수
+KAKAO_TIMEOUT = (3.05, 10) # (연결, 응답) 초
+KAKAO_MAX_RETRIES = 2 # 429/5xx/연결 오류 시 추가 시도 횟수 (응답 시간 초과는 재시도하지 않음)
+KAKAO_RETRY_BASE_DELAY = 0.3 # 재시도 대기 기본값(초). 지수 증가 + 지터
+KAKAO_RETRY_MAX_DELAY = 3.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+KAKAO_MAX_CONCURRENT_SEARCHES = 6 # 검색어 생성 개수(최대 6개)만큼 동시에 요청
+KAKAO_MAX_PAGE = 50 # 카카오 도서 검색 API의 page 최대값
+KAKAO_CACHE_PATH = os.getenv("KAKAO_CACHE_PATH", "kakao_cache.db") # DB_PATH처럼 실행 폴더 기준
+KAKAO_CACHE_TTL_SECONDS = int(os.getenv("KAKAO_CACHE_TTL_SECONDS", 6 * 3600)) # 0이면 캐시 사용 안 함
+KAKAO_CACHE_STALE_SECONDS = int(os.getenv("KAKAO_CACHE_STALE_SECONDS", 24 * 3600)) # TTL 이후에도 일단 돌려줄 기간
+KAKAO_CACHE_MAX_ENTRIES = int(os.getenv("KAKAO_CACHE_MAX_ENTRIES", 5000))
+KAKAO_CACHE_MAX_MB = int(os.getenv("KAKAO_CACHE_MAX_MB", 50))
+
+_sessions = {} # API 키 -> 공유 세션
+_sessions_lock = threading.Lock()
+
+def get_kakao_session(api_key):
+    """API 키별 프로세스 공용 세션 (인증 헤더가 미리 설정된 keep-alive 연결 풀)"""
+    session = _sessions.get(api_key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(api_key)
+            if session is None:
+                session = requests.Session()
+                session.headers.update({"Authorization": f"KakaoAK {api_key}"})
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=KAKAO_POOL_SIZE, pool_block=False, max_retries=0)
+                session.mount("https://", adapter)
+                _sessions[api_key] = session
+    return session
+
+_kakao_cache = None
+_kakao_cache_lock = threading.Lock()
+_revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="kakao-revalidate")
+_revalidating_keys = set()
+
+def get_kakao_cache():
+    """프로세스 공용 검색 결과 캐시 (KAKAO_CACHE_TTL_SECONDS가 0이면 None)"""
+    global _kakao_cache
+    if _kakao_cache is None and KAKAO_CACHE_TTL_SECONDS > 0:
+        with _kakao_cache_lock:
+            if _kakao_cache is None:
+                _kakao_cache = ResponseCache(KAKAO_CACHE_PATH, KAKAO_CACHE_TTL_SECONDS, KAKAO_CACHE_STALE_SECONDS,
+                                             KAKAO_CACHE_MAX_ENTRIES, KAKAO_CACHE_MAX_MB * 1024 * 1024)
+    return _kakao_cache
+
+def get_kakao_cache_stats():
+    """캐시 적중/미적중 카운터 (캐시를 안 쓰면 None)"""
+    cache = get_kakao_cache()
+    return cache.stats() if cache else None
+
+def iter_cached_kakao_documents(limit=1000):
+    """캐시에 저장된 최근 검색 결과의 문서들 (캐시를 안 쓰면 아무것도 없음)"""
+    cache = get_kakao_cache()
+    if cache is None:
+        return
+    for data in cache.recent_values(limit):
+        yield from (data or {}).get("documents") or []
+
+def _retry_delay(attempt, response=None):
+    """재시도 전 대기 시간: Retry-After가 있으면 따르고, 없으면 지수 백오프에 전체 지터"""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), KAKAO_RETRY_MAX_DELAY)
+    return random.uniform(0, min(KAKAO_RETRY_MAX_DELAY, KAKAO_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def _get_with_retry(session, params):
+    """
+    429/5xx 응답과 연결 오류(ConnectTimeout 포함)만 재시도합니다.
+    응답 시간 초과(ReadTimeout)는 바로 올려 보내, 느린 검색어 하나가 동시 검색 전체를 KAKAO_TIMEOUT의 몇 배로 붙잡지 않도록 합니다.
+    """
+    for attempt in range(KAKAO_MAX_RETRIES + 1):
+        is_last_attempt = attempt == KAKAO_MAX_RETRIES
+        try:
+            response = session.get(KAKAO_BOOK_SEARCH_URL, params=params, timeout=KAKAO_TIMEOUT)
+        except requests.exceptions.ConnectionError:
+            if is_last_attempt:
+                raise
+            time.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code in RETRYABLE_STATUS_CODES and not is_last_attempt:
+            time.sleep(_retry_delay(attempt, response))
+            continue
+        current_span().set(attempts=attempt + 1)
+        return response
+
+def clean_kakao_isbn(isbn_raw):
+    """카카오 isbn 필드("ISBN10 ISBN13")에서 ISBN-13 우선으로 하나를 골라 숫자/X만 남김"""
+    if not isbn_raw:
+        return ''
+    isbns = isbn_raw.split()
+    isbn13 = next((s.replace('-', '') for s in isbns if len(s.replace('-', '')) == 13), None)
+    isbn10 = next((s.replace('-', '') for s in isbns if len(s.replace('-', '')) == 10), None)
+    chosen_isbn = isbn13 if isbn13 else (isbn10 if isbn10 else (isbns[0].replace('-', '') if isbns else ''))
+    return "".join(filter(lambda x: x.isdigit() or x.upper() == 'X', chosen_isbn))
+
+def search_kakao_books(query, api_key, size=10, target="title", page=1): # 기본 size는 10으로 유지
+    """카카오 도서 검색 (캐시 우선). 반환: (data, None) 또는 (None, 오류 메시지). 각 문서에 cleaned_isbn 추가"""
+    if not api_key: return None, "카카오 API 키가 설정되지 않았습니다."
+    with span("kakao.search", query=query, page=page, size=size, target=target) as trace_span:
+        data, error_msg = _search_kakao_books(query, api_key, size, target, page)
+        if data:
+            trace_span.set(documents=len(data.get("documents") or []))
+        return data, error_msg
+
+def _search_kakao_books(query, api_key, size, target, page):
+    params = { "query": query, "sort": "accuracy", "size": size, "target": target, "page": page } # accuracy 우선
+    cache = get_kakao_cache()
+    if cache is None:
+        current_span().set(cache="off")
+        return _fetch_kakao_books(params, api_key)
+    cache_key = make_cache_key("kakao_book_search", query, target, size, params["sort"], page)
+    try:
+        cached_data, cache_state = cache.get(cache_key)
+    except Exception as e: # 캐시 파일 문제로 검색이 막히지 않도록
+        print(f"카카오 검색 캐시 읽기 오류: {e}")
+        cached_data, cache_state = None, None
+    if cache_state == CACHE_FRESH:
+        current_span().set(cache="hit")
+        return cached_data, None
+    if cache_state == CACHE_STALE:
+        current_span().set(cache="stale")
+        _revalidate_in_background(cache, cache_key, params, api_key)
+        return cached_data, None
+    current_span().set(cache="miss")
+    data, error_msg = _fetch_kakao_books(params, api_key)
+    if error_msg is None:
+        _store_in_cache(cache, cache_key, data)
+    return data, error_msg
+
+def _store_in_cache(cache, cache_key, data):
+    try:
+        cache.set(cache_key, data)
+    except Exception as e:
+        print(f"카카오 검색 캐시 저장 오류: {e}")
+
+def _revalidate_in_background(cache, cache_key, params, api_key):
+    """오래된 캐시 결과를 돌려준 뒤 같은 검색을 뒤에서 다시 받아 갱신 (같은 키는 한 번만)"""
+    with _kakao_cache_lock:
+        if cache_key in _revalidating_keys:
+            return
+        _revalidating_keys.add(cache_key)
+
+    def revalidate():
+        try:
+            data, error_msg = _fetch_kakao_books(params, api_key)
+            if error_msg is None: # 실패하면 기존 결과를 그대로 둠
+                _store_in_cache(cache, cache_key, data)
+        finally:
+            with _kakao_cache_lock:
+                _revalidating_keys.discard(cache_key)
+
+    _revalidate_executor.submit(revalidate)
+
+def _fetch_kakao_books(params, api_key):
+    """카카오 API를 실제로 호출해 문서별 cleaned_isbn까지 처리한 결과 반환: (data, None) 또는 (None, 오류 메시지) (오류 종류는 현재 span에 기록)"""
+    query = params["query"]
+    try:
+        response = _get_with_retry(get_kakao_session(api_key), params)
+        response.raise_for_status()
+        current_span().set(status_code=response.status_code, response_bytes=len(response.content))
+        data = response.json()
+        if data and "documents" in data:
+            for doc in data["documents"]:
+                doc['cleaned_isbn'] = clean_kakao_isbn(doc.get('isbn', ''))
+        return data, None
+    except requests.exceptions.Timeout as e:
+        current_span().record_error(e)
+        return None, f"카카오 API '{query}' 검색 시간 초과 🐢"
+    except requests.exceptions.RequestException as e:
+        current_span().record_error(e)
+        return None, f"카카오 '{query}' 검색 오류: {e}"
+    except Exception as e: # 기타 예외 처리
+        current_span().record_error(e)
+        return None, f"카카오 API 처리 중 알 수 없는 오류: {str(e)[:100]}"
+
+def search_kakao_books_concurrently(queries, api_key, size=10, target="title", on_query_done=None, page=1):
+    """
+    여러 검색어를 스레드 풀로 동시에 검색합니다. (전체 시간 ≈ 가장 느린 검색어 하나)
+    반환: 검색어 순서 그대로의 [(검색어, 결과 data, 오류 메시지), ...]
+    on_query_done(완료 개수, 전체 개수)은 검색어 하나가 끝날 때마다 호출한 스레드(Streamlit 스크립트 스레드)에서 불립니다.
+    """
+    queries = [query for query in queries if query]
+    if not queries:
+        return []
+    results = [None] * len(queries)
+    with ThreadPoolExecutor(max_workers=min(KAKAO_MAX_CONCURRENT_SEARCHES, len(queries))) as executor:
+        # 작업마다 현재 컨텍스트를 복사해 넘겨야 검색 span이 호출한 쪽(추천 단계) span 아래에 기록됨
+        futures = {executor.submit(contextvars.copy_context().run, search_kakao_books, query, api_key, size, target, page): i
+                   for i, query in enumerate(queries)}
+        for completed_count, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            data, error_msg = future.result() # search_kakao_books는 예외 대신 오류 메시지를 반환
+            results[i] = (queries[i], data, error_msg)
+            if on_query_done:
+                on_query_done(completed_count, len(queries))
+    return results
+
+def iter_kakao_book_pages(queries, api_key, size=10, target="title", max_pages=3, on_query_done=None, errors=None):
+    """
+    검색어들의 결과 문서를 검색어 순서대로 하나씩 내보내는 제너레이터.
+    한 번에 모든 검색어의 같은 페이지를 동시에 받고, 소비하는 쪽이 문서를 더 꺼낼 때만 다음 페이지(page=2, 3, ...)를 요청합니다.
+    (결과가 끝난 검색어(meta.is_end)는 다음 페이지를 받지 않음)
+    on_query_done(페이지, 완료 개수, 전체 개수): 진행 표시용. errors 리스트를 주면 검색어별 오류 문구를 모읍니다.
+    """
+    pending_queries = [query for query in queries if query]
+    page = 1
+    while pending_queries and page <= min(max_pages, KAKAO_MAX_PAGE):
+        page_progress = (lambda done, total, page=page: on_query_done(page, done, total)) if on_query_done else None
+        results = search_kakao_books_concurrently(pending_queries, api_key, size, target, on_query_done=page_progress, page=page)
+        next_queries = []
+        for query, data, error_msg in results:
+            if error_msg:
+                if errors is not None:
+                    errors.append(f"'{query}' 검색 시: {error_msg}")
+                continue
+            if not data:
+                continue
+            if not (data.get("meta") or {}).get("is_end", True):
+                next_queries.append(query)
+            yield from data.get("documents") or []
+        pending_queries = next_queries
+        page += 1
@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import threading
+import time
+
+# 학년 필터와 자체 점수가 쓰는 키워드 규칙 엔진.
+# 규칙은 keyword_rules.json에 "필드 -> 규칙 이름 -> 키워드 목록"으로 적어 두고(코드 수정 없이 변경),
+# 필드마다 모든 키워드를 정규식 하나(긴 키워드 먼저)로 묶어 텍스트를 한 번 훑습니다.
+# 긴 키워드가 맞으면 그 안에 들어 있는 짧은 키워드도 함께 맞은 것으로 미리 계산해 두므로("초등학생" -> "초등")
+# 겹치지 않게 찾아도 빠지는 키워드가 없습니다. 다만 두 키워드가 걸쳐서 겹칠 수 있으면(앞 키워드의 끝 = 뒤 키워드의 시작)
+# 글자 위치마다 찾는 lookahead 정규식으로 바꿉니다 (느리지만 빠짐없음).
+# 결과는 문서에 한 번 기록해 두고(keyword_classes) 필터와 점수 계산이 함께 씁니다.
+
+KEYWORD_RULES_PATH = os.getenv("KEYWORD_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_rules.json"))
+KEYWORD_RULES_RECHECK_SECONDS = 5 # 규칙 파일 수정 여부를 확인하는 간격 (문서마다 stat하지 않도록)
+EMPTY_MATCH = frozenset()
+
+def _overlaps(keyword, other):
+    """keyword의 뒷부분이 other의 앞부분과 걸쳐 겹치는지 (예: "초등학" + "학생")"""
+    return keyword != other and any(keyword.endswith(other[:size]) for size in range(1, min(len(keyword), len(other))))
+
+class KeywordRules:
+    """{필드: {규칙 이름: [키워드, ...]}}를 필드별 정규식 하나로 컴파일. match(필드, 텍스트)는 맞은 규칙 이름 frozenset"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._compiled = {field: self._compile(field_rules) for field, field_rules in rules.items()}
+
+    @staticmethod
+    def _compile(field_rules):
+        classes_by_keyword = {}
+        for rule_name, keywords in field_rules.items():
+            for keyword in keywords:
+                keyword = keyword.lower()
+                if keyword:
+                    classes_by_keyword.setdefault(keyword, set()).add(rule_name)
+        if not classes_by_keyword:
+            return None, {}
+        # 키워드가 맞으면 그 안에 들어 있는 다른 키워드의 규칙도 모두 맞은 것
+        matched_classes = {
+            keyword: frozenset().union(*(classes for other, classes in classes_by_keyword.items() if other in keyword))
+            for keyword in classes_by_keyword
+        }
+        alternatives = "|".join(re.escape(keyword) for keyword in sorted(classes_by_keyword, key=len, reverse=True)) # 긴 키워드 먼저
+        if any(_overlaps(keyword, other) for keyword in classes_by_keyword for other in classes_by_keyword):
+            first_chars = re.escape("".join(sorted({keyword[0] for keyword in classes_by_keyword})))
+            return re.compile(f"(?=[{first_chars}])(?=({alternatives}))"), matched_classes
+        return re.compile(alternatives), matched_classes
+
+    def match(self, field, text):
+        pattern, matched_classes = self._compiled.get(field, (None, {}))
+        if pattern is None or not text:
+            return EMPTY_MATCH
+        keywords = set(pattern.findall(text.lower()))
+        if len(keywords) == 1:
+            return matched_classes[keywords.pop()]
+        return frozenset().union(*(matched_classes[keyword] for keyword in keywords))
+
+    def match_doc(self, book_doc):
+        """{필드: 맞은 규칙 이름 frozenset} (필드 이름이 곧 문서 키: title, contents)"""
+        return {field: self.match(field, book_doc.get(field) or "") for field in self._compiled}
+
+def load_keyword_rules(path=KEYWORD_RULES_PATH):
+    """JSON 규칙 파일을 읽어 컴파일 ("_"로 시작하는 키는 설명용이라 건너뜀)"""
+    with open(path, encoding="utf-8") as file:
+        raw_rules = json.load(file)
+    rules = {
+        field: {rule_name: list(keywords) for rule_name, keywords in field_rules.items() if not rule_name.startswith("_")}
+        for field, field_rules in raw_rules.items() if not field.startswith("_")
+    }
+    return KeywordRules(rules)
+
+_keyword_rules = None
+_keyword_rules_mtime = None
+_keyword_rules_checked_at = 0.0
+_keyword_rules_lock = threading.Lock()
+
+def get_keyword_rules():
+    """프로세스 공용 컴파일된 규칙. 규칙 파일이 바뀌면(수정 시각, 몇 초 간격으로 확인) 다시 읽고, 읽기에 실패하면 직전 규칙을 계속 씀"""
+    global _keyword_rules, _keyword_rules_mtime, _keyword_rules_checked_at
+    now = time.monotonic()
+    if _keyword_rules is not None and now - _keyword_rules_checked_at < KEYWORD_RULES_RECHECK_SECONDS:
+        return _keyword_rules
+    _keyword_rules_checked_at = now
+    try:
+        mtime = os.stat(KEYWORD_RULES_PATH).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _keyword_rules is None or (mtime is not None and mtime != _keyword_rules_mtime):
+        with _keyword_rules_lock:
+            if _keyword_rules is None or (mtime is not None and mtime != _keyword_rules_mtime):
+                try:
+                    _keyword_rules = load_keyword_rules()
+                except (OSError, ValueError, AttributeError, TypeError) as e:
+                    print(f"🚨 키워드 규칙 파일 읽기 오류: {e}")
+                    if _keyword_rules is None:
+                        _keyword_rules = KeywordRules({})
+                _keyword_rules_mtime = mtime
+    return _keyword_rules
+
+def get_keyword_classes(book_doc):
+    """문서의 필드별 맞은 규칙 이름. 처음 한 번만 계산해 book_doc["keyword_classes"]에 기록 (필터와 점수가 공유)"""
+    cached = book_doc.get("keyword_classes")
+    if cached is None:
+        cached = book_doc["keyword_classes"] = get_keyword_rules().match_doc(book_doc)
+    return cached
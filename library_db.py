@@ -1,13 +1,95 @@
 import sqlite3
 import csv
 import os
+import json
+import re
+import hashlib
+import pathlib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from catalog_bm25 import CatalogBM25Index
+from catalog_snapshot import CatalogSnapshot, write_snapshot
+from title_ngram_index import TitleNgramIndex, title_author_similarity
+from text_normalizer import NORMALIZATION_VERSION, normalize_text_for_matching # 기존 import 경로 호환을 위해 여기서도 노출
+from tracing import traced # 조회 함수마다 걸린 시간/결과 수를 traces.jsonl에 기록
 
 DB_PATH = "school_library.db"
+BOOK_COLUMNS = ("isbn", "title", "author", "publisher", "call_number", "status", "publication_year", "description")
+# CSV 적재 시 INSERT 컬럼 순서 (정규화 컬럼 제외)
+CSV_LOAD_COLUMNS = ("isbn", "title", "author", "publisher", "call_number", "publication_year", "description", "status")
+# 적재 시 원본 컬럼에서 계산해 함께 저장하는 파생 컬럼 (이름, SQLite 타입)
+DERIVED_COLUMN_TYPES = (
+    ("title_norm", "TEXT"), ("author_norm", "TEXT"), # 정규화된 제목/저자 (제목/저자 검색용)
+    ("shelf_prefix", "TEXT"), ("kdc_class", "REAL"), ("author_mark", "TEXT"), # 청구기호 분해 (서가 탐색용)
+    ("volume", "TEXT"), ("volume_sort", "INTEGER"), ("copy_number", "INTEGER"),
+)
+DERIVED_COLUMNS = tuple(name for name, _ in DERIVED_COLUMN_TYPES)
+SHELF_ORDER = "kdc_class, author_mark, volume_sort, copy_number, rowid" # 서가에 꽂힌 순서
+SYNC_CHUNK_SIZE = 1000
+TITLE_MATCH_CANDIDATE_LIMIT = 50 # 제목/저자 포함 매칭 후보 중 유사도 순위를 매길 최대 개수
+LOCAL_SEARCH_TOP_K_PER_QUERY = 30 # 소장 도서 BM25 검색에서 검색어 하나당 살펴볼 상위 결과 수
+# 읽기 연결 공통 설정: 실수로 쓰지 않도록 query_only, 파일은 mmap으로 공유, 페이지 캐시는 약 16MB
+READ_CONNECTION_PRAGMAS = ("PRAGMA query_only = ON", "PRAGMA mmap_size = 268435456", "PRAGMA cache_size = -16000")
 # books_cache = []
 
+# --- DB 연결 관리 ---
+# Streamlit은 세션마다 스레드를 쓰므로, 스레드별 읽기 전용 연결을 한 번 열어 계속 재사용합니다.
+# (sqlite3 모듈이 연결마다 SQL 문장을 캐시하므로 같은 조회문은 준비(prepare)된 문장이 재사용됨)
+# 쓰기는 WAL 모드로 수행해서, CSV 재적재 중에도 읽기 연결은 직전 커밋 시점의 데이터를 막힘 없이 읽습니다.
+_thread_local = threading.local()
+_schema_lock = threading.Lock()
+
+def get_write_connection():
+    """적재/마이그레이션용 쓰기 연결을 새로 엽니다. (WAL 모드, 사용 후 close 필요)"""
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+def get_read_connection():
+    """현재 스레드 전용 읽기 전용 연결을 반환합니다. (스레드당 한 번만 열고 재사용, close 하지 않음)"""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is not None and _thread_local.db_path == DB_PATH:
+        return conn
+    if conn is not None:
+        conn.close() # DB_PATH가 바뀐 경우 이전 연결 정리
+    prepare_library_db()
+    conn = _open_read_connection()
+    _thread_local.conn = conn
+    _thread_local.db_path = DB_PATH
+    return conn
+
+def _open_read_connection():
+    """읽기 전용 연결을 새로 엽니다. (자동 커밋 모드: 필요할 때만 BEGIN으로 읽기 트랜잭션을 엶)"""
+    db_uri = pathlib.Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(db_uri, uri=True, isolation_level=None, cached_statements=256)
+    for pragma in READ_CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def close_read_connection():
+    """현재 스레드의 읽기 연결을 닫습니다. (스레드 종료 전 정리용)"""
+    conn = getattr(_thread_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _thread_local.conn = None
+
+def prepare_library_db():
+    """읽기 전에 스키마 마이그레이션이 끝났는지 확인합니다. (DB 경로당 한 번, 쓰기 연결로 수행)"""
+    if DB_PATH in _schema_ready_paths:
+        return
+    with _schema_lock:
+        conn = get_write_connection()
+        try:
+            ensure_books_schema(conn)
+        finally:
+            conn.close()
+
 def create_library_table():
     """학교 도서관 책 정보를 저장할 테이블을 생성합니다."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_write_connection()
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS books (
@@ -22,18 +104,68 @@ def create_library_table():
         )
     """)
     conn.commit()
+    ensure_books_schema(conn)
     conn.close()
     print(f"📚 '{DB_PATH}'에 'books' 테이블 준비 완료 (또는 이미 존재함)!")
 
+_schema_ready_paths = set()
+
+def ensure_books_schema(conn, db_path=None):
+    """
+    기존 school_library.db도 그대로 쓸 수 있도록 books 테이블 스키마를 자동으로 맞춥니다.
+    - 파생 컬럼(정규화된 제목/저자, 분해된 청구기호) 추가 및 빈 값 채우기
+    - title_norm/서가 순서 인덱스 생성 (이전 버전의 FTS5 테이블/트리거는 삭제)
+    같은 DB 경로에 대해서는 프로세스당 한 번만 실제 점검을 수행합니다.
+    """
+    db_path = db_path or DB_PATH
+    if db_path in _schema_ready_paths:
+        return
+    cursor = conn.cursor()
+    existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(books)")}
+    if not existing_columns:
+        return # books 테이블이 아직 없음 (create_library_table에서 다시 호출됨)
+    for column, column_type in DERIVED_COLUMN_TYPES:
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE books ADD COLUMN {column} {column_type}")
+    cursor.execute("CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT)")
+    stored_version = cursor.execute("SELECT value FROM catalog_meta WHERE key = 'normalization_version'").fetchone()
+    # 정규화 규칙이 바뀌었으면 모든 행의 파생 컬럼을, 아니면 비어 있는 행만 다시 계산
+    refill_all = stored_version is None or stored_version[0] != NORMALIZATION_VERSION
+    fill_condition = "" if refill_all else " WHERE title_norm IS NULL OR author_norm IS NULL OR shelf_prefix IS NULL"
+    rows_to_fill = cursor.execute(f"SELECT rowid, {', '.join(CSV_LOAD_COLUMNS)} FROM books{fill_condition}").fetchall()
+    if rows_to_fill:
+        cursor.executemany(
+            f"UPDATE books SET {', '.join(f'{column} = ?' for column in DERIVED_COLUMNS)} WHERE rowid = ?",
+            [_derived_columns(row[1:]) + (row[0],) for row in rows_to_fill]
+        )
+    if refill_all:
+        cursor.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('normalization_version', ?)", (NORMALIZATION_VERSION,))
+        _bump_catalog_version(cursor) # 정규화 컬럼이 바뀌었으니 메모리 색인도 새로 만들도록
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_title_norm ON books(title_norm)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_books_shelf ON books(shelf_prefix, {SHELF_ORDER.replace(', rowid', '')})")
+    conn.commit()
+
+    # 이전 버전이 만든 FTS5(trigram) 테이블/트리거 정리: 포함 검색은 title_norm 인덱스와 제목 n-gram 색인이 맡으므로
+    # 조회에 쓰이지 않으면서 쓰기/재적재마다 트리거 비용만 들던 것을 없앰
+    cursor.executescript("""
+        DROP TRIGGER IF EXISTS books_fts_ai;
+        DROP TRIGGER IF EXISTS books_fts_ad;
+        DROP TRIGGER IF EXISTS books_fts_au;
+        DROP TABLE IF EXISTS books_fts;
+    """)
+    conn.commit()
+    _schema_ready_paths.add(db_path)
+
 def load_csv_to_library_db(csv_file_path):
     """CSV 파일에서 도서 정보를 읽어와 DB에 저장합니다."""
     if not os.path.exists(csv_file_path):
         print(f"이런! CSV 파일 '{csv_file_path}'을 찾을 수 없어요. 경로를 확인해주세요!")
         return
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_write_connection()
+    ensure_books_schema(conn)
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM books")
+    cursor.execute("DELETE FROM books") # 커밋 전까지 읽기 연결에는 기존 데이터가 그대로 보임 (WAL)
     print("기존 도서 데이터를 모두 삭제했습니다. (새로 로드 준비)")
 
     try:
@@ -41,21 +173,20 @@ def load_csv_to_library_db(csv_file_path):
             csv_reader = csv.DictReader(file)
             books_to_insert = []
             for row in csv_reader:
-                books_to_insert.append((
-                    row.get('isbn', '').strip(),
-                    row.get('title', '').strip(),
-                    row.get('author', ''),
-                    row.get('publisher', ''),
-                    row.get('call_number', ''),
-                    row.get('publication_year', ''),
-                    row.get('description', ''),
-                    row.get('status', '소장중') # 기본값을 '소장중'으로 하는 것이 좋아 보입니다.
-                ))
-            cursor.executemany("""
-                INSERT OR IGNORE INTO books (isbn, title, author, publisher, call_number, publication_year, description, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                isbn = clean_isbn(row.get('isbn', '')) # 증분 동기화(sync_csv_to_library_db)와 같은 키를 써야 다음 동기화가 전부 삭제/추가로 보지 않음
+                if not isbn:
+                    continue
+                book_values = _book_values_from_csv_row(row, isbn)
+                books_to_insert.append(book_values + _derived_columns(book_values))
+            cursor.executemany(f"""
+                INSERT OR IGNORE INTO books ({', '.join(CSV_LOAD_COLUMNS + DERIVED_COLUMNS)})
+                VALUES ({', '.join('?' * len(CSV_LOAD_COLUMNS + DERIVED_COLUMNS))})
             """, books_to_insert) # 중복 ISBN 로드 시 무시하도록 INSERT OR IGNORE 사용
+            # 전체 재적재 뒤 첫 증분 동기화는 체크섬으로 건너뛰지 않고 한 번 비교하도록 기록 삭제
+            cursor.execute("DELETE FROM catalog_meta WHERE key = 'csv_checksum'")
+            _bump_catalog_version(cursor)
             conn.commit()
+            refresh_catalog() # 새 버전의 메모리 인덱스를 만들어 교체
             print(f"🎉 CSV 파일 '{csv_file_path}'에서 {len(books_to_insert)}건의 도서 정보를 DB에 성공적으로 로드했어요!")
     except FileNotFoundError:
         print(f"😿 이런! CSV 파일 '{csv_file_path}'을 찾을 수 없어요. 경로를 확인해주세요!")
@@ -64,21 +195,169 @@ def load_csv_to_library_db(csv_file_path):
     finally:
         conn.close()
 
+def _book_values_from_csv_row(row, isbn):
+    """CSV 한 행을 CSV_LOAD_COLUMNS 순서의 튜플로 변환"""
+    return (
+        isbn,
+        row.get('title', '').strip(),
+        row.get('author', ''),
+        row.get('publisher', ''),
+        row.get('call_number', ''),
+        row.get('publication_year', ''),
+        row.get('description', ''),
+        row.get('status', '소장중') # 기본값을 '소장중'으로 하는 것이 좋아 보입니다.
+    )
+
+def _derived_columns(book_values):
+    """CSV_LOAD_COLUMNS 순서 튜플 -> DERIVED_COLUMNS 순서 튜플 (정규화/청구기호 분해는 적재 시 한 번만 계산해 저장)"""
+    call_number = parse_call_number(book_values[4]) or {}
+    return (
+        normalize_text_for_matching(book_values[1]),
+        normalize_text_for_matching(book_values[2]),
+        call_number.get("shelf_prefix", ""), # 분해 불가한 청구기호도 ''로 채워 '계산 완료' 표시
+        call_number.get("kdc_class"),
+        call_number.get("author_mark"),
+        call_number.get("volume"),
+        call_number.get("volume_sort"),
+        call_number.get("copy_number"),
+    )
+
+# 예: "813.6 김294가 v.3 c.2", "W 909 D285h v.12", "D 813.8 김94ㅁ"
+CALL_NUMBER_PATTERN = re.compile(
+    r"^(?:(?P<prefix>[A-Za-z가-힣]{1,3})\s+)?(?P<kdc>\d{1,3}(?:\.\d*)?)\s+(?P<mark>\S+)"
+    r"(?:\s+v\.(?P<volume>\S+))?(?:\s+c\.(?P<copy>\d+))?"
+)
+
+def parse_call_number(call_number):
+    """
+    청구기호를 (별치기호, KDC 분류번호, 저자기호, 권차, 복본) 으로 분해합니다.
+    반환: {"shelf_prefix", "kdc_class"(float), "author_mark", "volume", "volume_sort", "copy_number"} 또는 None(해석 불가)
+    """
+    if not isinstance(call_number, str):
+        return None
+    text = call_number.strip().replace(",", ".").replace("..", ".") # "320,911", "199..1" 같은 입력 오타 보정
+    match = CALL_NUMBER_PATTERN.match(text)
+    if not match:
+        return None
+    volume = match.group("volume")
+    volume_digits = re.search(r"\d+", volume) if volume else None
+    return {
+        "shelf_prefix": (match.group("prefix") or "").upper(),
+        "kdc_class": float(match.group("kdc").rstrip(".")),
+        "author_mark": match.group("mark"),
+        "volume": volume,
+        "volume_sort": int(volume_digits.group()) if volume_digits else 0,
+        "copy_number": int(match.group("copy")) if match.group("copy") else 1,
+    }
+
+def file_checksum(file_path):
+    """파일 내용의 SHA-256 체크섬 (큰 파일도 조각 단위로 읽음)"""
+    digest = hashlib.sha256()
+    with open(file_path, mode='rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _iter_csv_chunks(csv_file_path, chunk_size):
+    """csv.DictReader 행을 chunk_size개씩 끊어서 내보냄 (CSV 전체를 메모리에 올리지 않음)"""
+    with open(csv_file_path, mode='r', encoding='utf-8-sig') as file:
+        chunk = []
+        for row in csv.DictReader(file):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+def sync_csv_to_library_db(csv_file_path, chunk_size=SYNC_CHUNK_SIZE, force=False):
+    """
+    CSV 파일과 DB를 증분 동기화합니다. (전체 삭제 후 재적재 대신 사용)
+    - 정리된 ISBN(clean_isbn)을 키로, CSV를 chunk_size 행씩 읽으며 새 행은 추가, 바뀐 행만 갱신
+    - CSV에서 사라진 ISBN의 행은 삭제, ISBN이 없는 행과 같은 ISBN의 두 번째 이후 행은 건너뜀
+    - CSV 체크섬이 지난 동기화와 같으면 (force가 아니면) 아무것도 하지 않음
+    - 전체 작업이 한 트랜잭션이라 읽기 쪽은 동기화 전/후 중 한쪽만 보고, 빈 테이블을 보는 순간이 없음
+    반환: {"inserted", "updated", "deleted", "unchanged", "skipped_rows", "skipped_unchanged_file"} 건수 dict
+    """
+    report = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "skipped_rows": 0, "skipped_unchanged_file": False}
+    if not os.path.exists(csv_file_path):
+        print(f"이런! CSV 파일 '{csv_file_path}'을 찾을 수 없어요. 경로를 확인해주세요!")
+        return None
+
+    checksum = file_checksum(csv_file_path)
+    conn = get_write_connection()
+    try:
+        ensure_books_schema(conn)
+        cursor = conn.cursor()
+        previous = cursor.execute("SELECT value FROM catalog_meta WHERE key = 'csv_checksum'").fetchone()
+        if previous and previous[0] == checksum and not force:
+            report["skipped_unchanged_file"] = True
+            print(f"📚 CSV 파일 '{csv_file_path}'이 지난 동기화 이후 바뀌지 않아 건너뛰었어요.")
+            return report
+
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS sync_seen_isbns (isbn TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM sync_seen_isbns")
+        select_existing = f"SELECT {', '.join(CSV_LOAD_COLUMNS)} FROM books WHERE isbn IN (SELECT value FROM json_each(?))"
+        upsert = f"""
+            INSERT INTO books ({', '.join(CSV_LOAD_COLUMNS + DERIVED_COLUMNS)})
+            VALUES ({', '.join('?' * len(CSV_LOAD_COLUMNS + DERIVED_COLUMNS))})
+            ON CONFLICT(isbn) DO UPDATE SET
+                {', '.join(f'{column} = excluded.{column}' for column in CSV_LOAD_COLUMNS[1:] + DERIVED_COLUMNS)}
+        """
+
+        for rows in _iter_csv_chunks(csv_file_path, chunk_size):
+            chunk_books = {} # 정리된 ISBN -> CSV 값 튜플 (청크 안에서도 첫 행만 사용)
+            for row in rows:
+                isbn = clean_isbn(row.get('isbn', ''))
+                if not isbn or isbn in chunk_books:
+                    report["skipped_rows"] += 1
+                    continue
+                chunk_books[isbn] = _book_values_from_csv_row(row, isbn)
+
+            chunk_isbns_json = json.dumps(list(chunk_books))
+            already_seen = cursor.execute("SELECT isbn FROM sync_seen_isbns WHERE isbn IN (SELECT value FROM json_each(?))", (chunk_isbns_json,)).fetchall()
+            for (isbn,) in already_seen: # 이전 청크에서 이미 나온 ISBN
+                del chunk_books[isbn]
+                report["skipped_rows"] += 1
+            cursor.executemany("INSERT INTO sync_seen_isbns (isbn) VALUES (?)", [(isbn,) for isbn in chunk_books])
+
+            existing = {row[0]: tuple(row) for row in cursor.execute(select_existing, (json.dumps(list(chunk_books)),))}
+            changed = []
+            for isbn, book_values in chunk_books.items():
+                if isbn not in existing:
+                    report["inserted"] += 1
+                elif existing[isbn] != book_values:
+                    report["updated"] += 1
+                else:
+                    report["unchanged"] += 1
+                    continue
+                changed.append(book_values + _derived_columns(book_values))
+            if changed:
+                cursor.executemany(upsert, changed)
+
+        cursor.execute("DELETE FROM books WHERE isbn NOT IN (SELECT isbn FROM sync_seen_isbns)")
+        report["deleted"] = cursor.rowcount
+        cursor.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('csv_checksum', ?)", (checksum,))
+        if report["inserted"] or report["updated"] or report["deleted"]:
+            _bump_catalog_version(cursor)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"😿 CSV 동기화 중 오류 발생! (DB는 동기화 전 상태 그대로): {e}")
+        return None
+    finally:
+        conn.close()
+
+    if report["inserted"] or report["updated"] or report["deleted"]:
+        refresh_catalog()
+    print(f"🎉 CSV 동기화 완료! 추가 {report['inserted']}건 / 변경 {report['updated']}건 / 삭제 {report['deleted']}건 / 그대로 {report['unchanged']}건 (건너뛴 행 {report['skipped_rows']}건)")
+    return report
+
 def clean_isbn(isbn):
     """ISBN의 하이픈, 공백, 대소문자 X 등 불필요한 문자 모두 제거"""
     if not isbn: return ''
     return ''.join(filter(lambda x: x.isdigit() or x.upper() == 'X', str(isbn))).upper()
 
-def normalize_text_for_matching(text_str):
-    """검색 및 비교를 위해 텍스트를 정규화합니다 (소문자, 공백/일부 특수문자 제거)."""
-    if not isinstance(text_str, str):
-        return ""
-    processed_text = text_str.lower()
-    # 제거할 일반적인 특수문자 및 공백 처리 (필요에 따라 확장)
-    for char_to_remove in [" ", "-", ":", ",", ".", "'", '"', "[", "]", "(", ")", "/", "\\", "&", "#", "+", "_", "~", "!", "?", "*"]:
-        processed_text = processed_text.replace(char_to_remove, "")
-    return processed_text
-
 def isbn10_to_isbn13(isbn10):
     """ISBN-10을 ISBN-13으로 변환 (문자열 반환, 하이픈 등 제거 자동)"""
     isbn10 = clean_isbn(isbn10)
@@ -126,89 +405,494 @@ def is_isbn_match(query_isbn, db_isbn):
     if not query_isbn or not db_isbn: return False
     return len(all_isbn_versions(query_isbn).intersection(all_isbn_versions(db_isbn))) > 0
 
+class CatalogIndex:
+    """도서 행 목록을 한 번 읽어 ISBN-10/13 모든 버전 -> 도서 행(dict)으로 매핑하는 메모리 인덱스."""
+
+    def __init__(self, rows):
+        self.row_count = 0
+        self._by_isbn = {} # ISBN 버전 -> (테이블 순서, 도서 dict)
+        for position, book_tuple in enumerate(rows):
+            book = dict(zip(BOOK_COLUMNS, book_tuple))
+            self.row_count += 1
+            for version in all_isbn_versions(book["isbn"]):
+                # 같은 ISBN이 여러 행에 있으면 기존 동작(테이블 순서상 첫 행)과 같도록 먼저 들어온 행 유지
+                self._by_isbn.setdefault(version, (position, book))
+
+    def lookup(self, isbn_query):
+        """ISBN 버전 세트 중 하나라도 인덱스에 있으면 해당 도서 dict(복사본)를, 없으면 None 반환"""
+        hits = [self._by_isbn[v] for v in all_isbn_versions(isbn_query) if v in self._by_isbn]
+        if not hits:
+            return None
+        return dict(min(hits, key=lambda hit: hit[0])[1]) # 여러 버전이 걸리면 테이블 순서상 앞선 행
+
+# --- 카탈로그 버전과 메모리 인덱스 교체 ---
+# DB 내용이 바뀔 때마다 catalog_meta의 catalog_version을 올리고(같은 트랜잭션),
+# 새 버전의 인덱스는 CatalogState로 옆에서 다 만든 뒤 참조 하나만 바꿔 끼웁니다.
+# 도서관 조회 단계는 pinned_catalog()로 읽기 트랜잭션과 그 시점의 CatalogState를 함께 잡아 단계 안에서는 같은 카탈로그를 봅니다.
+# (열린 읽기 트랜잭션은 WAL 체크포인트를 막으므로 네트워크 호출을 기다리는 동안에는 잡지 않습니다)
+
+def _read_catalog_version(conn):
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'catalog_version'").fetchone()
+    return int(row[0]) if row else 0
+
+def _bump_catalog_version(cursor):
+    """카탈로그 버전 올리기 (쓰기 트랜잭션 안에서 호출). 버전은 갱신 시각(초) 기반이라 항상 증가"""
+    version = max(_read_catalog_version(cursor) + 1, int(time.time()))
+    cursor.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('catalog_version', ?)", (str(version),))
+    return version
+
+class CatalogState:
+    """특정 카탈로그 버전의 메모리 인덱스 묶음. 만든 뒤에는 바뀌지 않고, 새 버전은 새 객체로 통째 교체"""
+
+    def __init__(self, db_path, version, row_count, snapshot=None, isbn_index=None, title_index=None, search_index=None):
+        self.db_path = db_path
+        self.version = version
+        self.row_count = row_count
+        self.loaded_at = datetime.now()
+        self.snapshot = snapshot # 같은 버전의 mmap 스냅샷 (ISBN 조회용, 여러 프로세스가 같은 페이지를 공유)
+        self.isbn_index = isbn_index # 스냅샷을 쓸 수 없을 때만 사용하는 메모리 ISBN 인덱스
+        self._title_indexes = {False: title_index} if title_index is not None else {}
+        self._title_index_lock = threading.Lock()
+        self._search_index = search_index
+
+    def lookup_isbn(self, isbn_query):
+        """도서 dict 또는 None"""
+        if self.snapshot is not None:
+            return self.snapshot.lookup(isbn_query, all_isbn_versions)
+        return self.isbn_index.lookup(isbn_query)
+
+    def title_index(self, use_jamo=False):
+        """제목/저자 n-gram 색인 (미리 만들어 두지 않은 종류는 처음 쓸 때 생성)"""
+        index = self._title_indexes.get(use_jamo)
+        if index is not None:
+            return index
+        with self._title_index_lock:
+            if use_jamo not in self._title_indexes:
+                self._title_indexes[use_jamo] = _build_title_index(get_read_connection(), use_jamo)
+            return self._title_indexes[use_jamo]
+
+    def search_index(self):
+        """소장 도서 BM25 색인 (카탈로그를 만들 때 같은 읽기 트랜잭션에서 읽거나 만들어 둔 것)"""
+        return self._search_index
+
+def _build_title_index(conn, use_jamo=False):
+    """payload는 books의 rowid (도서 행은 검색 후 _books_by_rowid로 DB에서 읽음)"""
+    cursor = conn.execute("SELECT rowid, title_norm, author_norm FROM books ORDER BY rowid")
+    return TitleNgramIndex(cursor.fetchall(), use_jamo=use_jamo)
+
+def catalog_search_index_path():
+    """DB 파일 옆의 BM25 색인 경로 (예: school_library.db -> school_library.bm25)"""
+    return os.path.splitext(DB_PATH)[0] + ".bm25"
+
+def _load_or_build_search_index(conn, version):
+    """같은 카탈로그 버전으로 저장해 둔 BM25 색인이 있으면 읽고, 없으면 만들어 저장"""
+    index = CatalogBM25Index.load(catalog_search_index_path(), version)
+    if index is not None:
+        return index
+    cursor = conn.execute("SELECT rowid, title, author, publisher, description FROM books ORDER BY rowid")
+    index = CatalogBM25Index(
+        ((rowid, {"title": title, "author": author, "publisher": publisher, "description": description})
+         for rowid, title, author, publisher, description in cursor),
+        catalog_version=version
+    )
+    try:
+        index.save(catalog_search_index_path())
+    except OSError as e: # 저장하지 못해도 이번 실행에서는 메모리 색인으로 검색 가능
+        print(f"🚨 소장 도서 검색 색인 저장 실패: {e}")
+    return index
+
+def _build_catalog_state(conn):
+    """
+    읽기 트랜잭션 중인 연결에서, 같은 시점의 버전과 행으로 새 CatalogState를 만듭니다.
+    ISBN 조회는 이 버전의 mmap 스냅샷으로 하고, 스냅샷이 없거나 버전이 다르면 이 자리에서 다시 써 둡니다.
+    (파일을 쓸 수 없는 환경에서만 행별 dict를 들고 있는 CatalogIndex로 대체)
+    제목 색인과 BM25 색인도 같은 트랜잭션에서 만들어 함께 넣으므로, 교체 뒤 첫 추천이 색인을 기다리지 않고
+    저장되는 .bm25 파일의 카탈로그 버전도 그 안의 행과 항상 같습니다.
+    """
+    version = _read_catalog_version(conn)
+    snapshot = _open_catalog_snapshot(version)
+    if snapshot is None:
+        rows = conn.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY rowid").fetchall()
+        try:
+            write_snapshot(rows, BOOK_COLUMNS, catalog_snapshot_path(), all_isbn_versions, version)
+            snapshot = _open_catalog_snapshot(version)
+        except OSError as e:
+            print(f"🚨 도서 스냅샷 저장 실패 (메모리 ISBN 인덱스로 조회): {e}")
+    if snapshot is not None:
+        state_kwargs = {"row_count": snapshot.row_count, "snapshot": snapshot}
+    else:
+        state_kwargs = {"row_count": len(rows), "isbn_index": CatalogIndex(rows)}
+    state_kwargs["title_index"] = _build_title_index(conn)
+    state_kwargs["search_index"] = _load_or_build_search_index(conn, version)
+    return CatalogState(DB_PATH, version, **state_kwargs)
+
+_current_catalog = None
+_catalog_lock = threading.Lock()
+
+def _install_catalog(state):
+    """새 CatalogState로 교체 (다른 스레드가 이미 더 새 버전을 넣었으면 그대로 둠)"""
+    global _current_catalog
+    with _catalog_lock:
+        current = _current_catalog
+        if current is None or current.db_path != state.db_path or state.version >= current.version:
+            _current_catalog = state
+        return _current_catalog
+
+def refresh_catalog():
+    """DB의 최신 버전으로 새 카탈로그(스냅샷, 제목/BM25 색인)를 옆에서 만든 뒤 한 번에 교체합니다."""
+    prepare_library_db()
+    conn = _open_read_connection()
+    try:
+        conn.execute("BEGIN") # 버전과 행을 같은 시점에서 읽기
+        state = _build_catalog_state(conn)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return _install_catalog(state)
+
+def refresh_catalog_if_changed():
+    """DB의 카탈로그 버전이 메모리 카탈로그와 다를 때만 refresh_catalog. 반환: 현재 CatalogState"""
+    current = _current_catalog
+    if current is None or current.db_path != DB_PATH or _read_catalog_version(get_read_connection()) != current.version:
+        return refresh_catalog()
+    return current
+
+def get_catalog():
+    """현재 스레드가 고정한 카탈로그(pinned_catalog 안) 또는 가장 최근 카탈로그"""
+    pinned = getattr(_thread_local, "pinned_catalog", None)
+    if pinned is not None:
+        return pinned
+    state = _current_catalog
+    if state is None or state.db_path != DB_PATH:
+        state = refresh_catalog()
+    return state
+
+@contextmanager
+def pinned_catalog():
+    """
+    with 블록 동안 현재 스레드의 모든 도서관 조회가 같은 카탈로그 버전을 보도록 고정합니다.
+    (SQLite 읽기 트랜잭션 + 같은 시점의 CatalogState. 블록 중간에 재적재/교체가 일어나도 영향 없음)
+    트랜잭션이 열려 있는 동안 WAL 체크포인트가 밀리므로, 조회 몇 번을 묶는 짧은 구간에만 쓰세요.
+    """
+    if getattr(_thread_local, "pinned_catalog", None) is not None: # 이미 고정된 상태면 그대로 사용
+        yield _thread_local.pinned_catalog
+        return
+    conn = get_read_connection()
+    conn.execute("BEGIN")
+    try:
+        version = _read_catalog_version(conn)
+        state = _current_catalog
+        if state is None or state.db_path != DB_PATH or state.version != version:
+            state = _build_catalog_state(conn) # 아직 교체 전이면 고정한 시점 그대로 직접 만듦
+            _install_catalog(state)
+        _thread_local.pinned_catalog = state
+        yield state
+    finally:
+        _thread_local.pinned_catalog = None
+        conn.execute("COMMIT")
+
+def get_catalog_status():
+    """사이드바 표시용 현재 카탈로그 정보: {"version", "row_count", "updated_at", "loaded_at"}"""
+    state = get_catalog()
+    return {
+        "version": state.version,
+        "row_count": state.row_count,
+        "updated_at": datetime.fromtimestamp(state.version) if state.version > 1_000_000_000 else None,
+        "loaded_at": state.loaded_at,
+    }
+
+# --- mmap 스냅샷 (여러 워커 프로세스가 같은 페이지를 공유하는 ISBN 조회용) ---
+def catalog_snapshot_path():
+    """DB 파일 옆의 스냅샷 경로 (예: school_library.db -> school_library.snapshot)"""
+    return os.path.splitext(DB_PATH)[0] + ".snapshot"
+
+def build_catalog_snapshot():
+    """books 테이블을 스냅샷 파일로 저장하고 카탈로그를 다시 불러옵니다. 반환: 저장한 행 수"""
+    prepare_library_db()
+    conn = _open_read_connection()
+    try:
+        conn.execute("BEGIN")
+        version = _read_catalog_version(conn)
+        rows = conn.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY rowid").fetchall()
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    row_count = write_snapshot(rows, BOOK_COLUMNS, catalog_snapshot_path(), all_isbn_versions, version)
+    print(f"🗂️ 도서 스냅샷 '{catalog_snapshot_path()}'에 {row_count}건을 저장했어요!")
+    refresh_catalog()
+    return row_count
+
+def _open_catalog_snapshot(version):
+    """스냅샷 파일이 있고 카탈로그 버전이 같으면 mmap으로 열어 반환, 아니면 None"""
+    try:
+        snapshot = CatalogSnapshot(catalog_snapshot_path(), BOOK_COLUMNS)
+    except (FileNotFoundError, ValueError):
+        return None
+    if snapshot.catalog_version != version:
+        snapshot.close()
+        return None
+    return snapshot
+
+def _lookup_isbn(isbn_query):
+    """현재 카탈로그(스냅샷 또는 메모리 ISBN 인덱스)에서 도서 dict를 찾음 (없으면 None)"""
+    return get_catalog().lookup_isbn(isbn_query)
+
+@traced("library.find_by_isbn", result_attributes=lambda result: {"found": bool(result.get("found_in_library"))})
 def find_book_in_library_by_isbn(isbn_query):
     """
     주어진 ISBN(숫자/문자/혼합, 10/13자리, 하이픈/공백 포함 가능)으로 도서관 DB에서 책을 검색.
     - ISBN-10/ISBN-13 모두 상호 변환해서 완벽히 매칭(섞여 있어도 문제 없음)
+    - 테이블 전체 스캔 대신 mmap 스냅샷 또는 메모리 ISBN 인덱스(CatalogIndex)에서 한 번에 찾음
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    # publication_year, description 컬럼도 함께 SELECT 하도록 수정 (필요시)
-    cursor.execute("SELECT isbn, title, author, publisher, call_number, status, publication_year, description FROM books")
-    books_from_db = cursor.fetchall() # 변수명 변경 (books_cache와의 혼동 방지)
-    conn.close()
-
     q_isbns = all_isbn_versions(isbn_query)
     if not q_isbns: return {"found_in_library": False, "error": "유효하지 않거나 빈 ISBN으로 검색 요청"}
 
-    for book_tuple in books_from_db:
-        db_isbn_raw = book_tuple[0]
-        # all_isbn_versions 함수는 이미 내부적으로 clean_isbn을 호출하므로, db_isbn_raw를 바로 사용 가능
-        db_isbns = all_isbn_versions(db_isbn_raw)
-        if q_isbns & db_isbns: # set의 교집합(&) 연산자로 일치하는 버전이 있는지 확인
-            return {
-                "isbn": book_tuple[0], "title": book_tuple[1], "author": book_tuple[2],
-                "publisher": book_tuple[3], "call_number": book_tuple[4], "status": book_tuple[5],
-                "publication_year": book_tuple[6], "description": book_tuple[7], # 추가된 필드 반환
-                "found_in_library": True
-            }
+    book = _lookup_isbn(isbn_query)
+    if book is not None:
+        book["found_in_library"] = True
+        return book
     return {"found_in_library": False, "isbn_searched": isbn_query} # 'error' 키 대신 검색한 ISBN 정보 등 전달
 
-def find_book_in_library_by_title_author(title_query, author_query):
-    """주어진 책 제목과 저자로 DB에서 책을 찾아 반환합니다."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    # publication_year, description 컬럼도 함께 SELECT 하도록 수정
-    cursor.execute("SELECT isbn, title, author, publisher, call_number, status, publication_year, description FROM books")
-    books_from_db = cursor.fetchall()
-    conn.close()
-    
+def _title_substrings(normalized_title):
+    """정규화된 제목의 모든 (중복 없는) 부분 문자열. 'DB 제목이 검색 제목에 포함'되는 경우를 인덱스로 찾기 위해 사용"""
+    length = len(normalized_title)
+    return sorted({normalized_title[i:j] for i in range(length) for j in range(i + 1, length + 1)})
+
+def _match_title_author(title_query, author_query):
+    """
+    제목/저자 매칭 한 건 (find_book_in_library_by_title_author, 일괄 조회 공용)
+    - 제목: 정규화 문자열 기준 양방향 포함(검색어 ⊂ DB 제목 또는 DB 제목 ⊂ 검색어)
+    - 저자: 저자 검색어가 없으면 통과, 있으면 같은 방식의 양방향 포함
+    - 조건을 만족하는 후보 중 제목/저자 n-gram 유사도가 가장 높은 책 (동점이면 테이블 순서상 앞선 책)
+    검색어 ⊂ DB 제목 후보는 카탈로그의 제목 n-gram 색인에서 검색어 n-gram을 모두 가진 제목(색인 목록 교집합)만,
+    DB 제목 ⊂ 검색어 후보는 검색어의 부분 문자열을 title_norm 인덱스로 정확히 찾아 합친 뒤, 이 후보들만 유사도로 순위를 매깁니다.
+    (카탈로그 크기가 아니라 후보 수에 비례하는 비용, 한 글자 소장 제목처럼 검색어와 n-gram이 겹치지 않는 책도 빠지지 않음)
+    반환: match_score가 포함된 도서 dict 또는 None (정규화된 제목이 비어 있으면 None)
+    """
     normalized_title_query = normalize_text_for_matching(title_query)
     normalized_author_query = normalize_text_for_matching(author_query)
-
     if not normalized_title_query:
+        return None
+    if author_query and not normalized_author_query:
+        return None # 저자 검색어가 정규화 후 비면 기존과 같이 저자 불일치로 처리
+
+    # 1) 검색어 ⊂ DB 제목
+    if len(normalized_title_query) >= 2:
+        candidate_rowids = get_title_ngram_index().containing(normalized_title_query)
+        contains_clause = "(rowid IN (SELECT value FROM json_each(?)) AND instr(title_norm, ?) > 0)"
+        params = [json.dumps(candidate_rowids), normalized_title_query]
+        limit = ""
+    else: # 한 글자 검색어는 n-gram(음절 bigram)이 없어 색인으로 찾을 수 없으므로 DB 안의 instr()로 처리
+        contains_clause = "instr(title_norm, ?) > 0"
+        params = [normalized_title_query]
+        limit = f" LIMIT {TITLE_MATCH_CANDIDATE_LIMIT}"
+    # 2) DB 제목 ⊂ 검색어: 검색어의 부분 문자열 집합과 title_norm 인덱스 비교
+    params.append(json.dumps(_title_substrings(normalized_title_query), ensure_ascii=False))
+    title_clause = f"({contains_clause} OR title_norm IN (SELECT value FROM json_each(?)))"
+
+    if not normalized_author_query:
+        author_clause = "1"
+    else:
+        author_clause = "(author_norm != '' AND (instr(author_norm, ?) > 0 OR instr(?, author_norm) > 0))"
+        params += [normalized_author_query, normalized_author_query]
+
+    rows = get_read_connection().execute(
+        f"SELECT {', '.join(BOOK_COLUMNS)}, title_norm, author_norm FROM books "
+        f"WHERE title_norm != '' AND {title_clause} AND {author_clause} ORDER BY rowid{limit}",
+        params
+    ).fetchall() # fetchall로 문장을 끝까지 소비해 읽기 스냅샷을 붙잡아 두지 않음
+    if not rows:
+        return None
+    # 판본/시리즈 권이 여러 개 걸릴 때 단순히 첫 행 대신 검색어와 가장 비슷한 책을 고름 (max는 동점 시 앞선 행 유지)
+    best_score, best_row = max(
+        ((title_author_similarity(normalized_title_query, normalized_author_query, row[-2], row[-1]), row) for row in rows),
+        key=lambda scored: scored[0]
+    )
+    book = dict(zip(BOOK_COLUMNS, best_row))
+    book["found_in_library"] = True
+    book["match_type"] = "title_author_match"
+    book["match_score"] = round(best_score, 3)
+    return book
+
+@traced("library.find_by_title_author", result_attributes=lambda result: {"found": bool(result.get("found_in_library"))})
+def find_book_in_library_by_title_author(title_query, author_query):
+    """
+    주어진 책 제목과 저자로 DB에서 책을 찾아 반환합니다.
+    - 제목: 양방향 포함(검색어 ⊂ 소장 제목 또는 소장 제목 ⊂ 검색어), 저자: 검색어가 있으면 같은 방식의 양방향 포함
+    - 조건을 만족하는 책 중 제목/저자 n-gram 유사도(match_score, 0~1)가 가장 높은 책을 반환 (카탈로그 n-gram 색인 사용)
+    """
+    if not normalize_text_for_matching(title_query):
         return {"found_in_library": False, "error": "검색할 도서명이 제공되지 않았습니다."}
 
-    matched_books = []
-    for book_tuple in books_from_db:
-        db_isbn_raw = book_tuple[0] 
-        db_title_raw = book_tuple[1]
-        db_author_raw = book_tuple[2]
-        
-        normalized_db_title = normalize_text_for_matching(db_title_raw)
-        normalized_db_author = normalize_text_for_matching(db_author_raw)
-        
-        title_match = False
-        if normalized_title_query and normalized_db_title and \
-           (normalized_title_query in normalized_db_title or normalized_db_title in normalized_title_query):
-            title_match = True
-        
-        author_match = False
-        if not author_query: 
-            author_match = True
-        elif normalized_author_query and normalized_db_author and \
-             (normalized_author_query in normalized_db_author or normalized_db_author in normalized_author_query):
-            author_match = True
-            
-        if title_match and author_match:
-            matched_books.append({
-                "isbn": db_isbn_raw, 
-                "title": db_title_raw,
-                "author": db_author_raw,
-                "publisher": book_tuple[3],
-                "call_number": book_tuple[4],
-                "status": book_tuple[5],
-                "publication_year": book_tuple[6], # 추가된 필드 반환
-                "description": book_tuple[7],      # 추가된 필드 반환
-                "found_in_library": True,
-                "match_type": "title_author_match"
-            })
-            
-    if matched_books:
-        return matched_books[0] # 간단히 첫 번째 찾은 책 반환
-        
+    book = _match_title_author(title_query, author_query)
+    if book:
+        return book
     return {"found_in_library": False, "title_searched": title_query, "author_searched": author_query}
 
+def _books_by_rowid(conn, rowids):
+    """rowid 목록 -> {rowid: 도서 dict} (색인 검색 결과를 도서 행으로 바꿀 때 사용)"""
+    rows = conn.execute(
+        f"SELECT rowid, {', '.join(BOOK_COLUMNS)} FROM books WHERE rowid IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(rowids)),)
+    ).fetchall()
+    return {row[0]: dict(zip(BOOK_COLUMNS, row[1:])) for row in rows}
+
+# --- 제목/저자 n-gram 색인 (순위가 매겨진 유사 제목 검색용) ---
+def get_title_ngram_index(use_jamo=False):
+    """현재 카탈로그의 title_norm/author_norm n-gram 색인 (카탈로그가 교체되면 함께 바뀜)"""
+    return get_catalog().title_index(use_jamo)
+
+@traced("library.search_ranked", result_attributes=lambda result: {"results": len(result)})
+def search_library_by_title_author_ranked(title_query, author_query="", top_k=5, use_jamo=False, min_score=0.3):
+    """
+    제목(+저자) 유사도 상위 top_k권을 점수 순으로 반환합니다. (포함 관계가 아니어도 비슷하면 찾음)
+    - 음절 bigram(기본) 또는 자모 trigram(use_jamo=True, 오타/받침 차이에 강함) 색인 사용
+    반환: match_score(0~1)와 match_type "ranked_title_match"가 들어 있는 도서 dict 목록
+    """
+    normalized_title_query = normalize_text_for_matching(title_query)
+    if not normalized_title_query:
+        return []
+    index = get_title_ngram_index(use_jamo)
+    hits = index.search(normalized_title_query, normalize_text_for_matching(author_query), top_k, min_score)
+    books_by_rowid = _books_by_rowid(get_read_connection(), [rowid for _, rowid in hits])
+    matches = []
+    for score, rowid in hits:
+        book = books_by_rowid.get(rowid)
+        if book is None:
+            continue
+        book["found_in_library"] = True
+        book["match_type"] = "ranked_title_match"
+        book["match_score"] = round(score, 3)
+        matches.append(book)
+    return matches
+
+# --- 소장 도서 직접 검색 (카카오 없이 검색어로 BM25 검색) ---
+@traced("library.search", result_attributes=lambda result: {"results": len(result)})
+def search_library_catalog(queries, top_k=20):
+    """
+    검색어 목록으로 소장 도서를 BM25 검색합니다. 여러 검색어에 걸리는 책일수록 앞에 오도록
+    검색어별 점수를 1등 점수로 나눈 값을 더해 정렬하고, 같은 ISBN(복본)은 한 번만 반환합니다.
+    반환: [도서 dict + found_in_library/match_type("local_retrieval")/match_score, ...]
+    """
+    queries = [query for query in queries if isinstance(query, str) and query.strip()]
+    if not queries:
+        return []
+    try:
+        index = get_catalog().search_index()
+        combined_scores = {}
+        for query in queries:
+            hits = index.search(query, top_k=LOCAL_SEARCH_TOP_K_PER_QUERY)
+            if not hits:
+                continue
+            top_score = hits[0][0]
+            for score, rowid in hits:
+                combined_scores[rowid] = combined_scores.get(rowid, 0.0) + score / top_score
+        ranked_rowids = sorted(combined_scores, key=lambda rowid: (-combined_scores[rowid], rowid))
+        if not ranked_rowids:
+            return []
+        books_by_rowid = _books_by_rowid(get_read_connection(), ranked_rowids)
+    except sqlite3.Error as e:
+        print(f"🚨 소장 도서 검색 오류: {e}")
+        return []
+    results, seen_isbns = [], set()
+    for rowid in ranked_rowids:
+        book = books_by_rowid.get(rowid)
+        if book is None:
+            continue
+        isbn_key = min(all_isbn_versions(book["isbn"]), default="") # ISBN-10/13 어느 쪽이든 같은 키
+        if isbn_key and isbn_key in seen_isbns:
+            continue
+        seen_isbns.add(isbn_key)
+        book.update({"found_in_library": True, "match_type": "local_retrieval",
+                     "match_score": round(combined_scores[rowid] / len(queries), 3)})
+        results.append(book)
+        if len(results) >= top_k:
+            break
+    return results
+
+# --- 청구기호(KDC) 서가 탐색 ---
+SHELF_BOOK_COLUMNS = BOOK_COLUMNS + ("shelf_prefix", "kdc_class", "author_mark", "volume")
+
+def _shelf_books(rows):
+    books = []
+    for row in rows:
+        book = dict(zip(SHELF_BOOK_COLUMNS, row))
+        book["found_in_library"] = True
+        books.append(book)
+    return books
+
+@traced("library.browse_shelf", result_attributes=lambda result: {"results": len(result["books"]), "total": result["total"]})
+def browse_shelf_by_kdc_range(kdc_start, kdc_end, page=1, page_size=20, shelf_prefix=""):
+    """
+    KDC 분류번호가 kdc_start 이상 kdc_end 미만인 소장 도서를 서가 순서(분류번호, 저자기호, 권차, 복본)로 반환합니다.
+    - 예: 400번대 전체는 browse_shelf_by_kdc_range(400, 500)
+    - shelf_prefix: 별치기호 (''는 일반 서가, "W"/"C" 등은 해당 별치 서가)
+    반환: {"books", "page", "page_size", "total", "has_next"}
+    """
+    page = max(1, int(page))
+    page_size = max(1, int(page_size))
+    conn = get_read_connection()
+    where = "shelf_prefix = ? AND kdc_class >= ? AND kdc_class < ?"
+    params = (shelf_prefix.upper(), kdc_start, kdc_end)
+    total = conn.execute(f"SELECT COUNT(*) FROM books WHERE {where}", params).fetchone()[0]
+    rows = conn.execute(
+        f"SELECT {', '.join(SHELF_BOOK_COLUMNS)} FROM books WHERE {where} ORDER BY {SHELF_ORDER} LIMIT ? OFFSET ?",
+        params + (page_size, (page - 1) * page_size)
+    ).fetchall()
+    return {"books": _shelf_books(rows), "page": page, "page_size": page_size, "total": total, "has_next": page * page_size < total}
+
+@traced("library.shelf_neighbors", result_attributes=lambda result: {"found": bool(result.get("found_in_library"))})
+def find_shelf_neighbors(isbn_query, before=3, after=3):
+    """
+    ISBN으로 찾은 소장 도서 기준으로 같은 서가에서 바로 앞/뒤에 꽂혀 있는 책들을 반환합니다.
+    반환: {"found_in_library", "book", "before"(서가 순서, 가까운 책이 마지막), "after"(서가 순서)} 또는 오류 dict
+    """
+    book = _lookup_isbn(isbn_query)
+    if book is None:
+        return {"found_in_library": False, "isbn_searched": isbn_query}
+    conn = get_read_connection()
+    shelf_key = conn.execute(
+        f"SELECT shelf_prefix, {SHELF_ORDER} FROM books WHERE isbn = ?", (book["isbn"],)
+    ).fetchone()
+    if not shelf_key or shelf_key[1] is None:
+        return {"found_in_library": True, "book": book, "before": [], "after": [], "error": "청구기호를 해석할 수 없어 서가 위치를 알 수 없어요."}
+    select = f"SELECT {', '.join(SHELF_BOOK_COLUMNS)} FROM books WHERE shelf_prefix = ? AND ({SHELF_ORDER})"
+    before_rows = conn.execute(
+        f"{select} < (?, ?, ?, ?, ?) ORDER BY {', '.join(f'{c} DESC' for c in SHELF_ORDER.split(', '))} LIMIT ?",
+        shelf_key + (before,)
+    ).fetchall()
+    after_rows = conn.execute(f"{select} > (?, ?, ?, ?, ?) ORDER BY {SHELF_ORDER} LIMIT ?", shelf_key + (after,)).fetchall()
+    return {"found_in_library": True, "book": book, "before": _shelf_books(reversed(before_rows)), "after": _shelf_books(after_rows)}
+
+@traced("library.find_bulk", result_attributes=lambda results: {"items": len(results), "found": sum(1 for result in results if result.get("found_in_library"))})
+def find_books_in_library_bulk(book_docs):
+    """
+    카카오 검색 결과 doc 목록의 소장 여부를 한 번에 확인합니다.
+    - 각 doc의 cleaned_isbn으로 먼저 ISBN 인덱스(또는 스냅샷)를 조회하고, 못 찾은 doc만 제목/첫 번째 저자로 재검색
+    - 제목/저자 검색은 카탈로그의 제목 n-gram 색인으로 처리 (doc마다 연결/전체 스캔 반복 없음)
+    반환: 입력과 같은 순서의 결과 dict 목록. 각 결과의 match_type은 "isbn_match" / "title_author_match" / "none"
+    """
+    results = [None] * len(book_docs)
+    pending_title_author = [] # (위치, 제목, 주 저자)
+
+    for position, doc in enumerate(book_docs):
+        isbn = doc.get('cleaned_isbn', '')
+        book = _lookup_isbn(isbn) if isbn else None
+        if book is not None:
+            book["found_in_library"] = True
+            book["match_type"] = "isbn_match"
+            results[position] = book
+            continue
+        authors = doc.get('authors') or []
+        title = doc.get('title', '')
+        if title:
+            pending_title_author.append((position, title, authors[0] if authors else ""))
+
+    for position, title, main_author in pending_title_author:
+        results[position] = _match_title_author(title, main_author)
+
+    return [result if result else {"found_in_library": False, "match_type": "none"} for result in results]
+
 # --- 직접 실행시 DB 초기화 및 테스트 코드 (원하는 경우만 사용) ---
 if __name__ == "__main__":
     print("🏫 학교 도서관 DB 설정을 시작합니다...")
@@ -218,7 +902,8 @@ if __name__ == "__main__":
     script_dir = os.path.dirname(__file__)
     csv_file_full_path = os.path.join(script_dir, csv_filename)
 
-    load_csv_to_library_db(csv_file_full_path)
+    sync_csv_to_library_db(csv_file_full_path) # 바뀐 행만 반영 (전체 재적재는 load_csv_to_library_db)
+    build_catalog_snapshot() # 여러 워커가 mmap으로 공유할 ISBN 조회용 스냅샷
 
     print("\n--- DB 테스트 ---")
     test_isbn_list = [
@@ -250,5 +935,9 @@ if __name__ == "__main__":
             print(f"✅ [Title/Author Test] '{title} ({author})' 책 찾음!: {book_info['title']} (ISBN: {book_info['isbn']})")
         else:
             print(f"❌ [Title/Author Test] '{title} ({author})' 책 없음. 오류: {book_info.get('error', '정보 없음')}")
+
+    print("\n--- 소장 도서 직접 검색 테스트 ---")
+    for book_info in search_library_catalog(["우주 과학", "블랙홀"], top_k=3):
+        print(f"🔎 [Local Search Test] {book_info['title']} (점수: {book_info['match_score']}, 청구기호: {book_info['call_number']})")
             
     print("\n🏫 학교 도서관 DB 설정 및 테스트 완료!")
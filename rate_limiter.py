@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_RESET_TIMEZONE = ZoneInfo("America/Los_Angeles") # Gemini 일일 한도는 태평양 시간 자정에 초기화
+except Exception: # tzdata가 없는 환경이면 서버 현지 시각 기준
+    QUOTA_RESET_TIMEZONE = None
+
+# 프로세스 전체가 공유하는 분당(RPM) 토큰 버킷 + 일일(RPD) 예산.
+# - 분당: 용량 RPM, 초당 RPM/60개씩 채워지는 토큰 버킷. 기다리는 호출은 도착 순서(FIFO)대로 토큰을 받으므로
+#   여러 Streamlit 세션이 번갈아 공정하게 처리됩니다.
+# - 일일: 추천 한 번에 필요한 호출 수를 시작할 때 reserve()로 미리 잡아 두어,
+#   파이프라인 중간에 한도가 바닥나 앞 단계 호출이 헛수고가 되는 일을 막습니다.
+#   (사용량은 이 프로세스가 보낸 요청 기준이며 재시작하면 0부터 다시 셉니다.)
+
+class RateLimitExceeded(Exception):
+    """예산이 없거나 너무 오래 기다려야 해서 지금은 요청을 받을 수 없음. retry_after: 다시 시도할 때까지의 초 (모르면 None)"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _quota_day():
+    return datetime.now(QUOTA_RESET_TIMEZONE).date()
+
+class Reservation:
+    """
+    reserve()로 잡아 둔 일일 예산. with 블록 안의 호출은 acquire()로 하나씩 쓰고, 남은 몫은 끝날 때 반환
+    release()는 여러 번 불러도 한 번만 반환하므로, 예약한 쪽과 넘겨받아 쓰는 쪽이 각각 with로 감싸도 됩니다.
+    """
+
+    def __init__(self, limiter, count, estimated_wait_seconds):
+        self.limiter = limiter
+        self.remaining = count
+        self.estimated_wait_seconds = estimated_wait_seconds
+
+    def acquire(self, timeout=None):
+        """분당 토큰 하나를 받을 때까지 기다림 (예약분이 남아 있으면 일일 예산 확인 없이)"""
+        if self.remaining > 0:
+            self.remaining -= 1
+            try:
+                self.limiter._acquire_token(from_reservation=True, timeout=timeout)
+            except BaseException: # 토큰을 못 받았으면 예약분을 쓰지 않은 것으로 되돌림 (_reserved는 _acquire_token이 되돌림)
+                self.remaining += 1
+                raise
+        else:
+            self.limiter.acquire(timeout=timeout)
+
+    def release(self):
+        if self.remaining:
+            self.limiter._release_reserved(self.remaining)
+            self.remaining = 0
+
+    def __enter__(self):
+        self.limiter._local.reservation = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.limiter._local.reservation = None
+        self.release()
+        return False
+
+class RateLimiter:
+    """RPM 토큰 버킷 + RPD 예산. acquire()는 호출 직전, reserve(n)은 여러 호출을 묶은 작업 시작 전에 사용"""
+
+    def __init__(self, requests_per_minute, requests_per_day, max_wait_seconds=90):
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.max_wait_seconds = max_wait_seconds
+        self._rate = requests_per_minute / 60.0 # 초당 채워지는 토큰 수
+        self._tokens = float(requests_per_minute)
+        self._refilled_at = time.monotonic()
+        self._waiting = deque() # 토큰을 기다리는 호출의 번호표 (도착 순서)
+        self._next_ticket = 0
+        self._day = _quota_day()
+        self._used_today = 0
+        self._reserved = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.requests_per_minute), self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+        today = _quota_day()
+        if today != self._day: # 날짜가 바뀌면 일일 사용량 초기화 (잡아 둔 예약분은 유지)
+            self._day, self._used_today = today, 0
+
+    def _wait_for(self, calls_ahead):
+        """지금 줄을 서면 calls_ahead번째 뒤에서 토큰을 받기까지 예상 대기 시간(초)"""
+        deficit = calls_ahead + 1 - self._tokens
+        return max(0.0, deficit / self._rate)
+
+    def _seconds_until_reset(self):
+        now = datetime.now(QUOTA_RESET_TIMEZONE)
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo)
+        return (tomorrow - now).total_seconds()
+
+    def remaining_today(self):
+        """오늘 남은 요청 수 (이미 예약된 몫 제외)"""
+        with self._condition:
+            self._refill()
+            return max(0, self.requests_per_day - self._used_today - self._reserved)
+
+    def estimate_wait(self):
+        """지금 새 호출을 보내면 분당 한도 때문에 기다려야 할 예상 시간(초)"""
+        with self._condition:
+            self._refill()
+            return self._wait_for(len(self._waiting))
+
+    def status(self):
+        """사이드바 표시용: {"remaining_today", "requests_per_day", "requests_per_minute", "queued", "estimated_wait_seconds"}"""
+        with self._condition:
+            self._refill()
+            return {
+                "remaining_today": max(0, self.requests_per_day - self._used_today - self._reserved),
+                "requests_per_day": self.requests_per_day,
+                "requests_per_minute": self.requests_per_minute,
+                "queued": len(self._waiting),
+                "estimated_wait_seconds": self._wait_for(len(self._waiting)),
+            }
+
+    def reserve(self, count):
+        """
+        count회의 호출에 필요한 일일 예산을 미리 잡아 Reservation을 반환합니다.
+        일일 예산이 모자라거나 첫 호출까지 max_wait_seconds보다 오래 기다려야 하면 RateLimitExceeded.
+        """
+        with self._condition:
+            self._refill()
+            if self.requests_per_day - self._used_today - self._reserved < count:
+                raise RateLimitExceeded("오늘 사용할 수 있는 AI 호출을 모두 썼어요.", retry_after=self._seconds_until_reset())
+            estimated_wait = self._wait_for(len(self._waiting))
+            if estimated_wait > self.max_wait_seconds:
+                raise RateLimitExceeded("지금 AI 호출 대기열이 너무 길어요.", retry_after=estimated_wait)
+            self._reserved += count
+        return Reservation(self, count, estimated_wait)
+
+    def _release_reserved(self, count):
+        with self._condition:
+            self._reserved = max(0, self._reserved - count)
+
+    def acquire(self, timeout=None):
+        """호출 하나를 보내기 직전에 부름. 현재 스레드에 예약(with reserve(...))이 있으면 그 몫을 사용"""
+        reservation = getattr(self._local, "reservation", None)
+        if reservation is not None and reservation.remaining > 0:
+            reservation.acquire(timeout=timeout)
+        else:
+            self._acquire_token(from_reservation=False, timeout=timeout)
+
+    def _acquire_token(self, from_reservation, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._refill()
+            if from_reservation:
+                self._reserved = max(0, self._reserved - 1)
+            elif self.requests_per_day - self._used_today - self._reserved < 1:
+                raise RateLimitExceeded("오늘 사용할 수 있는 AI 호출을 모두 썼어요.", retry_after=self._seconds_until_reset())
+            self._used_today += 1 # 일일 예산은 줄 서는 순간 차감 (기다리다 포기하면 아래에서 되돌림)
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._waiting[0] == ticket and self._tokens >= 1:
+                        self._tokens -= 1
+                        self._waiting.popleft()
+                        self._condition.notify_all() # 다음 번호표 차례
+                        return
+                    wait_seconds = (1 - self._tokens) / self._rate if self._waiting[0] == ticket else None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise RateLimitExceeded("AI 호출 대기 시간이 너무 길어요.", retry_after=self._wait_for(len(self._waiting)))
+                        wait_seconds = remaining if wait_seconds is None else min(wait_seconds, remaining)
+                    self._condition.wait(wait_seconds)
+            except BaseException:
+                self._waiting.remove(ticket)
+                self._used_today = max(0, self._used_today - 1)
+                if from_reservation:
+                    self._reserved += 1
+                self._condition.notify_all()
+                raise
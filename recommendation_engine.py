@@ -0,0 +1,885 @@
+import os
+import re
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+
+from book_vectorizer import transform_book_docs # 소장 도서+카카오 캐시로 한 번 학습한 글자 n-gram TF-IDF
+from keyword_rules import get_keyword_classes # 학년 필터/자체 점수 공용 키워드 규칙 (keyword_rules.json)
+from recommendation_stream import BooksJsonStreamParser # 최종 추천 응답을 받는 대로 도입부/책 JSON으로 나눔
+from text_normalizer import normalize_publisher_name # library_db와 공용 정규화 모듈 (LRU 캐시 포함)
+from tracing import RUN_SPAN_NAME, current_span, span, start_span, use_span # 단계/외부 호출별 span을 traces.jsonl에 기록
+
+try:
+    from library_db import isbn10_to_isbn13
+except ImportError: # 도서관 DB 모듈이 없으면 ISBN-10을 그대로 사용
+    def isbn10_to_isbn13(isbn10): return None
+
+# Streamlit 없이 import/실행할 수 있는 도서 추천 파이프라인.
+#   recommend(student_data) -> RecommendationResult
+# 단계: 검색어 생성(Gemini) -> 카카오 검색 + 학생 수준 필터 -> 소장 도서 BM25 검색 -> 다양성 대표 선택
+#       -> 소장 여부 확인 + 자체 점수 -> 최종 선정(Gemini)
+# 단계마다 StageReport(걸린 시간, 들어온/나간 항목 수, 클라이언트 호출 수)를 남기므로 벤치마크/로그에 그대로 쓸 수 있고,
+# Gemini/카카오/도서관 클라이언트는 주입할 수 있어 (기본값은 실제 모듈) 가짜 클라이언트로 오프라인 실행도 됩니다.
+# chatbot_app.py는 결과를 화면에 그리기만 합니다.
+
+# --- 출판사 목록 (정규화된 이름으로 비교) ---
+ORIGINAL_MAJOR_PUBLISHERS = [
+    "시공사", "위즈덤하우스", "창비", "북이십일", "김영사", "다산북스", "알에이치코리아",
+    "쌤앤파커스", "영림카디널", "내 인생의 책", "바람의아이들", "스타북스", "비룡소",
+    "국민서관", "웅진씽크빅", "계림북스", "계몽사", "문학수첩", "민음사", "밝은세상",
+    "범우사", "문학과지성사", "문학동네", "사회평론", "자음과모음", "중앙M&B",
+    "창작과비평사", "한길사", "은유출판", "열린책들", "살림출판사", "학지사", "박영사",
+    "안그라픽스", "길벗", "제이펍", "다락원", "평단문화사", "정보문화사", "영진닷컴",
+    "성안당", "박문각", "넥서스북", "리스컴", "가톨릭출판사", "대한기독교서회",
+    "한국장로교출판사", "아가페출판사", "분도출판사"
+]
+
+CHILDREN_PUBLISHERS_KEYWORDS_FOR_FILTER = [ # 정규화된 이름으로 관리
+    "비룡소", "국민서관", "웅진씽크빅", "계림북스", "계몽사", "시공주니어",
+    "사계절출판사", "보림출판", "한림출판사", "길벗어린이", "풀빛미디어", "다섯수레",
+    "창비교육", "문학동네어린이", "현암주니어", "주니어김영사", "주니어rhk", "을파소",
+    "걸음동무", "처음주니어"
+]
+
+CHILDREN_PUBLISHERS_NORMALIZED = {normalize_publisher_name(p) for p in CHILDREN_PUBLISHERS_KEYWORDS_FOR_FILTER}
+
+MAJOR_PUBLISHERS_NORMALIZED = {normalize_publisher_name(p) for p in ORIGINAL_MAJOR_PUBLISHERS}
+EXCLUDED_PUBLISHER_KEYWORDS = ["씨익북스", "ceic books"] # 소문자로 비교
+
+# --- Gemini 검색어 추출/프롬프트 ---
+def extract_search_queries_from_llm(llm_response, topic, genres):
+    lines = [q.strip().replace("*", "").replace("#", "") for q in llm_response.split('\n') if q.strip()]
+    filtered = []
+    for q in lines:
+        word_count = len(q.split())
+        if 1 <= word_count <= 3 and re.match(r"^[가-힣a-zA-Z0-9 \-]+$", q):
+            filtered.append(q)
+    fallback = []
+    if topic and genres:
+        for g in genres:
+            fg = f"{topic.strip()} {g.strip()}"
+            if fg not in filtered:
+                fallback.append(fg)
+    if topic and topic.strip() not in filtered:
+        fallback.append(topic.strip())
+    if genres:
+        for g in genres:
+            if g.strip() not in filtered:
+                fallback.append(g.strip())
+    filtered += [f for f in fallback if f not in filtered][:3]
+    filtered = list(dict.fromkeys(filtered))
+    return filtered[:6]
+
+# --- Gemini 검색어 생성 프롬프트 (사용자 요청대로 다변화/난이도 강조) ---
+def create_prompt_for_search_query(student_data):
+    level_desc = student_data.get("reading_level", "")
+    topic = student_data.get("topic", "")
+    age_grade_selection = student_data.get("student_age_group", "")
+    difficulty_hint = student_data.get("difficulty_hint", "")
+    genres = student_data.get("genres", [])
+    genres_str = ", ".join(genres) if genres else "없음"
+    interests = student_data.get("interests", "")
+    liked_books_str = ", ".join(student_data.get("liked_books", [])) if student_data.get("liked_books") else "없음"
+
+    # fallback 예시 자동 생성 (주제+장르, 주제, 장르 단독 등)
+    fallback_keywords = []
+    if topic and genres:
+        for g in genres:
+            fallback_keywords.append(f"{topic.strip()} {g.strip()}")
+    if topic and topic not in fallback_keywords:
+        fallback_keywords.append(topic.strip())
+    for g in genres:
+        if g not in fallback_keywords:
+            fallback_keywords.append(g)
+    fallback_example_str = "\n".join(fallback_keywords[:3])  # 예시 3개까지만
+
+    # level_desc 활용 난이도 안내 문구
+    if "상" in level_desc:
+        reading_hint = "(심화: 더 넓고 어려운 개념/용어도 가능)"
+    elif "중" in level_desc:
+        reading_hint = "(보통: 학교 권장 수준, 입문~중간 정도 난이도)"
+    elif "하" in level_desc:
+        reading_hint = "(기초: 쉬운 단어/초보자·입문자용 중심, 전문용어X)"
+    else:
+        reading_hint = ""
+
+    # age_grade 기반 세부 난이도/용어 안내
+    if "초등" in age_grade_selection:
+        age_specific_instruction = "초등학생이 이해할 수 있는 쉬운 단어로만 생성, 한자/전문용어/어려운 학술어 금지."
+    elif "중등" in age_grade_selection or "중학생" in age_grade_selection:
+        age_specific_instruction = "중학생 눈높이에 맞는 명확하고 단순한 단어 위주로 생성, 고등/대학/성인 전문용어는 제외."
+    elif "고등" in age_grade_selection or "고등학생" in age_grade_selection:
+        age_specific_instruction = "고등학생 수준, 대학 교재/성인 전문용어/지나치게 심화된 키워드는 피하세요."
+    else:
+        age_specific_instruction = ""
+
+    prompt = f"""
+아래 학생 정보를 종합적으로 고려해,
+한국 도서 검색 엔진(카카오 등)에서 실제 책이 잘 검색될 수 있는 “명사+명사” 중심의 검색 키워드(3~5개)를 생성하세요.
+
+- **모든 입력정보(주제, 장르, 관심사, 독서 수준, 연령, 난이도, 선호 도서 등)를 반드시 반영**하여,
+  해당 학생에게 “실제 추천이 유의미한” 키워드를 제안해야 합니다.
+- 각 검색어는 반드시 1~3개 “명사”의 조합이어야 하며(예: ‘건축 소설’, ‘건축가’, ‘건축 이야기’, ‘과학 만화’ 등),
+  “설명문, 너무 긴 복합어, 완전한 문장형, 예술적 수식, 문단, 느낌표, 불필요한 꾸밈말, 부연 설명”은 절대 포함하지 마세요.
+- 키워드는 반드시 실제 책 제목/분야/목차/도서관 분류에서 많이 쓰이는 현실적인 단어만을 조합해야 합니다.
+- **생성되는 키워드 중 최소 하나 이상은 학생이 명시적으로 선택한 주요 주제('{topic}')와 선호 장르('{genres_str}')를 직접적으로 결합한 형태여야 합니다.** (예: '{topic} {genres[0] if genres else "관련"} {genres_str if not genres else ""}' 또는 단순히 '{topic} {genres_str}' 형태. 만약 장르가 여러 개면 그 중 하나 이상과 결합)
+- **다른 키워드들도 가능한 주요 주제('{topic}')와의 연관성을 유지하도록 노력해주세요.** 주제와 장르를 다양한 방식으로 조합하되, 주제에서 너무 벗어난 하위 장르나 일반적인 장르 키워드는 최소화해주세요.
+- 예를 들어, 주제가 '학교도서관'이고 장르가 '소설'이라면, '학교도서관 소설', '학교도서관 배경 청소년 소설' 등을 우선적으로 고려하고, 주제와 직접 관련 없는 '디스토피아 소설' 같은 키워드는 학생의 다른 관심사가 명확하지 않다면 지양해주세요.
+- 각 키워드는 한 줄에 하나씩 제안하세요(최소 3개~최대 5개, 부연설명 금지).
+- [예시]
+{fallback_example_str}
+
+※ 독서 수준: {level_desc} {reading_hint}
+※ 연령/학년: {age_grade_selection} ({age_specific_instruction})
+※ 난이도 참고: {difficulty_hint}
+※ 관심사: {interests}
+※ 최근 읽은 책: {liked_books_str}
+
+[입력정보]
+주제: {topic}
+장르: {genres_str}
+관심사: {interests}
+"""
+    return prompt
+    
+def create_prompt_for_no_results_advice(student_data, original_search_queries):
+    level_desc = student_data["reading_level"]
+    topic = student_data["topic"]
+    age_grade_selection = student_data["student_age_group"]
+    difficulty_hint = student_data["difficulty_hint"]
+    interests = student_data["interests"]
+    queries_str = ", ".join(original_search_queries) if original_search_queries else "없음"
+
+    prompt = f"""
+당신은 매우 친절하고 도움이 되는 도서관 요정 '도도'입니다.
+학생이 아래 [학생 정보]로 책을 찾아보려고 했고, 이전에 [{queries_str}] 등의 검색어로 시도했지만, 안타깝게도 카카오 도서 API에서 관련 책을 찾지 못했습니다.
+
+이 학생이 실망하지 않고 탐구를 계속할 수 있도록 실질적인 도움과 따뜻한 격려를 해주세요.
+답변에는 다음 내용을 반드시 포함해주세요:
+1.  결과를 찾지 못해 안타깝다는 공감의 메시지. (예: "이런, 이번에는 마법 거울이 책을 못 찾아왔네! 힝...")
+2.  학생의 [학생 정보]를 바탕으로 시도해볼 만한 **새로운 검색 키워드 2~3개**를 구체적으로 제안. (이전에 시도한 검색어와는 다른 관점이나 단어 활용)
+3.  책을 찾기 위한 **추가적인 서칭 방법이나 유용한 팁** 1-2가지.
+4.  학생이 탐구를 포기하지 않도록 격려하는 따뜻한 마무리 메시지. (예: "포기하지 않으면 분명 좋은 책을 만날 수 있을 거야! 요정의 가루를 뿌려줄게! ✨")
+
+**주의: 이 단계에서는 절대로 구체적인 책 제목을 지어내서 추천하지 마세요.** 오직 조언과 다음 단계 제안에만 집중해주세요.
+답변은 마크다운 형식을 활용하여 가독성 좋게 작성해주세요.
+
+[학생 정보]
+- 독서 수준 묘사: {level_desc}
+- 학생 학년 수준: {age_grade_selection}
+- 주요 탐구 주제: {topic}
+- 주제 관련 특별 관심사/파고들고 싶은 부분: {interests}
+
+[학생 수준 참고사항]
+{difficulty_hint}
+
+[이전에 시도했던 대표 검색어들 (참고용)]
+{queries_str}
+
+학생을 위한 다음 단계 조언 (새로운 검색 키워드 및 서칭 팁 포함):"""
+    return prompt
+
+# --- 카카오 후보 스트림: 받아오기 → 제외 출판사 → 중복 제거 → 학생 수준 필터 ---
+KAKAO_RESULTS_PER_PAGE = 15 # 검색어·페이지당 가져오는 책 수
+KAKAO_MAX_PAGES_PER_QUERY = 3 # 후보가 모자랄 때 검색어별로 더 받아볼 최대 페이지
+TARGET_FILTERED_CANDIDATES = 40 # 학생 수준 필터를 통과한 후보가 이만큼 모이면 더 받지 않음
+def is_excluded_publisher(book_doc):
+    """출판사 필터링 (소문자로 비교)"""
+    publisher_check = book_doc.get('publisher', '').lower()
+    return any(excluded_keyword in publisher_check for excluded_keyword in EXCLUDED_PUBLISHER_KEYWORDS)
+
+def passes_age_filter(book_doc, age_group):
+    """학생 수준 기반 1차 필터링: 학년 그룹에 맞지 않는 책이면 False (키워드 규칙은 keyword_rules.json)"""
+    keyword_classes = get_keyword_classes(book_doc) # 제목/소개를 한 번씩만 훑은 결과 (점수 계산과 공유)
+    title_classes, contents_classes = keyword_classes["title"], keyword_classes["contents"]
+    publisher_normalized = normalize_publisher_name(book_doc.get('publisher', ''))
+
+    if "초등학생" in age_group:
+        is_children_book_evidence = False
+        if publisher_normalized in CHILDREN_PUBLISHERS_NORMALIZED: is_children_book_evidence = True
+        if "children" in title_classes: is_children_book_evidence = True
+        # 내용에 청소년/성인 키워드가 강하게 나타나면 제외 (예: "대학생", "성인")
+        if "adult_audience" in contents_classes:
+            is_children_book_evidence = False # 이런건 확실히 제외
+        if not is_children_book_evidence and "children" not in contents_classes: # 제목/출판사 증거도 없고, 내용에도 없으면
+            return False
+
+    elif "중학생" in age_group or "고등학생" in age_group:
+        # 명백한 어린이 책(그림책, 저학년 동화 등) 제외 시도
+        if publisher_normalized in CHILDREN_PUBLISHERS_NORMALIZED and not ({"teen", "nonfiction"} & title_classes):
+            return False # 아동 출판사인데 청소년 키워드 없으면 일단 제외
+        if "infant" in title_classes and "teen" not in title_classes:
+            return False # 명백한 유아용 타이틀 제외
+        if "elementary_student" in title_classes and "upper_grade" not in title_classes and "teen" not in title_classes: # '초등학생'인데 고학년용 아니거나 청소년용 아니면 제외
+            return False
+    return True
+
+LOCAL_LIBRARY_CANDIDATES = 15 # 소장 도서 BM25 검색에서 후보로 더할 최대 권수
+AUTHOR_ROLE_SUFFIX_PATTERN = re.compile(r"\s+(지음|옮김|그림|글|엮음|편저|저|역|감수)\s*$")
+
+def library_book_to_candidate_doc(book):
+    """소장 도서(library_db 결과)를 카카오 검색 문서와 같은 모양으로 (필터/군집화/프롬프트가 같은 키를 쓰도록)"""
+    isbn_digits = "".join(filter(lambda x: x.isdigit() or x.upper() == 'X', book.get('isbn', ''))).upper()
+    cleaned_isbn = (isbn10_to_isbn13(isbn_digits) or isbn_digits) if len(isbn_digits) == 10 else isbn_digits # 카카오처럼 ISBN-13 우선
+    year = (book.get('publication_year') or '').strip()
+    return {
+        "title": book.get('title', ''),
+        "authors": [AUTHOR_ROLE_SUFFIX_PATTERN.sub('', name).strip() for name in (book.get('author') or '').split(';') if name.strip()],
+        "publisher": book.get('publisher', ''),
+        "contents": book.get('description', '') or '',
+        "isbn": book.get('isbn', ''),
+        "cleaned_isbn": cleaned_isbn,
+        "datetime": f"{year}-01-01T00:00:00.000+09:00" if year.isdigit() and len(year) == 4 else "",
+        "thumbnail": "", "url": "",
+        "found_in_library": True,
+        "candidate_source": "library", # 카카오가 아닌 소장 도서 직접 검색으로 들어온 후보
+    }
+
+def iter_filtered_kakao_candidates(book_docs, age_group, seen_isbns):
+    """카카오 문서 스트림에서 제외 출판사를 빼고, ISBN 중복을 없앤 뒤(seen_isbns에 기록), 학생 수준에 맞는 책만 내보냄"""
+    for book_doc in book_docs:
+        if is_excluded_publisher(book_doc): continue
+        cleaned_isbn = book_doc.get('cleaned_isbn', '')
+        if not cleaned_isbn or cleaned_isbn in seen_isbns: continue
+        seen_isbns.add(cleaned_isbn)
+        if passes_age_filter(book_doc, age_group):
+            yield book_doc
+
+# --- 책 군집화 기반 다양성 추출 (핵심 기능) ---
+DIVERSITY_SELECTION_MODE = "average" # "average" | "max" | "mmr" (mmr은 enriched_score_function 점수로 적합성도 반영)
+MMR_DIVERSITY_WEIGHT = 0.5 # mmr에서 다양성 비중 (0~1, 나머지는 적합성)
+
+def cluster_books_for_diversity(book_docs, n_clusters=3, mode=DIVERSITY_SELECTION_MODE, relevance_scores=None):
+    """
+    TF-IDF(공용 학습 벡터라이저, transform만)와 코사인 유사도를 사용해 책 목록에서 다양한 주제의 책 n_clusters개를 선택합니다.
+    mode: "average"(선택된 대표들과의 평균 유사도 최소, 기본) / "max" / "mmr"(relevance_scores 필요)
+    """
+    # 책 수가 요청 클러스터 수보다 적거나 같으면, 모든 책을 개별 클러스터로 반환
+    if not book_docs or len(book_docs) <= n_clusters:
+        return [[doc] for doc in book_docs]
+
+    with span("diversity.cluster", items_in=len(book_docs), n_clusters=n_clusters, mode=mode) as trace_span:
+        representative_groups = _cluster_books_for_diversity(book_docs, n_clusters, mode, relevance_scores)
+        trace_span.set(items_out=len(representative_groups))
+        return representative_groups
+
+def _cluster_books_for_diversity(book_docs, n_clusters, mode, relevance_scores):
+    try:
+        # sklearn/numpy는 import만 1초 넘게 걸리므로 군집화가 실제로 실행될 때 처음 불러옴 (Streamlit 첫 화면/리런에서 제외)
+        from sklearn.metrics.pairwise import cosine_similarity
+        from diversity import select_diverse_indices
+
+        tfidf_matrix = transform_book_docs(book_docs) # 매 실행 fit 없이 같은 어휘/IDF로 변환
+
+        # 유사도 행렬은 한 번만 계산하고, 대표 선택은 diversity.select_diverse_indices가 누적 유사도 벡터로 처리
+        # (첫 번째 책을 첫 대표로, 이후 선택된 대표들과의 *평균* 유사도가 *가장 낮은* 책을 차례로 선택 -> 사용자 제공 코드 방식)
+        similarity_matrix = cosine_similarity(tfidf_matrix)
+        selected_indices = select_diverse_indices(
+            similarity_matrix, min(n_clusters, len(book_docs)), mode=mode,
+            relevance_scores=relevance_scores, diversity_weight=MMR_DIVERSITY_WEIGHT
+        )
+        cluster_representatives = [book_docs[i] for i in selected_indices]
+
+        return [[rep] for rep in cluster_representatives] # 각 대표를 단일 항목 클러스터로 반환
+
+    except Exception as e:
+        current_span().record_error(e) # 폴백으로 넘어간 오류 종류는 span에 남김
+        # 오류 발생 시 모든 책을 단일 클러스터로 반환하거나, 첫 N개만 반환하는 등의 폴백
+        return [book_docs[:n_clusters]] # 단순하게 첫 N개 책을 반환 (또는 각 책을 개별 클러스터로)
+
+# --- 난이도, 출판사 등 자체 스코어 (사용자 요청 버전) ---
+def enriched_score_function(book_doc, student_data):
+    score = 0
+    publisher = book_doc.get('publisher', '')
+    normalized_publisher = normalize_publisher_name(publisher)
+    keyword_classes = get_keyword_classes(book_doc) # 학년 필터에서 이미 계산한 키워드 규칙 결과 재사용
+    title_classes, contents_classes = keyword_classes["title"], keyword_classes["contents"]
+    
+    # 1. 출판년도
+    try:
+        publish_year_str = book_doc.get("datetime", "").split('T')[0][:4]
+        if publish_year_str.isdigit():
+            publish_year = int(publish_year_str)
+            current_year = datetime.now().year
+            if publish_year >= current_year - 1: score += 30
+            elif publish_year >= current_year - 3: score += 20
+            elif publish_year >= current_year - 5: score += 10
+    except: pass
+
+    # 2. 책 소개 길이
+    contents_len = len(book_doc.get('contents', '')) # 원본 contents 사용 (소문자 변환 전)
+    if contents_len > 200: score += 10 # 기존 20점에서 10점으로 조정됨
+    # elif contents_len > 100: score += 10 # 이 부분은 사용자 코드에서 빠짐
+
+    # 3. 주요 출판사
+    if normalized_publisher in MAJOR_PUBLISHERS_NORMALIZED: score += 10
+
+    # 4. 학생 학년 수준에 따른 스코어링
+    student_age_group = student_data.get("student_age_group", "")
+    if "초등학생" in student_age_group:
+        if normalized_publisher in CHILDREN_PUBLISHERS_NORMALIZED:
+            score += 30 # 어린이 전문 출판사면 큰 가산점!
+        if "score_elementary" in title_classes:
+            score += 20 # 제목에 어린이/초등 키워드
+        if "score_elementary" in contents_classes:
+            score += 10 # 소개에 어린이/초등학생 키워드
+    elif "중학생" in student_age_group:
+        if "score_middle" in title_classes:
+            score += 15
+        if "score_middle" in contents_classes:
+            score += 7
+    elif "고등학생" in student_age_group:
+        if "score_high" in title_classes or {"youth", "advanced"} <= title_classes:
+            score += 10
+        # 고등학생은 내용 일치도가 더 중요할 수 있어 contents 가점은 일단 보류 또는 다른 방식으로 접근
+
+    # 0. 도서관 소장 여부 가산점 추가
+    if book_doc.get("found_in_library"):
+        score += 40  # (30~50점 추천, 전체 점수 분포에 맞게)
+    
+    return score
+
+def select_final_candidates_with_library_priority(candidates, top_n=4):
+    """소장자료가 있으면 반드시 상위 1권 포함, 없으면 그냥 다양성/적합성 top_n 반환 + 안내문구"""
+    library_books = [b for b in candidates if b.get("found_in_library")]
+    non_library_books = [b for b in candidates if not b.get("found_in_library")]
+    library_books = sorted(library_books, key=lambda x: x['score'], reverse=True)
+    non_library_books = sorted(non_library_books, key=lambda x: x['score'], reverse=True)
+    if library_books:
+        final_candidates = [library_books[0]] + non_library_books[:top_n-1]
+        library_notice = "도서관 소장 자료가 포함된 추천 리스트입니다."
+    else:
+        final_candidates = non_library_books[:top_n]
+        library_notice = "아쉽게도 도서관에 소장된 추천 도서는 없어요. 대신 이런 책을 추천해요!"
+    return final_candidates, library_notice
+
+def create_prompt_for_final_selection(student_data, kakao_book_candidates_docs):
+    level_desc = student_data["reading_level"]
+    topic = student_data["topic"]
+    age_grade_selection = student_data["student_age_group"]
+    difficulty_hint = student_data["difficulty_hint"]
+    interests = student_data["interests"]
+    candidate_books_info = []
+
+    # 최대 7권까지 후보로 보여주는 것은 동일 (실제로는 클러스터링 결과로 3~4권이 주로 전달될 것)
+    if kakao_book_candidates_docs and isinstance(kakao_book_candidates_docs, list):
+        for i, book in enumerate(kakao_book_candidates_docs):
+            if i >= 10: break # Gemini에게 전달할 후보 최대 개수 제한
+            if not isinstance(book, dict): continue
+            try:
+                publish_date_str = book.get("datetime", "")
+                publish_year = datetime.fromisoformat(publish_date_str.split('T')[0]).strftime("%Y년") if publish_date_str and isinstance(publish_date_str, str) and publish_date_str.split('T')[0] else "정보 없음"
+            except ValueError: publish_year = "정보 없음 (날짜형식오류)"
+            display_isbn = book.get('cleaned_isbn', '정보 없음')
+            publisher_name = book.get('publisher', '정보 없음')
+
+            candidate_books_info.append(
+                f"  후보 {i+1}:\n"
+                f"    제목: {book.get('title', '정보 없음')}\n"
+                f"    저자: {', '.join(book.get('authors', ['정보 없음']))}\n"
+                f"    출판사: {publisher_name}\n"
+                f"    출판년도: {publish_year}\n"
+                f"    ISBN: {display_isbn}\n"
+                f"    소개(요약): {book.get('contents', '정보 없음')[:250]}..." # 요약 길이 유지
+            )
+    candidate_books_str = "\n\n".join(candidate_books_info) if candidate_books_info else "검색된 책 후보 없음."
+
+    age_specific_selection_instruction = ""
+    if "초등학생" in age_grade_selection:
+        age_specific_selection_instruction = "특히, 이 학생은 초등학생이므로, 제공된 후보 목록 중에서도 **반드시 초등학생의 눈높이에 맞는 단어, 문장, 그림(만약 유추 가능하다면), 주제 접근 방식을 가진 책**을 골라야 합니다. 청소년이나 성인 대상의 책은 내용이 아무리 좋아도 제외해주세요. 책의 '소개(요약)', '출판사', '제목' 등을 통해 초등학생 적합성을 최우선으로 판단해야 합니다. 만약 후보 중에 초등학생에게 진정으로 적합한 책이 없다면, JSON 결과로 빈 배열 `[]`을 반환하고, 그 외 텍스트 영역에 그 이유를 설명해주세요."
+    elif "중학생" in age_grade_selection:
+        age_specific_selection_instruction = "이 학생은 중학생입니다. 후보 중에서 **중학생의 지적 호기심을 자극하고 이해 수준에 맞는 책**을 골라주세요. 너무 어리거나 전문적인 책은 피해주세요."
+    elif "고등학생" in age_grade_selection:
+        age_specific_selection_instruction = "이 학생은 고등학생입니다. **탐구 주제에 대해 심도 있는 이해를 돕거나 다양한 관점을 제시하는 책**을 우선적으로 고려해주세요. 너무 가볍거나 전문성이 떨어지는 책은 제외하고, 대학 전공 서적 수준의 깊이는 아니어야 합니다."
+
+
+    prompt = f"""
+당신은 제공된 여러 실제 책 후보 중에서 학생의 원래 요구사항에 가장 잘 맞는 책을 최대 3권까지 최종 선택하고, 각 책에 대한 맞춤형 추천 이유를 작성하는 친절하고 현명한 도서관 요정 '도도'입니다.
+
+[학생 정보 원본]
+- 독서 수준 묘사: {level_desc}
+- 학생 학년 수준: {age_grade_selection}
+- 주요 탐구 주제: {topic}
+- 주제 관련 특별 관심사/파고들고 싶은 부분: {interests}
+
+[학생 수준 참고사항]
+{difficulty_hint}
+
+[카카오 API 및 자체 필터링/다양성 확보를 통해 선정된 주요 책 후보 목록]
+{candidate_books_str}
+
+[요청 사항]
+1.  위 [주요 책 후보 목록]에서 학생에게 가장 적합하다고 판단되는 책을 최소 2권, 가능하다면 최대 5권까지 선택해주세요.
+2.  선택 시 다음 사항을 **종합적으로 고려**하여, 학생의 탐구 활동에 실질적으로 도움이 될 **'인기 있거나 검증된 좋은 책'**을 우선적으로 선정해주세요:
+    * **학생의 요구사항 부합도 (가장 중요!):** 주제, 관심사, 그리고 특히 **'학생 학년 수준'과 '학생 수준 참고사항'에 명시된 난이도**에 얼마나 잘 맞는가?
+    * {age_specific_selection_instruction}
+    * **책의 신뢰도 및 대중성(추정):** 출판사, 저자 인지도, 출판년도(너무 오래되지 않은 책), 소개글의 충실도 등을 고려해주세요.
+    * **정보의 깊이와 폭:** 학생의 탐구 주제에 대해 얼마나 깊이 있고 넓은 정보를 제공하는가? (단, 학생 수준에 맞춰야 함)
+3.  선택된 각 책의 정보는 아래 명시된 필드를 포함하는 **JSON 객체**로 만들어주세요.
+JSON 객체 필드 설명:
+- "title" (String): 정확한 책 제목
+- "author" (String): 실제 저자명 (쉼표로 구분된 문자열)
+- "publisher" (String): 실제 출판사명
+- "year" (String): 출판년도 (YYYY년 형식)
+- "isbn" (String): 실제 ISBN (숫자와 X만 포함된 순수 문자열, 하이픈 없이)
+- "reason" (String): 학생 맞춤형 추천 이유 (1-2 문장, 친절하고 설득력 있게)
+
+JSON 배열 형식 예시:
+BOOKS_JSON_START
+[
+  {{
+    "title": "(실제 후보 목록에서 선택한 책 제목)",
+    "author": "(실제 후보 목록에서 가져온 저자명)",
+    "publisher": "(실제 후보 목록에서 가져온 출판사명)",
+    "year": "(실제 후보 목록에서 가져온 출판년도)",
+    "isbn": "(실제 후보 목록에서 가져온 ISBN)",
+    "reason": "(학생 정보와 위 선택 기준을 바탕으로 생성한 추천 이유)"
+  }}
+]
+BOOKS_JSON_END
+
+만약 [주요 책 후보 목록]이 "검색된 책 후보 없음"이거나, 후보 중에서 위 기준에 따라 적절한 책을 고르기 어렵다면, BOOKS_JSON_START와 BOOKS_JSON_END 마커 사이에 빈 배열 `[]`을 넣어주고, 그 외의 텍스트 영역에 학생의 [학생 정보 원본]과 [학생 수준 참고사항]만을 참고하여 일반적인 조언이나 탐색 방향을 제시해주세요. 단, 이 경우에도 구체적인 (가상의) 책 제목을 JSON 안에 지어내지는 마세요.
+
+자, 이제 최종 추천을 부탁해요! ✨
+"""
+    return prompt
+
+# --- 추천 파이프라인 설정 ---
+GEMINI_MODEL_NAME = 'gemini-2.0-flash-lite' # 사용자의 기존 모델명 유지
+GEMINI_CALLS_PER_RUN = 3 # 추천 한 번에 쓸 수 있는 최대 Gemini 호출 수 (검색어 생성 + 최종 선정 + 최종 추천이 비었을 때 조언). 쓰지 않은 몫은 끝날 때 반환
+SEARCH_QUERY_TEMPERATURE = 0.1 # 검색어는 일관성있게
+FINAL_SELECTION_TEMPERATURE = 0.4 # 추천 이유는 약간의 창의성 허용
+ADVICE_TEMPERATURE = 0.5
+N_CLUSTERS_FOR_GEMINI = 10 # Gemini에게 전달할 대표 후보 수 (최종 추천은 3권 이내, 다양성을 위해 약간 더 많이 뽑아서 전달)
+FINAL_CANDIDATES_TOP_N = 4 # 소장 자료 우선 안내문구를 만들 때 보는 상위 후보 수
+
+DIFFICULTY_HINTS = { # 난이도 힌트 설정 (기존과 동일)
+    "초등학생 (8-13세)": "이 학생은 초등학생입니다. 매우 이해하기 쉬운 단어와 문장을 사용하고, 친절하고 상세한 설명을 제공해주세요. 추천하는 책이나 검색어도 초등학생 눈높이에 맞춰주세요.",
+    "중학생 (14-16세)": "이 학생은 중학생입니다. 적절한 수준의 어휘를 사용하고, 너무 단순하거나 유치하지 않으면서도 명확한 설명을 제공해주세요. 추천하는 책이나 검색어도 중학생 수준에 적합해야 합니다.",
+    "고등학생 (17-19세)": "이 학생은 고등학생입니다. 정확한 개념과 논리적인 설명을 중심으로 답변해주세요. 탐구 보고서 작성에 도움이 될 만한 심도 있는 내용이나 다양한 관점을 제시해도 좋습니다.",
+    "선택안함": "학생의 연령대가 특정되지 않았습니다. 일반적인 청소년 수준을 고려하되, 너무 어렵거나 전문적인 내용은 피해주세요."
+}
+
+# 결과 상태 (ok가 아니면 advice_text에 Gemini의 다음 단계 조언)
+STATUS_OK = "ok"
+STATUS_QUERY_FAILED = "query_failed" # 검색어 생성 실패 (query_response에 안내 문구)
+STATUS_NO_BOOKS = "no_books" # 카카오/소장 도서에서 책을 하나도 찾지 못함
+STATUS_NO_AGE_MATCHES = "no_age_matches" # 학생 수준 필터를 통과한 후보 없음
+STATUS_NO_REPRESENTATIVES = "no_representatives" # 다양성 대표를 고르지 못함
+GEMINI_ERROR_MARKERS = ("AI 요정님 호출 중", "AI 모델이 준비되지 않았어요", "콘텐츠 안전 문제일 수 있어요")
+
+def make_student_data(reading_level, topic, student_age_group, genres=None, interests="", liked_books=None, disliked_conditions=""):
+    """입력 폼 값으로 파이프라인/프롬프트가 쓰는 student_data 만들기"""
+    return {
+        "reading_level": reading_level, "topic": topic,
+        "student_age_group": student_age_group,
+        "difficulty_hint": DIFFICULTY_HINTS.get(student_age_group, DIFFICULTY_HINTS["선택안함"]),
+        "age_grade": student_age_group, # 프롬프트 호환성 위해 유지
+        "genres": genres if genres else [],
+        "interests": interests if interests else "특별히 없음",
+        "liked_books": list(liked_books or []),
+        "disliked_conditions": disliked_conditions if disliked_conditions else "특별히 없음"
+    }
+
+# --- 주입 가능한 클라이언트 (기본값은 실제 모듈. 같은 메서드를 가진 객체면 무엇이든 넣을 수 있음) ---
+class GeminiClient:
+    """generate(prompt, temperature, stream=False) / reserve(count). gemini_client의 응답 캐시와 공용 RPM/RPD 한도 사용"""
+
+    def __init__(self, model, model_name):
+        self.model = model
+        self.model_name = model_name
+
+    def generate(self, prompt, temperature, stream=False):
+        import google.generativeai as genai
+        from gemini_client import get_ai_recommendation
+        return get_ai_recommendation(self.model, prompt, generation_config=genai.GenerationConfig(temperature=temperature), stream=stream)
+
+    def reserve(self, count):
+        """추천 한 번에 필요한 호출 수를 미리 예약 (예산이 없거나 대기열이 길면 RateLimitExceeded)"""
+        from gemini_client import reserve_gemini_calls
+        return reserve_gemini_calls(self.model_name, count)
+
+class KakaoClient:
+    """iter_pages(queries, size, max_pages, on_query_done, errors): 카카오 검색 결과 문서 스트림 (kakao_client 공용 세션/캐시)"""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def iter_pages(self, queries, size, max_pages, on_query_done=None, errors=None):
+        from kakao_client import iter_kakao_book_pages
+        return iter_kakao_book_pages(queries, self.api_key, size=size, max_pages=max_pages, on_query_done=on_query_done, errors=errors)
+
+class LibraryClient:
+    """학교 도서관(library_db) 조회. library_db를 불러오지 못하면 available=False이고 모든 조회가 '없음'을 반환"""
+
+    def __init__(self):
+        try:
+            import library_db
+        except ImportError:
+            library_db = None
+        self._db = library_db
+        self.available = library_db is not None
+
+    def pinned(self):
+        """with 블록 동안 같은 카탈로그 버전을 보게 함 (읽기 트랜잭션을 잡으므로 도서관 조회만 감싸고 Gemini/카카오 호출은 감싸지 않음)"""
+        return self._db.pinned_catalog() if self._db else nullcontext()
+
+    def search(self, queries, top_k=20):
+        return self._db.search_library_catalog(queries, top_k=top_k) if self._db else []
+
+    def find_bulk(self, book_docs):
+        if not self._db:
+            return [{"found_in_library": False, "match_type": "none"} for _ in book_docs]
+        return self._db.find_books_in_library_bulk(book_docs)
+
+    def find_by_isbn(self, isbn_query):
+        if not self._db:
+            return {"found_in_library": False, "error": "도서관 DB 모듈 로드 실패"}
+        return self._db.find_book_in_library_by_isbn(isbn_query)
+
+    def find_by_title_author(self, title_query, author_query):
+        if not self._db:
+            return {"found_in_library": False, "error": "도서관 DB 모듈 로드 실패 (제목/저자 검색용)"}
+        return self._db.find_book_in_library_by_title_author(title_query, author_query)
+
+    def shelf_neighbors(self, isbn_query, before=3, after=3):
+        if not self._db:
+            return {"found_in_library": False, "before": [], "after": []}
+        return self._db.find_shelf_neighbors(isbn_query, before=before, after=after)
+
+# --- 결과 ---
+@dataclass
+class StageReport:
+    """단계 하나의 실행 기록. api_calls: {"gemini": n, "kakao": n, "library": n} (캐시에서 바로 나온 응답도 1회로 셈)"""
+    name: str
+    seconds: float = 0.0
+    items_in: int = 0
+    items_out: int = 0
+    api_calls: dict = field(default_factory=dict)
+
+@dataclass
+class RecommendationResult:
+    student_data: dict
+    status: str = STATUS_OK
+    search_queries: list = field(default_factory=list)
+    query_response: str = "" # 검색어 생성 Gemini 응답 (실패 시 안내 문구)
+    search_errors: list = field(default_factory=list) # 검색어별 카카오 오류 문구
+    unique_candidate_count: int = 0 # 카카오 + 소장 도서에서 본 고유 ISBN 수
+    local_library_count: int = 0 # 소장 도서 직접 검색으로 더한 후보 수
+    filtered_candidates: list = field(default_factory=list) # 학생 수준 필터 통과
+    representatives: list = field(default_factory=list) # 다양성 대표 (Gemini에 전달, 소장 여부/점수 포함)
+    library_notice: str = ""
+    advice_text: str = "" # 결과가 없거나 최종 추천이 빈 배열이고 설명도 없을 때 Gemini 조언
+    final_text: str = "" # 최종 선정 응답 전체 (스트리밍이면 모두 받은 뒤)
+    intro_text: str = ""
+    after_text: str = ""
+    books: list = field(default_factory=list) # 최종 추천 책 (dict)
+    found_json_block: bool = False
+    json_is_array: bool = True
+    final_events: object = None # stream_final=True일 때 ("intro", 텍스트) / ("book", dict) 이벤트 제너레이터
+    stages: list = field(default_factory=list)
+    trace_id: str = "" # traces.jsonl에서 이 추천의 span을 찾을 때 (추적을 끄면 빈 문자열)
+    _exit_stack: object = field(default=None, repr=False, compare=False) # stream_final일 때 Gemini 예약/실행 span
+
+    def close(self):
+        """Gemini 예약, 실행 span을 해제합니다. 최종 스트림을 시작하지 않았거나 도중에 멈췄어도 되고, 여러 번 불러도 됨"""
+        if self.final_events is not None:
+            self.final_events.close() # 시작하지 않은 제너레이터는 close()해도 finally가 돌지 않으므로 아래에서 직접 닫음
+        if self._exit_stack is not None:
+            self._exit_stack.close()
+            self._exit_stack = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def total_seconds(self):
+        return sum(stage.seconds for stage in self.stages)
+
+    def stage(self, name):
+        return next((stage for stage in self.stages if stage.name == name), None)
+
+# --- 엔진 ---
+class RecommendationEngine:
+    """
+    gemini/kakao/library 클라이언트를 받아 추천 파이프라인을 실행합니다 (여러 세션이 함께 써도 되도록 실행 상태는 결과에만 기록).
+    on_stage(StageReport, RecommendationResult): 단계가 끝날 때마다 (화면에 중간 결과를 바로 보여줄 때)
+    on_search_progress(페이지, 완료 개수, 전체 개수): 카카오 검색 진행 표시용
+    """
+
+    def __init__(self, gemini, kakao, library=None, n_representatives=N_CLUSTERS_FOR_GEMINI, diversity_mode=DIVERSITY_SELECTION_MODE):
+        self.gemini = gemini
+        self.kakao = kakao
+        self.library = library if library is not None else LibraryClient()
+        self.n_representatives = n_representatives
+        self.diversity_mode = diversity_mode
+
+    def reserve(self):
+        """추천 한 번에 필요한 Gemini 호출 예산을 예약 (RateLimitExceeded면 시작하지 말 것)"""
+        return self.gemini.reserve(GEMINI_CALLS_PER_RUN)
+
+    @contextmanager
+    def _stage(self, result, name, items_in=0, on_stage=None):
+        report = StageReport(name, items_in=items_in)
+        started = time.perf_counter()
+        with span(f"stage.{name}", items_in=items_in) as trace_span:
+            yield report
+            trace_span.set(items_out=report.items_out, api_calls=report.api_calls)
+        report.seconds = time.perf_counter() - started
+        result.stages.append(report)
+        if on_stage:
+            on_stage(report, result)
+
+    @staticmethod
+    def _count(report, client, count=1):
+        report.api_calls[client] = report.api_calls.get(client, 0) + count
+
+    def recommend(self, student_data, stream_final=False, reservation=None, on_stage=None, on_search_progress=None):
+        """
+        파이프라인 전체를 실행해 RecommendationResult를 반환합니다.
+        reservation을 주지 않으면 여기서 예약합니다 (RateLimitExceeded는 그대로 전달).
+        stream_final=True면 최종 선정 단계는 result.final_events를 소비할 때 실행되며, 다 소비하거나 result.close()를 불러야
+        예약이 풀립니다. (with recommend(...) as result: 로 쓰면 스트림을 시작하기 전에 멈춰도 해제됨)
+        """
+        if reservation is None:
+            reservation = self.reserve()
+        result = RecommendationResult(student_data)
+        run_span = start_span(RUN_SPAN_NAME, stream=stream_final, reading_level=student_data.get("reading_level"),
+                              student_age_group=student_data.get("student_age_group"))
+        result.trace_id = run_span.trace_id or ""
+        stack = ExitStack()
+        stack.callback(self._finish_run_span, result, run_span) # 가장 마지막에 (최종 선정 스트림까지 끝난 뒤) 기록
+        stack.enter_context(reservation)
+        try:
+            with use_span(run_span):
+                if self._run_candidate_stages(result, on_stage, on_search_progress):
+                    if stream_final:
+                        result.final_events = self._iter_final_events(result, stack, on_stage, run_span)
+                        result._exit_stack, stack = stack, None # 스트림이 끝나거나 result.close()에서 닫음
+                    else:
+                        for _ in self._iter_final_events(result, None, on_stage, run_span):
+                            pass
+        except Exception as e:
+            run_span.record_error(e)
+            raise
+        finally:
+            if stack is not None:
+                stack.close()
+        return result
+
+    def _run_candidate_stages(self, result, on_stage, on_search_progress):
+        """1~4단계. 최종 선정으로 넘어갈 수 있으면 True, 아니면 result.status/advice_text를 채우고 False"""
+        student_data = result.student_data
+
+        # --- 1단계: Gemini에게 "다중 검색어" 생성 요청 ---
+        with self._stage(result, "search_queries", on_stage=on_stage) as stage:
+            self._count(stage, "gemini")
+            result.query_response = self.gemini.generate(create_prompt_for_search_query(student_data), SEARCH_QUERY_TEMPERATURE)
+            result.search_queries = extract_search_queries_from_llm(result.query_response, student_data["topic"], student_data["genres"])
+            stage.items_out = len(result.search_queries)
+        if not result.search_queries or any(marker in result.query_response for marker in GEMINI_ERROR_MARKERS):
+            result.status = STATUS_QUERY_FAILED
+            return False
+
+        # --- 2~3단계: 카카오 검색 결과를 스트림으로 받아 제외 출판사/중복 제거/학생 수준 필터 ---
+        # 모든 검색어의 첫 페이지는 동시에 받고, 필터를 통과한 후보가 목표보다 적을 때만 다음 페이지를 더 요청
+        unique_isbns_fetched = set()
+        with self._stage(result, "kakao_search", items_in=len(result.search_queries), on_stage=on_stage) as stage:
+            def on_query_done(page, done_count, total_count): # 검색어 하나가 끝날 때마다 (= 카카오 요청 1회)
+                self._count(stage, "kakao")
+                if on_search_progress:
+                    on_search_progress(page, done_count, total_count)
+
+            kakao_book_stream = self.kakao.iter_pages(result.search_queries, size=KAKAO_RESULTS_PER_PAGE, max_pages=KAKAO_MAX_PAGES_PER_QUERY,
+                                                      on_query_done=on_query_done, errors=result.search_errors)
+            result.filtered_candidates = list(islice(
+                iter_filtered_kakao_candidates(kakao_book_stream, student_data["student_age_group"], unique_isbns_fetched),
+                TARGET_FILTERED_CANDIDATES
+            ))
+            if hasattr(kakao_book_stream, "close"): # 목표를 채웠으면 다음 페이지는 요청하지 않음
+                kakao_book_stream.close()
+            stage.items_out = len(result.filtered_candidates)
+
+        # 소장 도서는 로컬 BM25 색인에서 같은 검색어로 바로 찾아 카카오 후보 뒤에 합침 (카카오에 이미 있는 책은 카카오 문서 유지)
+        # 카탈로그 고정(읽기 트랜잭션)은 도서관 조회 단계 동안만 잡아, Gemini/카카오를 기다리는 동안 WAL 체크포인트를 막지 않음
+        with self._stage(result, "library_search", items_in=len(result.search_queries), on_stage=on_stage) as stage, self.library.pinned():
+            self._count(stage, "library")
+            local_library_docs = [library_book_to_candidate_doc(book) for book in self.library.search(result.search_queries, top_k=LOCAL_LIBRARY_CANDIDATES)]
+            local_library_candidates = list(iter_filtered_kakao_candidates(local_library_docs, student_data["student_age_group"], unique_isbns_fetched))
+            result.filtered_candidates.extend(local_library_candidates)
+            result.local_library_count = len(local_library_candidates)
+            result.unique_candidate_count = len(unique_isbns_fetched)
+            stage.items_out = len(local_library_candidates)
+
+        if not unique_isbns_fetched:
+            return self._fail_with_advice(result, STATUS_NO_BOOKS, on_stage)
+        if not result.filtered_candidates:
+            return self._fail_with_advice(result, STATUS_NO_AGE_MATCHES, on_stage)
+
+        # --- 4단계: TF-IDF 군집화로 다양한 주제의 책 N권 선별 ---
+        with self._stage(result, "diversity", items_in=len(result.filtered_candidates), on_stage=on_stage) as stage:
+            # 군집화 함수는 각 대표 책을 담은 리스트의 리스트를 반환 [[rep1], [rep2], ...]
+            relevance_scores = [enriched_score_function(doc, student_data) for doc in result.filtered_candidates] if self.diversity_mode == "mmr" else None
+            clustered_representative_groups = cluster_books_for_diversity(result.filtered_candidates, n_clusters=self.n_representatives,
+                                                                          mode=self.diversity_mode, relevance_scores=relevance_scores)
+            # 각 그룹에서 대표 책(하나씩 들어있음)을 추출하여 최종 후보 목록 생성
+            result.representatives = [group[0] for group in clustered_representative_groups if group] # group이 비어있지 않은 경우에만
+            stage.items_out = len(result.representatives)
+        if not result.representatives:
+            return self._fail_with_advice(result, STATUS_NO_REPRESENTATIVES, on_stage)
+
+        # 후보 전체의 소장 여부를 한 번에 확인 (ISBN 우선, 못 찾으면 제목/첫 번째 저자로 재시도)
+        with self._stage(result, "library_match", items_in=len(result.representatives), on_stage=on_stage) as stage, self.library.pinned():
+            self._count(stage, "library")
+            library_lookup_results = self.library.find_bulk(result.representatives)
+            for doc, lib_info in zip(result.representatives, library_lookup_results):
+                doc["found_in_library"] = bool(lib_info.get("found_in_library"))
+                doc["library_match_type"] = lib_info.get("match_type", "none") # 어떻게 찾았는지 기록 (isbn, title_author, none)
+
+                # 최종적으로 도서관에서 찾았다면, 관련 정보 저장 (enriched_score_function 등에서 활용 가능)
+                if doc["found_in_library"] and lib_info:
+                    doc["library_isbn"] = lib_info.get("isbn")
+                    doc["library_title"] = lib_info.get("title")
+                    doc["call_number"] = lib_info.get("call_number")
+                    doc["library_status"] = lib_info.get("status")
+
+                # 점수 계산은 found_in_library 상태가 확정된 후에 수행
+                doc["score"] = enriched_score_function(doc, student_data)
+            _, result.library_notice = select_final_candidates_with_library_priority(result.representatives, top_n=FINAL_CANDIDATES_TOP_N)
+            stage.items_out = sum(1 for doc in result.representatives if doc["found_in_library"])
+        return True
+
+    @staticmethod
+    def _finish_run_span(result, run_span):
+        run_span.set(status=result.status, candidates=len(result.filtered_candidates), books=len(result.books))
+        run_span.finish()
+
+    def _fail_with_advice(self, result, status, on_stage):
+        result.status = status
+        result.advice_text = self.no_results_advice(result, on_stage=on_stage)
+        return False
+
+    def no_results_advice(self, result, on_stage=None):
+        """추천할 책을 찾지 못했을 때 Gemini의 다음 단계 조언 (새 검색어, 서칭 팁)"""
+        with self._stage(result, "advice", on_stage=on_stage) as stage:
+            self._count(stage, "gemini")
+            advice_text = self.gemini.generate(create_prompt_for_no_results_advice(result.student_data, result.search_queries), ADVICE_TEMPERATURE)
+        return advice_text
+
+    def _iter_final_events(self, result, stack, on_stage, run_span):
+        """
+        5~6단계: 최종 선정 응답을 받는 대로 ("intro", 텍스트) / ("book", dict) 이벤트로. 끝나면 result에 전체 결과 기록
+        최종 추천이 빈 배열이고 AI 설명도 없으면 예약이 남아 있는 동안 조언까지 받아 result.advice_text에 기록
+        """
+        try:
+            with use_span(run_span):
+                with self._stage(result, "final_selection", items_in=len(result.representatives), on_stage=on_stage) as stage:
+                    self._count(stage, "gemini")
+                    parser = BooksJsonStreamParser()
+                    final_prompt = create_prompt_for_final_selection(result.student_data, result.representatives)
+                    try:
+                        for chunk in self.gemini.generate(final_prompt, FINAL_SELECTION_TEMPERATURE, stream=True):
+                            yield from self._collect_final_events(result, parser.feed(chunk))
+                        yield from self._collect_final_events(result, parser.finish())
+                    finally:
+                        result.final_text = parser.text
+                    result.intro_text, result.after_text = parser.intro_text, parser.after_text
+                    result.found_json_block, result.json_is_array = parser.found_json_block, parser.json_is_array
+                    stage.items_out = len(result.books)
+                if result.found_json_block and not result.books and not (result.intro_text.strip() or result.after_text.strip()):
+                    result.advice_text = self.no_results_advice(result, on_stage=on_stage)
+        except Exception as e:
+            run_span.record_error(e)
+            raise
+        finally:
+            if stack is not None:
+                stack.close()
+
+    @staticmethod
+    def _collect_final_events(result, events):
+        for event, value in events:
+            if event == "book":
+                if not isinstance(value, dict): # 안전장치
+                    continue
+                result.books.append(value)
+            yield event, value
+
+    def _match_recommended_book(self, book_data):
+        gemini_isbn_str = book_data.get("isbn")
+        gemini_title = book_data.get("title", "제목 없음")
+        gemini_author_str = book_data.get("author", "저자 없음") # book_data의 author는 Gemini가 생성한 문자열
+
+        current_book_lib_info = {} # 현재 책의 최종 도서관 검색 결과를 저장할 변수
+        found_in_lib_flag = False
+        match_description = "" # 매칭 성공 시 설명
+
+        if gemini_isbn_str: # Gemini가 ISBN을 제공했다면
+            clean_gemini_isbn = "".join(filter(lambda x: x.isdigit() or x.upper() == 'X', str(gemini_isbn_str)))
+            if len(clean_gemini_isbn) in [10, 13]: # 유효한 길이의 ISBN인지 확인
+                isbn_search_res = self.library.find_by_isbn(clean_gemini_isbn)
+                if isbn_search_res.get("found_in_library"):
+                    current_book_lib_info = isbn_search_res
+                    found_in_lib_flag = True
+                    # ISBN으로 찾았을 때, 도서관 DB의 ISBN을 보여주는 것이 더 정확할 수 있습니다.
+                    match_description = f"(ISBN 일치: {current_book_lib_info.get('isbn', clean_gemini_isbn)})"
+                else: # ISBN으로 검색했지만 DB에 없거나, 검색 함수 내부 오류 발생 시
+                    current_book_lib_info = isbn_search_res # 검색 결과(오류 메시지 포함 가능) 저장
+            else: # 유효하지 않은 길이의 ISBN
+                current_book_lib_info = {"error": f"추천된 책의 ISBN '{gemini_isbn_str}' 형식이 올바르지 않아 검색할 수 없어요."}
+        else: # Gemini가 ISBN 정보를 제공하지 않은 경우
+            current_book_lib_info = {"error": "추천된 책에 ISBN 정보가 없어 ISBN으로 검색할 수 없어요."}
+
+        # ISBN으로 찾지 못했고 (found_in_lib_flag is False), 제목 정보가 있다면 제목/저자로 재시도
+        if not found_in_lib_flag and gemini_title != "제목 없음":
+            title_author_search_res = self.library.find_by_title_author(gemini_title, gemini_author_str)
+            if title_author_search_res.get("found_in_library"):
+                current_book_lib_info = title_author_search_res # 찾았으면 이 정보로 덮어쓰기
+                found_in_lib_flag = True
+                match_score = current_book_lib_info.get('match_score')
+                score_text = f", 유사도 {match_score:.0%}" if isinstance(match_score, (int, float)) else ""
+                match_description = f"(제목/저자 일치{score_text}. 소장본 ISBN: {current_book_lib_info.get('isbn', '정보없음')} - 추천된 판본과 다를 수 있음)"
+            else: # 제목/저자로도 못 찾았거나 오류 발생 시
+                # ISBN 검색 시 오류가 없었다면 (예: ISBN 자체가 없었거나, ISBN 검색은 성공했으나 못찾음)
+                # 제목/저자 검색 결과를 저장 (오류 메시지 포함 가능)
+                if not current_book_lib_info.get("error") or current_book_lib_info.get("found_in_library") == False : # ISBN검색이 '못찾음'으로 끝났을경우
+                    current_book_lib_info = title_author_search_res
+
+        shelf_neighbors = []
+        if found_in_lib_flag: # 같은 서가에서 바로 옆에 꽂힌 책 (로컬 DB만 사용, 추가 API 호출 없음)
+            shelf_info = self.library.shelf_neighbors(current_book_lib_info.get('isbn', ''), before=2, after=2)
+            shelf_neighbors = shelf_info.get("before", []) + shelf_info.get("after", [])
+        return {
+            "found_in_library": found_in_lib_flag,
+            "info": current_book_lib_info,
+            "match_description": match_description,
+            "shelf_neighbors": shelf_neighbors,
+            "error": None if found_in_lib_flag else current_book_lib_info.get("error"),
+        }
+
+    def match_recommended_book(self, book_data):
+        """
+        AI가 추천한 책 하나의 학교 도서관 소장 여부 (ISBN -> 못 찾으면 제목/저자).
+        반환: {"found_in_library", "info"(library_db 결과), "match_description", "shelf_neighbors", "error"}
+        """
+        with self.library.pinned(): # ISBN/제목 조회와 서가 이웃을 같은 카탈로그 버전으로 (책 하나 조회 동안만 고정)
+            return self._match_recommended_book(book_data)
+
+def create_default_engine(gemini_api_key=None, kakao_api_key=None, model_name=GEMINI_MODEL_NAME):
+    """실제 Gemini/카카오/도서관 클라이언트를 쓰는 엔진 (API 키를 주지 않으면 환경 변수/.env에서 읽음)"""
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+    load_dotenv()
+    genai.configure(api_key=gemini_api_key or os.getenv("GEMINI_API_KEY"))
+    gemini_model = genai.GenerativeModel(model_name)
+    return RecommendationEngine(GeminiClient(gemini_model, model_name), KakaoClient(kakao_api_key or os.getenv("KAKAO_REST_API_KEY")))
+
+def recommend(student_data, engine=None, **kwargs):
+    """student_data로 추천 한 번 실행 -> RecommendationResult (engine을 주지 않으면 create_default_engine())"""
+    return (engine or create_default_engine()).recommend(student_data, **kwargs)
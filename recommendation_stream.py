@@ -0,0 +1,172 @@
+import json
+
+# 최종 추천 Gemini 응답("도입부 BOOKS_JSON_START [ {...}, {...} ] BOOKS_JSON_END 맺음말")을 스트리밍으로 받으며 나누는 파서.
+# feed()에 텍스트 조각을 넣을 때마다 화면에 바로 쓸 수 있는 이벤트를 돌려줍니다.
+#   ("intro", 지금까지의 도입부)  : 시작 표시 앞의 텍스트 (표시 문자열이 잘려 보이지 않도록 끝 몇 글자는 잠시 보류)
+#   ("book", 책 JSON 값)         : 배열 안의 값 하나가 닫히는 즉시 (보통 dict)
+# 배열 안에서는 중괄호/대괄호 깊이와 문자열 안 여부만 추적하므로, 이미 본 글자를 다시 훑지 않습니다.
+
+JSON_START_MARKER = "BOOKS_JSON_START"
+JSON_END_MARKER = "BOOKS_JSON_END"
+CODE_FENCES = ("```json", "```")
+
+class BooksJsonStreamParser:
+    """
+    feed(조각) -> [(이벤트, 값), ...], finish()로 마무리.
+    마무리 후: text(전체 응답), intro_text, after_text, found_json_block(두 표시 모두 찾음),
+    books(배열에서 읽은 값들), json_is_array(배열 대신 다른 JSON이 왔으면 False)
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._buffer = ""
+        self._state = "intro" # intro -> array_start -> array -> after (배열이 아니면 raw)
+        self._position = 0 # _buffer에서 다음에 볼 위치
+        self._emitted_intro = ""
+        self._value_start = None # 읽고 있는 배열 값의 시작 위치
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._scalar = False
+        self._json_start = None
+        self.intro_text = ""
+        self.after_text = ""
+        self.books = []
+        self.found_json_block = False
+        self.json_is_array = True
+
+    @property
+    def text(self):
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        events = []
+        if self._state == "intro":
+            self._read_intro(events)
+        if self._state == "array_start":
+            self._read_array_start()
+        if self._state == "array":
+            self._read_array(events)
+        return events
+
+    def finish(self):
+        """응답이 끝났을 때 호출. 남은 이벤트를 반환. 배열이 닫히지 않았거나 값이 깨졌으면 json.JSONDecodeError"""
+        events = []
+        if self._state == "intro": # 시작 표시 없음 -> 호출한 쪽에서 전체 텍스트를 그대로 보여줌
+            self.intro_text = self._buffer.strip()
+            if self.intro_text != self._emitted_intro:
+                events.append(("intro", self.intro_text))
+            return events
+        if self._state == "array":
+            raise json.JSONDecodeError("책 정보 JSON 배열이 닫히지 않았어요", self._buffer, self._position)
+        end_index = self._buffer.find(JSON_END_MARKER, self._position)
+        if self._state == "after": # 배열이 닫혔으면 끝 표시가 빠져도 그대로 사용
+            self.found_json_block = True
+            if end_index != -1:
+                self.after_text = self._buffer[end_index + len(JSON_END_MARKER):].strip()
+            else:
+                self.after_text = self._buffer[self._position:].strip()
+                if self.after_text.startswith("```"): self.after_text = self.after_text[len("```"):].strip()
+            return events
+        if end_index == -1: # 배열로 시작하지 않았고 끝 표시도 없음
+            return events
+        self.found_json_block = True # 배열로 시작하지 않음 -> 기존처럼 블록 전체를 한 번에 해석
+        self.after_text = self._buffer[end_index + len(JSON_END_MARKER):].strip()
+        json_string_raw = self._strip_code_fence(self._buffer[self._json_start:end_index].strip())
+        if json_string_raw and json_string_raw != "[]":
+            parsed = json.loads(json_string_raw)
+            self.json_is_array = isinstance(parsed, list)
+            if self.json_is_array:
+                self.books = parsed
+                events.extend(("book", value) for value in parsed)
+        return events
+
+    @staticmethod
+    def _strip_code_fence(text):
+        for fence in CODE_FENCES:
+            if text.startswith(fence):
+                text = text[len(fence):].strip()
+                break
+        if text.endswith("```"):
+            text = text[:-len("```")].strip()
+        return text
+
+    def _read_intro(self, events):
+        start_index = self._buffer.find(JSON_START_MARKER, self._position)
+        if start_index == -1:
+            self._position = max(0, len(self._buffer) - len(JSON_START_MARKER) + 1) # 다음에는 걸쳐 있을 수 있는 부분부터 찾음
+            visible = self._buffer[:max(0, len(self._buffer) - len(JSON_START_MARKER) + 1)] # 표시 문자열의 앞부분일 수 있는 끝은 보류
+            intro = visible.strip()
+        else:
+            intro = self._buffer[:start_index].strip()
+            self.intro_text = intro
+            self._json_start = start_index + len(JSON_START_MARKER)
+            self._position = self._json_start
+            self._state = "array_start"
+        if intro and intro != self._emitted_intro:
+            self._emitted_intro = intro
+            events.append(("intro", intro))
+
+    def _read_array_start(self):
+        rest = self._buffer[self._position:].lstrip()
+        for fence in CODE_FENCES:
+            if rest.startswith(fence):
+                rest = rest[len(fence):].lstrip()
+                break
+            if fence.startswith(rest): # 코드 블록 표시가 아직 덜 옴
+                return
+        if not rest:
+            return
+        if rest[0] != "[":
+            self._state = "raw" # 배열이 아니면 끝 표시까지 받은 뒤 finish()에서 처리
+            return
+        self._position = len(self._buffer) - len(rest) + 1
+        self._state = "array"
+
+    def _read_array(self, events):
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer):
+            char = buffer[position]
+            if self._value_start is None: # 값 사이 (공백, 쉼표, 배열 끝)
+                if char == "]":
+                    self._state = "after"
+                    position += 1
+                    break
+                if not (char.isspace() or char == ","):
+                    self._value_start = position
+                    self._depth, self._in_string = (0, True) if char == "\"" else (1, False)
+                    self._scalar = char not in "{[\"" # 숫자/true/null 같은 값은 다음 쉼표나 배열 끝까지
+                position += 1
+                continue
+            if self._scalar:
+                if char in ",]":
+                    self._emit_value(events, position)
+                    continue # 배열 끝(])은 값 사이 상태에서 다시 처리
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == "\"":
+                    self._in_string = False
+                    if self._depth == 0: # 배열 값 자체가 문자열
+                        self._emit_value(events, position + 1)
+            elif char == "\"":
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_value(events, position + 1)
+            position += 1
+        self._position = position
+
+    def _emit_value(self, events, end):
+        value = json.loads(self._buffer[self._value_start:end])
+        self._value_start = None
+        self.books.append(value)
+        events.append(("book", value))
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# 외부 API 응답을 SQLite 파일에 저장하는 TTL + LRU 캐시.
+# 값은 JSON으로 저장하며, 여러 Streamlit 세션 스레드/워커 프로세스가 같은 파일을 공유합니다.
+#   fresh : 저장 후 ttl_seconds 이내 -> 그대로 사용
+#   stale : ttl_seconds는 지났지만 stale_ttl_seconds 이내 -> 바로 돌려주고 호출한 쪽이 뒤에서 새로 받아 갱신
+#   그 이후에는 miss로 보고 정리(evict) 대상
+# 항목 수(max_entries)나 전체 크기(max_bytes)를 넘으면 가장 오래 쓰이지 않은 항목부터 지웁니다.
+
+CACHE_FRESH, CACHE_STALE, CACHE_MISS = "fresh", "stale", "miss"
+ACCESS_TOUCH_INTERVAL_SECONDS = 60 # 적중할 때마다 쓰지 않도록, 마지막 사용 시각은 이 간격 이상일 때만 갱신
+
+def make_cache_key(*parts):
+    """JSON으로 표현 가능한 값들로 캐시 키(sha256 hex)를 만듭니다."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """SQLite TTL/LRU 캐시. get(key) -> (값, 상태), set(key, 값), stats()"""
+
+    def __init__(self, db_path, ttl_seconds, stale_ttl_seconds=0, max_entries=5000, max_bytes=50 * 1024 * 1024):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed_at ON cache_entries (accessed_at)")
+
+    def _connection(self):
+        """스레드마다 하나씩 여는 연결 (자동 커밋, WAL)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get(self, key):
+        """(값, "fresh"|"stale") 또는 (None, "miss")"""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute("SELECT value, created_at, accessed_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None, CACHE_MISS
+        value, created_at, accessed_at = row
+        age = now - created_at
+        if age > self.ttl_seconds + self.stale_ttl_seconds:
+            self._count("misses")
+            return None, CACHE_MISS
+        if now - accessed_at >= ACCESS_TOUCH_INTERVAL_SECONDS:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        if age > self.ttl_seconds:
+            self._count("stale_hits")
+            return json.loads(value), CACHE_STALE
+        self._count("hits")
+        return json.loads(value), CACHE_FRESH
+
+    def set(self, key, value):
+        """값 저장 (같은 키는 덮어씀) 후 만료/용량 초과 항목 정리"""
+        now = time.time()
+        encoded = json.dumps(value, ensure_ascii=False)
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, encoded, len(encoded.encode("utf-8")), now, now)
+        )
+        self._count("sets")
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM cache_entries WHERE created_at < ?",
+                                   (now - self.ttl_seconds - self.stale_ttl_seconds,)).rowcount
+            entry_count, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+            if entry_count > self.max_entries or total_bytes > self.max_bytes:
+                # 최근 사용 순서로 누적 크기를 세어, 남길 항목(최근 사용 max_entries개, max_bytes 이내) 밖의 키를 먼저 모은 뒤 키로 지움
+                # (마지막 사용 시각은 ACCESS_TOUCH_INTERVAL_SECONDS마다만 갱신되어 같은 값이 많으므로 시각 기준으로 지우면 한도보다 많이 지워짐)
+                rows = conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at DESC, rowid DESC").fetchall()
+                keep_bytes, evict_keys = 0, []
+                for position, (key, size) in enumerate(rows):
+                    keep_bytes += size
+                    if evict_keys or position >= self.max_entries or keep_bytes > self.max_bytes:
+                        evict_keys.append((key,))
+                if evict_keys:
+                    conn.executemany("DELETE FROM cache_entries WHERE key = ?", evict_keys)
+                    removed += len(evict_keys)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if removed:
+            self._count("evictions", removed)
+
+    def recent_values(self, limit=1000):
+        """최근에 쓰인 순서로 저장된 값들 (만료 여부와 상관없이, 통계/학습용)"""
+        for (value,) in self._connection().execute(
+                "SELECT value FROM cache_entries ORDER BY accessed_at DESC LIMIT ?", (limit,)).fetchall():
+            yield json.loads(value)
+
+    def stats(self):
+        """이 프로세스의 적중/미적중 카운터 + 현재 저장된 항목 수/크기"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["entries"], stats["bytes"] = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries").fetchone()
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else None
+        return stats
@@ -0,0 +1,73 @@
+import unicodedata
+from functools import lru_cache
+
+# library_db(도서 매칭)와 chatbot_app(출판사 비교)이 함께 쓰는 텍스트 정규화 모듈.
+# str.replace를 여러 번 반복하는 대신 미리 만들어 둔 translate 표로 한 번에 지우고,
+# 한국어 입력은 NFKC로 맞춰서 (macOS 등에서 온) 분해된 한글/전각 문자도 같은 문자열이 되도록 합니다.
+# 지울 문자는 모두 ASCII라서, 한글이 섞인 문자열은 UTF-8 바이트에서 bytes.translate로 지웁니다
+# (UTF-8 다중 바이트 문자에는 ASCII 바이트가 들어가지 않으므로 결과는 str.translate와 같고 훨씬 빠름).
+
+# 정규화 규칙이 바뀌면 올려주세요. library_db가 저장된 정규화 컬럼을 다시 계산합니다.
+NORMALIZATION_VERSION = "2"
+
+MATCHING_REMOVE_CHARS = " -:,.'\"[]()/\\&#+_~!?*"
+_MATCHING_REMOVE_TABLE = str.maketrans("", "", MATCHING_REMOVE_CHARS)
+_MATCHING_REMOVE_BYTES = MATCHING_REMOVE_CHARS.encode("ascii")
+_BULK_SEPARATOR = "\x00" # 일괄 정규화 시 문자열 구분자 (NFKC/소문자 변환/삭제 어디에도 영향받지 않는 문자)
+
+PUBLISHER_REMOVE_WORDS = ("(주)", "주식회사", "㈜")
+_PUBLISHER_REMOVE_TABLE = str.maketrans("", "", " -(),")
+# 정규화된 이름에 키워드가 들어 있으면 대표 이름으로 통일 (위에서부터 먼저 맞는 규칙 적용)
+PUBLISHER_CANONICAL_NAMES = (
+    (("알에이치코리아", "랜덤하우스코리아"), "알에이치코리아"),
+    (("문학과지성",), "문학과지성사"),
+    (("창작과비평",), "창작과비평사"),
+    (("김영사",), "김영사"),
+    (("위즈덤하우스",), "위즈덤하우스"),
+)
+PUBLISHER_CACHE_SIZE = 4096
+
+def _nfkc_lower(text):
+    if text.isascii(): # 대부분의 영문/숫자 문자열은 유니코드 정규화가 필요 없음
+        return text.lower()
+    return unicodedata.normalize("NFKC", text).lower()
+
+def _remove_matching_chars(text):
+    if text.isascii():
+        return text.translate(_MATCHING_REMOVE_TABLE)
+    return text.encode("utf-8").translate(None, _MATCHING_REMOVE_BYTES).decode("utf-8")
+
+def normalize_text_for_matching(text_str):
+    """검색 및 비교를 위해 텍스트를 정규화합니다 (NFKC, 소문자, 공백/일부 특수문자 제거)."""
+    if not isinstance(text_str, str):
+        return ""
+    return _remove_matching_chars(_nfkc_lower(text_str))
+
+def normalize_texts_for_matching(texts):
+    """normalize_text_for_matching의 일괄 버전. 목록 전체를 이어 붙여 NFKC/소문자/삭제를 한 번씩만 수행"""
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    if not texts:
+        return []
+    if any(_BULK_SEPARATOR in text for text in texts):
+        return [normalize_text_for_matching(text) for text in texts]
+    return _remove_matching_chars(_nfkc_lower(_BULK_SEPARATOR.join(texts))).split(_BULK_SEPARATOR)
+
+@lru_cache(maxsize=PUBLISHER_CACHE_SIZE)
+def _normalize_publisher_cached(name):
+    name_processed = _nfkc_lower(name)
+    for word in PUBLISHER_REMOVE_WORDS:
+        name_processed = name_processed.replace(word, "")
+    name_processed = name_processed.translate(_PUBLISHER_REMOVE_TABLE)
+    for keywords, canonical_name in PUBLISHER_CANONICAL_NAMES:
+        if any(keyword in name_processed for keyword in keywords):
+            return canonical_name
+    return name_processed
+
+def normalize_publisher_name(name):
+    """출판사명 정규화 ((주)/주식회사 제거, 공백/기호 제거, 대표 이름 통일). 같은 출판사명은 LRU 캐시에서 바로 반환"""
+    if not isinstance(name, str): name = ""
+    return _normalize_publisher_cached(name)
+
+def normalize_publisher_names(names):
+    """normalize_publisher_name의 일괄 버전"""
+    return [normalize_publisher_name(name) for name in names]
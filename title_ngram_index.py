@@ -0,0 +1,127 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+# 정규화된 제목/저자에 대한 문자 n-gram 역색인.
+# 한국어는 띄어쓰기가 제각각이라 단어 단위보다 음절 bigram이 잘 맞고,
+# 오타/받침 차이까지 잡고 싶으면 자모로 분해한 뒤 trigram을 씁니다.
+# 검색 비용은 질의 n-gram의 색인 목록 길이에 비례하며, 전체 도서 수를 훑지 않습니다.
+# 포함 검색 후보(containing)는 가장 드문 n-gram의 색인 목록에서 시작해 나머지 목록과 교집합만 구합니다.
+
+TITLE_WEIGHT = 0.8 # 저자 검색어가 있을 때 제목/저자 점수 비중
+AUTHOR_WEIGHT = 0.2
+
+HANGUL_SYLLABLE_START, HANGUL_SYLLABLE_END = 0xAC00, 0xD7A3
+CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+JUNGSEONG = "ㅏㅐㅑㅒㅓㅔㅕㅖㅗㅘㅙㅚㅛㅜㅝㅞㅟㅠㅡㅢㅣ"
+JONGSEONG = ("", "ㄱ", "ㄲ", "ㄳ", "ㄴ", "ㄵ", "ㄶ", "ㄷ", "ㄹ", "ㄺ", "ㄻ", "ㄼ", "ㄽ", "ㄾ", "ㄿ", "ㅀ",
+             "ㅁ", "ㅂ", "ㅄ", "ㅅ", "ㅆ", "ㅇ", "ㅈ", "ㅊ", "ㅋ", "ㅌ", "ㅍ", "ㅎ")
+
+def hangul_to_jamo(text):
+    """한글 음절을 초성/중성/종성 호환 자모로 분해 (그 외 문자는 그대로)"""
+    decomposed = []
+    for char in text:
+        code = ord(char)
+        if HANGUL_SYLLABLE_START <= code <= HANGUL_SYLLABLE_END:
+            offset = code - HANGUL_SYLLABLE_START
+            decomposed.append(CHOSEONG[offset // 588] + JUNGSEONG[(offset % 588) // 28] + JONGSEONG[offset % 28])
+        else:
+            decomposed.append(char)
+    return "".join(decomposed)
+
+def text_ngrams(text, use_jamo=False):
+    """정규화된 문자열의 n-gram 집합 (음절 bigram, use_jamo면 자모 trigram). 짧은 문자열은 자체를 하나의 gram으로"""
+    if not text:
+        return set()
+    if use_jamo:
+        text, n = hangul_to_jamo(text), 3
+    else:
+        n = 2
+    if len(text) < n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def dice_similarity(grams_a, grams_b):
+    """두 n-gram 집합의 Dice 계수 (0~1)"""
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+def title_author_similarity(title_query_norm, author_query_norm, title_norm, author_norm, use_jamo=False):
+    """정규화된 검색어와 도서의 제목/저자 유사도 (저자 검색어가 없으면 제목 점수만)"""
+    title_score = dice_similarity(text_ngrams(title_query_norm, use_jamo), text_ngrams(title_norm, use_jamo))
+    if not author_query_norm:
+        return title_score
+    author_score = dice_similarity(text_ngrams(author_query_norm, use_jamo), text_ngrams(author_norm, use_jamo))
+    return TITLE_WEIGHT * title_score + AUTHOR_WEIGHT * author_score
+
+def _sorted_contains(sorted_ids, value):
+    position = bisect_left(sorted_ids, value)
+    return position < len(sorted_ids) and sorted_ids[position] == value
+
+class TitleNgramIndex:
+    """
+    (payload, title_norm, author_norm) 목록으로 만든 n-gram 역색인. search()는 유사도 상위 top_k를 반환
+    payload로는 보통 books의 rowid를 넣고, 도서 행은 필요할 때 DB에서 읽습니다. (프로세스마다 행 전체를 들고 있지 않음)
+    제목/저자 모두 gram -> 문서 번호 배열(array)과 문서별 gram 수만 저장합니다.
+    """
+
+    def __init__(self, entries, use_jamo=False):
+        self.use_jamo = use_jamo
+        self._payloads = []
+        self._title_gram_counts = array("I")
+        self._author_gram_counts = array("I")
+        title_postings, author_postings = defaultdict(list), defaultdict(list)
+        for doc_id, (payload, title_norm, author_norm) in enumerate(entries):
+            self._payloads.append(payload)
+            for grams, postings, counts in ((text_ngrams(title_norm or "", use_jamo), title_postings, self._title_gram_counts),
+                                            (text_ngrams(author_norm or "", use_jamo), author_postings, self._author_gram_counts)):
+                counts.append(len(grams))
+                for gram in grams:
+                    postings[gram].append(doc_id)
+        self._postings = {gram: array("I", doc_ids) for gram, doc_ids in title_postings.items()}
+        self._author_postings = {gram: array("I", doc_ids) for gram, doc_ids in author_postings.items()}
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def containing(self, title_query_norm):
+        """
+        질의의 n-gram을 모두 가진 제목의 payload 목록 (색인 순서). '질의 ⊂ 제목'인 제목은 모두 들어 있으므로
+        포함 관계 확인 전 후보로 씁니다. (질의가 n글자 이상일 때만 의미가 있음)
+        가장 짧은 색인 목록에서 시작해 나머지 목록에 있는지 이진 탐색으로 걸러 냄 (목록은 문서 번호 오름차순)
+        """
+        query_grams = text_ngrams(title_query_norm, self.use_jamo)
+        if not query_grams:
+            return []
+        postings = sorted((self._postings.get(gram, ()) for gram in query_grams), key=len)
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates = [doc_id for doc_id in candidates if _sorted_contains(posting, doc_id)]
+        return [self._payloads[doc_id] for doc_id in candidates]
+
+    def search(self, title_query_norm, author_query_norm="", top_k=5, min_score=0.0):
+        """유사도 내림차순 [(점수, payload), ...] (같은 점수면 먼저 색인된 항목 우선)"""
+        query_grams = text_ngrams(title_query_norm, self.use_jamo)
+        if not query_grams:
+            return []
+        overlaps = Counter()
+        for gram in query_grams:
+            overlaps.update(self._postings.get(gram, ()))
+
+        author_grams = text_ngrams(author_query_norm, self.use_jamo) if author_query_norm else None
+        author_overlaps = Counter()
+        for gram in author_grams or ():
+            author_overlaps.update(self._author_postings.get(gram, ()))
+        scored = []
+        for doc_id, overlap in overlaps.items():
+            score = 2 * overlap / (len(query_grams) + self._title_gram_counts[doc_id])
+            if author_grams is not None:
+                author_score = 2 * author_overlaps[doc_id] / (len(author_grams) + self._author_gram_counts[doc_id]) if author_overlaps[doc_id] else 0.0
+                score = TITLE_WEIGHT * score + AUTHOR_WEIGHT * author_score
+            if score >= min_score:
+                scored.append((score, -doc_id))
+        return [(score, self._payloads[-neg_doc_id]) for score, neg_doc_id in heapq.nlargest(top_k, scored)]
@@ -0,0 +1,223 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# 외부 호출(Gemini, 카카오, 도서관 DB 조회, TF-IDF 다양성 선택)의 걸린 시간을 span으로 남기는 가벼운 추적 모듈.
+# span 하나 = 이름, 걸린 시간(ms), 속성(요청/응답 크기, 캐시 적중 여부 등), 오류 종류(예외 클래스 이름)이며
+# 끝날 때마다 JSON 한 줄로 traces.jsonl에 덧붙입니다 (크기가 TRACE_MAX_MB를 넘으면 .1, .2 ...로 넘기는 순환 파일).
+# 부모 span은 contextvars로 이어지므로 추천 한 번(RUN_SPAN_NAME)의 모든 span이 같은 trace_id를 가집니다.
+# (스레드 풀로 넘기는 작업은 contextvars.copy_context().run으로 감싸야 부모가 이어짐)
+# 오류를 예외 대신 안내 문구로 돌려주는 함수는 except 블록에서 current_span().record_error(e)로 오류 종류를 남깁니다.
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") != "0"
+TRACE_PATH = os.getenv("TRACE_PATH", "traces.jsonl") # DB_PATH처럼 실행 폴더 기준
+TRACE_MAX_MB = float(os.getenv("TRACE_MAX_MB", 5))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", 3))
+TRACE_SUMMARY_RUNS = 50 # 관리자 패널 기본값: 최근 몇 번의 추천으로 p50/p95를 계산할지
+TRACE_SUMMARY_READ_BYTES = 2 * 1024 * 1024 # 요약할 때 파일마다 끝에서부터 읽을 최대 크기
+RUN_SPAN_NAME = "recommend" # 추천 한 번 전체를 감싸는 최상위 span 이름
+CACHE_HIT_VALUES = ("hit", "stale") # cache 속성이 이 값이면 캐시 적중으로 셈
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """진행 중인 span. set()으로 속성을 더하고 record_error()로 오류 종류를 남긴 뒤 finish()하면 파일에 기록"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._finished = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 3)
+
+    def record_error(self, error):
+        """예외 객체(클래스 이름을 기록) 또는 오류 종류 문자열"""
+        self.error = error if isinstance(error, str) else type(error).__name__
+        return self
+
+    def finish(self):
+        if self._finished: # 여러 경로에서 닫아도 한 번만 기록
+            return
+        self._finished = True
+        _write_record({
+            "ts": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "duration_ms": self.elapsed_ms(),
+            "status": "error" if self.error else "ok", "error": self.error, "attrs": self.attributes,
+        })
+
+class _NoopSpan:
+    """추적을 끄거나 감싸는 span이 없을 때 쓰는 빈 span (호출하는 쪽에서 None 검사가 필요 없도록)"""
+    trace_id = span_id = parent_id = None
+
+    def set(self, **attributes):
+        return self
+
+    def elapsed_ms(self):
+        return 0.0
+
+    def record_error(self, error):
+        return self
+
+    def finish(self):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def current_span():
+    """지금 감싸고 있는 span (없으면 NOOP_SPAN)"""
+    return _current_span.get() or NOOP_SPAN
+
+def start_span(name, **attributes):
+    """현재 span을 부모로 하는 span을 시작만 합니다 (현재 span으로 바꾸지 않음, 직접 finish 해야 함)"""
+    if not TRACE_ENABLED:
+        return NOOP_SPAN
+    return Span(name, _current_span.get(), attributes)
+
+@contextmanager
+def use_span(trace_span):
+    """이미 시작한 span을 블록 안에서 현재 span으로 (제너레이터 안에서도 쓸 수 있도록 reset 대신 이전 값을 다시 설정)"""
+    if trace_span is NOOP_SPAN:
+        yield trace_span
+        return
+    previous = _current_span.get()
+    _current_span.set(trace_span)
+    try:
+        yield trace_span
+    finally:
+        _current_span.set(previous)
+
+@contextmanager
+def span(name, **attributes):
+    """with span("이름", 속성=값) as s: ... 블록의 걸린 시간을 기록 (예외가 나면 예외 클래스 이름을 남기고 그대로 전달)"""
+    trace_span = start_span(name, **attributes)
+    try:
+        with use_span(trace_span):
+            yield trace_span
+    except GeneratorExit: # 제너레이터를 끝까지 소비하지 않고 닫은 경우는 오류가 아님
+        trace_span.set(closed_early=True)
+        raise
+    except BaseException as e:
+        trace_span.record_error(e)
+        raise
+    finally:
+        trace_span.finish()
+
+def traced(name, result_attributes=None):
+    """함수 호출 전체를 span으로 감싸는 데코레이터. result_attributes(반환값) -> dict 로 결과 크기 등을 기록"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACE_ENABLED:
+                return function(*args, **kwargs)
+            with span(name) as trace_span:
+                result = function(*args, **kwargs)
+                if result_attributes:
+                    try:
+                        trace_span.set(**result_attributes(result))
+                    except Exception: # 기록용 계산이 본 기능을 막지 않도록
+                        pass
+                return result
+        return wrapper
+    return decorator
+
+# --- 기록 (순환 JSONL 파일) ---
+_trace_logger = None
+_trace_logger_lock = threading.Lock()
+
+def get_trace_logger():
+    """프로세스 공용 JSONL 기록기 (logging의 RotatingFileHandler가 크기 초과 시 파일을 넘기고 스레드 간 쓰기를 직렬화)"""
+    global _trace_logger
+    if _trace_logger is None:
+        with _trace_logger_lock:
+            if _trace_logger is None:
+                logger = logging.getLogger("dodo.trace")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False # 앱 로그/콘솔로 새지 않도록
+                handler = RotatingFileHandler(TRACE_PATH, maxBytes=int(TRACE_MAX_MB * 1024 * 1024),
+                                              backupCount=TRACE_BACKUP_COUNT, encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                _trace_logger = logger
+    return _trace_logger
+
+def _write_record(record):
+    try:
+        get_trace_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+    except Exception as e: # 추적 기록 실패로 추천이 막히지 않도록
+        print(f"🚨 추적 기록 오류: {e}")
+
+# --- 요약 (관리자 패널) ---
+def _read_tail_records(path, max_bytes):
+    try:
+        with open(path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            file.seek(max(0, size - max_bytes))
+            data = file.read()
+    except OSError:
+        return []
+    lines = data.split(b"\n")
+    if size > max_bytes:
+        lines = lines[1:] # 중간에서 잘린 첫 줄은 버림
+    records = []
+    for line in lines:
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def load_recent_runs(last_runs=TRACE_SUMMARY_RUNS, run_name=RUN_SPAN_NAME):
+    """최근 last_runs번의 추천(run_name span이 끝난 순서)에 속한 span 기록 목록. 현재 파일에서 모자라면 넘긴 파일(.1, .2 ...)도 읽음"""
+    records = []
+    paths = [TRACE_PATH] + [f"{TRACE_PATH}.{i}" for i in range(1, TRACE_BACKUP_COUNT + 1)]
+    for path in paths:
+        records = _read_tail_records(path, TRACE_SUMMARY_READ_BYTES) + records
+        if sum(1 for record in records if record.get("name") == run_name) >= last_runs:
+            break
+    run_trace_ids = [record.get("trace_id") for record in records if record.get("name") == run_name][-last_runs:]
+    wanted = set(run_trace_ids)
+    return [record for record in records if record.get("trace_id") in wanted]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def summarize_recent_runs(last_runs=TRACE_SUMMARY_RUNS, run_name=RUN_SPAN_NAME):
+    """
+    최근 last_runs번의 추천에서 span 이름별 통계 목록 (처음 나온 순서):
+    [{"name", "count", "p50_ms", "p95_ms", "errors", "cache_hits"}, ...]
+    """
+    records = load_recent_runs(last_runs, run_name)
+    durations, errors, cache_hits = {}, {}, {}
+    for record in records:
+        name = record.get("name")
+        durations.setdefault(name, []).append(record.get("duration_ms") or 0.0)
+        errors[name] = errors.get(name, 0) + (record.get("status") == "error")
+        cache_hits[name] = cache_hits.get(name, 0) + ((record.get("attrs") or {}).get("cache") in CACHE_HIT_VALUES)
+    return [
+        {"name": name, "count": len(values), "p50_ms": round(percentile(values, 0.5), 1), "p95_ms": round(percentile(values, 0.95), 1),
+         "errors": errors[name], "cache_hits": cache_hits[name]}
+        for name, values in durations.items()
+    ]